@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from typing import Optional, NamedTuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import APIKeyRevocation
+import os
+import threading
+import time
+
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60"))
+API_KEY_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_NEGATIVE_CACHE_TTL_SECONDS", "5"))
+# How stale a worker's view of keys revoked by other workers may get
+API_KEY_REVOCATION_REFRESH_SECONDS = float(os.getenv("API_KEY_REVOCATION_REFRESH_SECONDS", "5"))
+
+
+class CachedAPIKey(NamedTuple):
+    # Detached snapshot of a verified APIKey row; safe to share across sessions and threads
+    id: str
+    prefix: str
+    name: str
+    user_id: Optional[str]
+    organization_id: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_record(cls, record) -> "CachedAPIKey":
+        return cls(
+            id=record.id,
+            prefix=record.prefix,
+            name=record.name,
+            user_id=record.user_id,
+            organization_id=record.organization_id,
+            is_active=record.is_active,
+        )
+
+
+# Sentinel stored for hashes that are known not to match an active key
+_MISSING = object()
+
+
+class APIKeyCache:
+    """Bounded LRU cache of verified API keys keyed by key hash, with per-entry TTL.
+
+    Unknown hashes are cached for a much shorter time so a freshly created key
+    becomes usable quickly while repeated bad keys still skip the database.
+    Revocations live in the api_key_revocations table: the revoking worker
+    drops its entry immediately, and every other worker re-reads recent
+    revocations at most every refresh interval and checks hits against them.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float, refresh_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_interval = refresh_interval
+        self._entries = OrderedDict()
+        # key hash -> revoked_at (epoch seconds)
+        self._revoked = {}
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def refresh_revocations(self, db: AsyncSession):
+        # One small query per interval per worker; only revocations a cache entry can outlive are read
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        # Claimed before awaiting so concurrent requests don't all run the query
+        self._next_refresh = now + self.refresh_interval
+        horizon = time.time() - self.ttl
+        rows = await db.execute(
+            select(APIKeyRevocation.key_hash, APIKeyRevocation.revoked_at).where(APIKeyRevocation.revoked_at > horizon)
+        )
+        with self._lock:
+            self._revoked = {key_hash: revoked_at for key_hash, revoked_at in self._revoked.items() if revoked_at > horizon}
+        for key_hash, revoked_at in rows:
+            self.revoke(key_hash, revoked_at)
+
+    def get(self, key_hash: str):
+        """Return a CachedAPIKey, ``False`` for a cached negative, or ``None`` on miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= now or (value is not _MISSING and key_hash in self._revoked):
+                del self._entries[key_hash]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key_hash)
+            if value is _MISSING:
+                self.negative_hits += 1
+                return False
+            self.hits += 1
+            return value
+
+    def put(self, key_hash: str, value: CachedAPIKey):
+        self._store(key_hash, value, self.ttl)
+
+    def put_missing(self, key_hash: str):
+        self._store(key_hash, _MISSING, self.negative_ttl)
+
+    def _store(self, key_hash: str, value, ttl: float):
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key_hash: str):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def revoke(self, key_hash: str, revoked_at: float):
+        with self._lock:
+            self._revoked[key_hash] = max(revoked_at, self._revoked.get(key_hash, 0.0))
+            self._entries.pop(key_hash, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "revoked_keys": len(self._revoked),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+api_key_cache = APIKeyCache(
+    max_size=API_KEY_CACHE_SIZE,
+    ttl=API_KEY_CACHE_TTL_SECONDS,
+    negative_ttl=API_KEY_NEGATIVE_CACHE_TTL_SECONDS,
+    refresh_interval=API_KEY_REVOCATION_REFRESH_SECONDS,
+)
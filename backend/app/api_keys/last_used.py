@@ -0,0 +1,101 @@
+from datetime import datetime
+from sqlalchemy import bindparam, update
+from ..database import SessionLocal
+from .models import APIKey
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+API_KEY_LAST_USED_FLUSH_SECONDS = float(os.getenv("API_KEY_LAST_USED_FLUSH_SECONDS", "5"))
+API_KEY_LAST_USED_MAX_PENDING = int(os.getenv("API_KEY_LAST_USED_MAX_PENDING", "5000"))
+
+
+class LastUsedRecorder:
+    """Write-behind buffer for ``APIKey.last_used_at``.
+
+    Requests only record the timestamp in memory; a background thread writes
+    all pending keys as one bulk UPDATE every ``interval`` seconds, so a
+    key's ``last_used_at`` is at most ``interval`` seconds stale. A flush is
+    also triggered early when ``max_pending`` distinct keys are buffered.
+    """
+
+    def __init__(self, interval: float, max_pending: int, session_factory=SessionLocal):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, key_id: str, used_at: datetime = None):
+        with self._lock:
+            self._pending[key_id] = used_at or datetime.utcnow()
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        db = self.session_factory()
+        try:
+            # Core executemany rather than ORM bulk update: keys revoked since they were
+            # recorded simply match no row instead of failing the whole batch
+            db.execute(
+                update(APIKey.__table__)
+                .where(APIKey.__table__.c.id == bindparam("key_id"))
+                .values(last_used_at=bindparam("used_at")),
+                [{"key_id": key_id, "used_at": used_at} for key_id, used_at in batch.items()],
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to flush API key last_used_at: {e}")
+            # Put the batch back unless newer timestamps arrived meanwhile
+            with self._lock:
+                for key_id, used_at in batch.items():
+                    self._pending.setdefault(key_id, used_at)
+            return 0
+        finally:
+            db.close()
+
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="api-key-last-used", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        # Final flush so nothing recorded before shutdown is lost
+        self.flush()
+
+
+last_used_recorder = LastUsedRecorder(
+    interval=API_KEY_LAST_USED_FLUSH_SECONDS,
+    max_pending=API_KEY_LAST_USED_MAX_PENDING,
+)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Float, Index, Integer
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
+from datetime import datetime
 import uuid
 import secrets
 
@@ -21,8 +22,24 @@ class APIKey(Base):
     user_id = Column(String, ForeignKey("users.id"))
     organization_id = Column(String, ForeignKey("organizations.id"))
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set client-side so values round-trip exactly through pagination cursors
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     last_used_at = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User", back_populates="api_keys")
     organization = relationship("Organization", back_populates="api_keys")
+
+    __table_args__ = (
+        # Keyset pagination of a user's keys, newest first
+        Index("ix_api_keys_user_created", "user_id", "created_at", "id"),
+    )
+
+class APIKeyRevocation(Base):
+    # Keys revoked by any worker; the others drop their cached copies on the next refresh.
+    # Rows only matter for as long as a cache entry can live.
+    __tablename__ = "api_key_revocations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_hash = Column(String, nullable=False)
+    # Epoch seconds
+    revoked_at = Column(Float, nullable=False, index=True)
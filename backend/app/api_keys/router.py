@@ -1,32 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ..database import get_async_db, get_async_read_db
 from ..auth.dependencies import get_current_user
-from ..models import User
-from .models import APIKey
+from ..auth.principal import Principal
+from ..pagination import keyset_page, PAGE_SIZE_MAX
+from .models import APIKey, APIKeyRevocation
+from .cache import api_key_cache
 from pydantic import BaseModel
 from datetime import datetime
 import secrets
 import hashlib
+import time
 
 router = APIRouter()
 
+class APIKeyCreate(BaseModel):
+    name: str
+
+class APIKeyResponse(BaseModel):
+    id: str
+    prefix: str
+    name: str
+    created_at: datetime
+    is_active: bool
+    last_used_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class APIKeyCreatedResponse(APIKeyResponse):
+    key: str # Only returned once
+
 def hash_key(key: str) -> str:
     return hashlib.sha256(key.encode()).hexdigest()
 
 @router.get("/", response_model=List[APIKeyResponse])
-def list_api_keys(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def list_api_keys(
+    response: Response,
+    is_active: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    # Newest first; pass limit to paginate, then the previous page's X-Next-Cursor header to continue.
+    # Without either, every row is returned.
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    return db.query(APIKey).filter(APIKey.user_id == current_user.id).all()
+    query = select(APIKey).where(APIKey.user_id == current_user.id)
+    if is_active is not None:
+        query = query.where(APIKey.is_active == is_active)
+    if start is not None:
+        query = query.where(APIKey.created_at >= start)
+    if end is not None:
+        query = query.where(APIKey.created_at < end)
+    return await keyset_page(db, query, APIKey, cursor, limit, response)
 
 @router.post("/", response_model=APIKeyCreatedResponse)
-def create_api_key(
+async def create_api_key(
     key_data: APIKeyCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     raw_key = f"pk_{secrets.token_urlsafe(32)}"
     hashed_key = hash_key(raw_key)
@@ -40,8 +76,8 @@ def create_api_key(
         organization_id=current_user.organization_id
     )
     db.add(new_key)
-    db.commit()
-    db.refresh(new_key)
+    await db.commit()
+    await db.refresh(new_key)
     
     return {
         "id": new_key.id,
@@ -53,15 +89,22 @@ def create_api_key(
     }
 
 @router.delete("/{key_id}")
-def revoke_api_key(
+async def revoke_api_key(
     key_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    key = db.query(APIKey).filter(APIKey.id == key_id, APIKey.user_id == current_user.id).first()
+    key = await db.scalar(select(APIKey).where(APIKey.id == key_id, APIKey.user_id == current_user.id))
     if not key:
         raise HTTPException(status_code=404, detail="API Key not found")
     
-    db.delete(key)
-    db.commit()
+    key_hash = key.key_hash
+    revoked_at = time.time()
+    await db.delete(key)
+    # Other workers drop their cached copy on their next revocation refresh
+    db.add(APIKeyRevocation(key_hash=key_hash, revoked_at=revoked_at))
+    # Older rows can no longer match a cached key
+    await db.execute(delete(APIKeyRevocation).where(APIKeyRevocation.revoked_at <= revoked_at - api_key_cache.ttl))
+    await db.commit()
+    api_key_cache.revoke(key_hash, revoked_at)
     return {"message": "API Key revoked"}
@@ -1,10 +1,14 @@
 from fastapi import Security, HTTPException, status, Depends
 from fastapi.security.api_key import APIKeyHeader
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from .models import APIKey
-from datetime import datetime
+from .cache import api_key_cache, CachedAPIKey
+from .last_used import last_used_recorder
+from ..metrics.registry import dependency_latency
 import hashlib
+import time
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -13,24 +17,46 @@ def hash_key(key: str) -> str:
 
 async def get_api_key(
     api_key_header: str = Security(api_key_header),
-    db: Session = Depends(get_db)
+    # Primary, not replica: a key created moments ago must resolve, and misses are negatively cached
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not api_key_header:
         return None
+    start = time.perf_counter()
+    try:
+        return await resolve_api_key(api_key_header, db)
+    finally:
+        dependency_latency.observe(("get_api_key",), time.perf_counter() - start)
 
-    hashed_input = hash_key(api_key_header)
-    
-    # Find key by hash
-    key_record = db.query(APIKey).filter(APIKey.key_hash == hashed_input, APIKey.is_active == True).first()
-    
-    if not key_record:
+async def resolve_api_key(raw_key: str, db: AsyncSession) -> CachedAPIKey:
+    # Shared by the header dependency and transports that authenticate outside of it (WebSockets)
+    hashed_input = hash_key(raw_key)
+
+    await api_key_cache.refresh_revocations(db)
+    cached = api_key_cache.get(hashed_input)
+    if cached is False:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate API Key"
         )
-    
-    # Update last used timestamp
-    key_record.last_used_at = datetime.utcnow()
-    db.commit()
-    
-    return key_record
+
+    if cached is None:
+        # Find key by hash
+        key_record = await db.scalar(
+            select(APIKey).where(APIKey.key_hash == hashed_input, APIKey.is_active == True)
+        )
+
+        if not key_record:
+            api_key_cache.put_missing(hashed_input)
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate API Key"
+            )
+
+        cached = CachedAPIKey.from_record(key_record)
+        api_key_cache.put(hashed_input, cached)
+
+    # Update last used timestamp; written in batches by the recorder
+    last_used_recorder.record(cached.id)
+
+    return cached
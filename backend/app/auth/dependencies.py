@@ -1,19 +1,67 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Optional
 from jose import jwt, JWTError
 from .jwt import SECRET_KEY, ALGORITHM
-from ..database import get_db
+from .principal import Principal, principal_cache
+from ..database import get_async_read_db
 from ..models import User
+from ..api_keys.security import get_api_key, resolve_api_key
+from ..api_keys.cache import CachedAPIKey
+from ..metrics.registry import dependency_latency
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)) -> Principal:
+    start = time.perf_counter()
+    try:
+        return await resolve_token(token, db)
+    finally:
+        dependency_latency.observe(("get_current_user",), time.perf_counter() - start)
+
+async def get_principal(
+    api_key: CachedAPIKey = Security(get_api_key),
+    token: str = Depends(optional_oauth2_scheme),
+    # Only legacy tokens without principal claims read the database, and only the users table
+    db: AsyncSession = Depends(get_async_read_db)
+) -> Principal:
+    # Module endpoints accept either X-API-Key or a Bearer JWT
+    if api_key is not None:
+        return Principal.from_api_key(api_key)
+    start = time.perf_counter()
+    try:
+        return await resolve_credentials(None, token, db)
+    finally:
+        dependency_latency.observe(("get_principal",), time.perf_counter() - start)
+
+async def resolve_credentials(api_key: Optional[str], token: Optional[str], db: AsyncSession) -> Principal:
+    # Same rules as get_principal for callers holding raw credentials, e.g. a WebSocket handshake
+    if api_key:
+        return Principal.from_api_key(await resolve_api_key(api_key, db))
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await resolve_token(token, db)
+
+async def resolve_token(token: str, db: AsyncSession) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    await principal_cache.refresh_revocations(db)
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -21,7 +69,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
+
+    issued_at = payload.get("iat", 0)
+    if "uid" in payload:
+        # Token carries the full principal; no database round-trip needed
+        principal = Principal.from_claims(payload)
+    else:
+        # Tokens minted before principal claims existed still resolve through the database
+        user = await db.scalar(
+            select(User).options(selectinload(User.organization)).where(User.email == email)
+        )
+        if user is None or not user.is_active:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+
+    if principal_cache.is_revoked(principal.id, issued_at):
         raise credentials_exception
-    return user
+
+    principal_cache.put(token, principal, issued_at, payload["exp"])
+    return principal
@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from typing import Optional, NamedTuple, Tuple
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..models import User, UserRevocation
+from .jwt import ACCESS_TOKEN_EXPIRE_MINUTES
+import os
+import threading
+import time
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Deactivations must be remembered for as long as a token minted before them can live
+PRINCIPAL_REVOCATION_TTL_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+# How stale a worker's view of revocations made by other workers may get
+PRINCIPAL_REVOCATION_REFRESH_SECONDS = float(os.getenv("PRINCIPAL_REVOCATION_REFRESH_SECONDS", "5"))
+
+
+class Principal(NamedTuple):
+    # Caller identity resolved from token claims, without a database round-trip
+    id: str
+    email: str
+    organization_id: Optional[str]
+    role: str
+    modules: Tuple[str, ...] = ()
+    # Set when the caller authenticated with X-API-Key instead of a JWT
+    api_key_id: Optional[str] = None
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "Principal":
+        return cls(
+            id=claims["uid"],
+            email=claims["sub"],
+            organization_id=claims.get("org"),
+            role=claims.get("role", ""),
+            modules=tuple(claims.get("modules") or ()),
+        )
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        organization = user.organization
+        return cls(
+            id=user.id,
+            email=user.email,
+            organization_id=user.organization_id,
+            role=user.role,
+            modules=tuple(organization.modules or ()) if organization else (),
+        )
+
+    @classmethod
+    def from_api_key(cls, api_key) -> "Principal":
+        return cls(
+            id=api_key.user_id,
+            email="",
+            organization_id=api_key.organization_id,
+            role="api_key",
+            api_key_id=api_key.id,
+        )
+
+    def to_claims(self) -> dict:
+        return {
+            "sub": self.email,
+            "uid": self.id,
+            "org": self.organization_id,
+            "role": self.role,
+            "modules": list(self.modules),
+        }
+
+
+class PrincipalCache:
+    """Bounded LRU of decoded token -> Principal, expiring with the token itself.
+
+    Revocations live in the user_revocations table so every worker honours
+    them. Each worker re-reads the recent ones at most every refresh interval
+    and checks tokens against that in-memory copy, even on a cache hit.
+    Revocations committed by this worker apply immediately.
+    """
+
+    def __init__(self, max_size: int, revocation_ttl: float, refresh_interval: float):
+        self.max_size = max_size
+        self.revocation_ttl = revocation_ttl
+        self.refresh_interval = refresh_interval
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def refresh_revocations(self, db: AsyncSession):
+        # One small query per interval per worker; the table only holds recent revocations
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        # Claimed before awaiting so concurrent requests don't all run the query
+        self._next_refresh = now + self.refresh_interval
+        rows = await db.execute(
+            select(UserRevocation.user_id, UserRevocation.revoked_at)
+            .where(UserRevocation.revoked_at > time.time() - self.revocation_ttl)
+        )
+        for user_id, revoked_at in rows:
+            self.revoke_user(user_id, revoked_at)
+
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, issued_at, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+        if self.is_revoked(principal.id, issued_at):
+            return None
+        return principal
+
+    def put(self, token: str, principal: Principal, issued_at: float, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (principal, issued_at, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def is_revoked(self, user_id: str, issued_at: float) -> bool:
+        with self._lock:
+            revoked_at = self._revoked.get(user_id)
+            if revoked_at is None:
+                return False
+            if revoked_at + self.revocation_ttl <= time.time():
+                del self._revoked[user_id]
+                return False
+        # Tokens minted after the revocation (i.e. after reactivation) stay valid
+        return issued_at <= revoked_at
+
+    def revoke_user(self, user_id: str, revoked_at: float):
+        with self._lock:
+            if revoked_at <= self._revoked.get(user_id, 0.0):
+                return
+            self._revoked[user_id] = revoked_at
+            for token in [t for t, entry in self._entries.items() if entry[0].id == user_id]:
+                del self._entries[token]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "revoked_users": len(self._revoked),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+principal_cache = PrincipalCache(
+    max_size=PRINCIPAL_CACHE_SIZE,
+    revocation_ttl=PRINCIPAL_REVOCATION_TTL_SECONDS,
+    refresh_interval=PRINCIPAL_REVOCATION_REFRESH_SECONDS,
+)
+
+
+def invalidate_user(session, user_id: str):
+    # Explicit invalidation path: every token already issued to this user is rejected once
+    # `session` (sync or async) commits
+    revoked_at = time.time()
+    session.add(UserRevocation(user_id=user_id, revoked_at=revoked_at))
+    session.info.setdefault("revoked_users", {})[user_id] = revoked_at
+
+
+@event.listens_for(Session, "before_flush")
+def _record_deactivations(session, flush_context, instances):
+    # Any code path that flips User.is_active to False revokes the user's tokens in the same transaction
+    deactivated = []
+    for user in session.dirty:
+        if isinstance(user, User) and user.id is not None:
+            added = inspect(user).attrs.is_active.history.added
+            if added and not added[0]:
+                deactivated.append(user)
+    if not deactivated:
+        return
+    for user in deactivated:
+        invalidate_user(session, user.id)
+    # Older rows can no longer match a live token
+    session.connection().execute(
+        delete(UserRevocation.__table__).where(UserRevocation.revoked_at <= time.time() - PRINCIPAL_REVOCATION_TTL_SECONDS)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_revocations(session):
+    # Other workers pick the rows up on their next refresh
+    for user_id, revoked_at in session.info.pop("revoked_users", {}).items():
+        principal_cache.revoke_user(user_id, revoked_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_revocations(session):
+    session.info.pop("revoked_users", None)
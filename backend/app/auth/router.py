@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import List, Optional
-from ..database import get_db
+from ..database import get_async_db
 from ..models import User, Organization
-from .jwt import verify_password, get_password_hash, create_access_token
+from .jwt import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from .hashing import password_hasher
+from .principal import Principal
 from datetime import timedelta
 
 router = APIRouter()
@@ -34,20 +38,22 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Credential endpoints are async so bcrypt runs on the dedicated hashing pool
+# rather than holding one of the threadpool slots shared with the scoring routes
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    hashed_password = await password_hasher.hash(user.password)
+
     # Create Organization (simplified for now, assuming new org for each user or handle logic)
     # For this MVP, let's create a new organization for the user
     new_org = Organization(name=user.organization_name, type="fintech", subscription_tier="starter")
     db.add(new_org)
-    db.commit()
-    db.refresh(new_org)
+    await db.commit()
 
-    hashed_password = get_password_hash(user.password)
     new_user = User(
         email=user.email,
         password_hash=hashed_password,
@@ -57,21 +63,37 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         organization_id=new_org.id
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    # The organization is read by Principal.from_user; lazy loads aren't available on an AsyncSession
+    user = await db.scalar(
+        select(User).options(selectinload(User.organization)).where(User.email == form_data.username)
+    )
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=30)
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Inactive user",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this password was stored
+        user.password_hash = new_hash
+        await db.commit()
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Embed the principal so authenticated requests don't need to load the user
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=Principal.from_user(user).to_claims(), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
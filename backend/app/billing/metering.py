@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from ..database import SessionLocal
+from .models import UsageCounter
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+USAGE_MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "10000"))
+
+GRANULARITIES = ("minute", "hour", "month")
+
+
+def period_starts(minute: int):
+    # (granularity, period_start) for each rollup level containing the given epoch minute
+    at = datetime.utcfromtimestamp(minute * 60)
+    return (
+        ("minute", at),
+        ("hour", at.replace(minute=0)),
+        ("month", at.replace(day=1, hour=0, minute=0)),
+    )
+
+
+class UsageMeter:
+    """Write-behind usage counters for billing.
+
+    Request paths only bump an in-memory counter keyed by organization,
+    module, API key and minute. A background thread periodically folds the
+    counters into minute, hour and month rows with one batched upsert, so
+    write load grows with the number of active keys, not with traffic.
+    """
+
+    def __init__(self, interval: float, max_pending: int, session_factory=SessionLocal):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, organization_id: Optional[str], module: str, api_key_id: Optional[str] = None, quantity: int = 1):
+        if organization_id is None or quantity <= 0:
+            return
+        key = (organization_id, module, api_key_id or "", int(time.time() // 60))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + quantity
+            pending = len(self._counts)
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._counts = self._counts, {}
+        if not batch:
+            return 0
+
+        rows = {}
+        for (organization_id, module, api_key_id, minute), quantity in batch.items():
+            for granularity, period_start in period_starts(minute):
+                key = (organization_id, granularity, period_start, module, api_key_id)
+                rows[key] = rows.get(key, 0) + quantity
+
+        db = self.session_factory()
+        try:
+            dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+            stmt = dialect.insert(UsageCounter)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[c.name for c in UsageCounter.__table__.primary_key.columns],
+                set_={"quantity": UsageCounter.quantity + stmt.excluded.quantity},
+            )
+            db.execute(stmt, [
+                {
+                    "organization_id": organization_id,
+                    "granularity": granularity,
+                    "period_start": period_start,
+                    "module": module,
+                    "api_key_id": api_key_id,
+                    "quantity": quantity,
+                }
+                for (organization_id, granularity, period_start, module, api_key_id), quantity in rows.items()
+            ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to flush usage counters: {e}")
+            # Counts are additive, so a failed batch is merged back into whatever arrived meanwhile
+            with self._lock:
+                for key, quantity in batch.items():
+                    self._counts[key] = self._counts.get(key, 0) + quantity
+            return 0
+        finally:
+            db.close()
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-meter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        # Final flush so usage recorded before shutdown is still billed
+        self.flush()
+
+
+usage_meter = UsageMeter(interval=USAGE_FLUSH_SECONDS, max_pending=USAGE_MAX_PENDING)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime
+from ..database import Base
+
+class UsageCounter(Base):
+    # Aggregated usage per organization, module and API key. Minute rows are the finest grain;
+    # hour and month rows are rollups kept current by the same flush, so reports never scan minutes.
+    __tablename__ = "usage_counters"
+
+    organization_id = Column(String, ForeignKey("organizations.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # minute, hour, month
+    period_start = Column(DateTime, primary_key=True)  # UTC
+    module = Column(String, primary_key=True)  # bankcall, antifraud
+    api_key_id = Column(String, primary_key=True, default="")  # "" for JWT callers
+    quantity = Column(Integer, nullable=False, default=0)
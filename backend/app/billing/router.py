@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from ..database import get_async_read_db
+from ..auth.dependencies import get_current_user
+from ..auth.principal import Principal
+from .models import UsageCounter
+from pydantic import BaseModel
+from datetime import datetime
+
+router = APIRouter()
+
+class UsageResponse(BaseModel):
+    period_start: datetime
+    module: str
+    api_key_id: Optional[str]
+    quantity: int
+
+@router.get("/usage", response_model=List[UsageResponse])
+async def get_usage(
+    # Reports read the hour/month rollups; minute rows exist only to build them
+    granularity: Literal["hour", "month"] = "month",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    module: Optional[str] = None,
+    # Split usage per API key instead of one total per module
+    by_api_key: bool = False,
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    columns = [UsageCounter.period_start, UsageCounter.module]
+    if by_api_key:
+        columns.append(UsageCounter.api_key_id)
+    query = select(*columns, func.sum(UsageCounter.quantity)).where(
+        UsageCounter.organization_id == current_user.organization_id,
+        UsageCounter.granularity == granularity,
+    )
+    if start is not None:
+        query = query.where(UsageCounter.period_start >= start)
+    if end is not None:
+        query = query.where(UsageCounter.period_start < end)
+    if module is not None:
+        query = query.where(UsageCounter.module == module)
+
+    query = query.group_by(*columns).order_by(UsageCounter.period_start, UsageCounter.module).limit(limit)
+    rows = (await db.execute(query)).all()
+    return [
+        {
+            "period_start": row[0],
+            "module": row[1],
+            "api_key_id": (row[2] or None) if by_api_key else None,
+            "quantity": row[-1],
+        }
+        for row in rows
+    ]
@@ -1,22 +1,189 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .metrics.instrumentation import instrument_engine, timed_pool_class
+from .metrics.registry import dependency_latency
 import os
+import threading
+import time
 
 # Use environment variable for DB URL, default to sqlite for development if not set
 # In production, this should be PostgreSQL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+# Optional read replica for read-only request paths; unset means reads go to the primary
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Per engine: each worker process holds up to pool size + overflow connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds; replaces connections before server or proxy idle timeouts cut them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+# NORMAL is durable across application crashes in WAL mode and skips most fsyncs
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Readers no longer block the writer, and a locked database is retried instead of failing at once
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def create_db_engine(url: str, name: str, asynchronous: bool = False):
+    """Engine with the pool settings above, instrumented for query and pool-wait metrics.
+
+    ``name`` labels the engine's pool in db_pool_checkout_wait_seconds.
+    """
+    parsed = make_url(url)
+    sqlite = parsed.get_backend_name() == "sqlite"
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if sqlite and not asynchronous:
+        options["connect_args"] = {"check_same_thread": False}
+    if not (sqlite and parsed.database in (None, "", ":memory:")):
+        # In-memory SQLite keeps SQLAlchemy's single-connection pool; anything else gets a sized queue pool
+        options.update(
+            poolclass=timed_pool_class(AsyncAdaptedQueuePool if asynchronous else QueuePool, name),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    db_engine = create_async_engine(url, **options) if asynchronous else create_engine(url, **options)
+    sync_engine = db_engine.sync_engine if asynchronous else db_engine
+    if sqlite:
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    instrument_engine(sync_engine)
+    return db_engine
+
+
+# Request handlers use the async engine; background threads (flushers, outbox worker) keep the sync one
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+
+# Pool label -> sync engine (the sync side of async engines), filled in by init_engines()
+engines = {}
+_async_engines = []
+_engines_lock = threading.Lock()
+
+
+def init_engines() -> dict:
+    """Creates the engines on first use and binds the session factories to them.
+
+    Nothing connects at import time, so a pre-fork master that imports the
+    app holds no connections for its children to inherit.
+    """
+    if engines:
+        return engines
+    with _engines_lock:
+        if engines:
+            return engines
+        engine = create_db_engine(SQLALCHEMY_DATABASE_URL, "primary")
+        async_engine = create_db_engine(ASYNC_DATABASE_URL, "primary_async", asynchronous=True)
+        # Read-only request paths (listings, token fallback lookups) take sessions from here. They may
+        # trail the primary by the replica's lag, so anything that must see its own writes stays on get_async_db.
+        async_read_engine = async_engine
+        if DATABASE_REPLICA_URL:
+            async_read_engine = create_db_engine(_async_url(DATABASE_REPLICA_URL), "replica_async", asynchronous=True)
+
+        SessionLocal.configure(bind=engine)
+        AsyncSessionLocal.configure(bind=async_engine)
+        AsyncReadSessionLocal.configure(bind=async_read_engine)
+        built = {"primary": engine, "primary_async": async_engine.sync_engine}
+        _async_engines.append(async_engine)
+        if async_read_engine is not async_engine:
+            built["replica_async"] = async_read_engine.sync_engine
+            _async_engines.append(async_read_engine)
+        engines.update(built)
+    return engines
+
+
+def get_engine():
+    return init_engines()["primary"]
+
+
+async def dispose_engines():
+    for async_engine in _async_engines:
+        await async_engine.dispose()
+    if engines:
+        engines["primary"].dispose()
+
+
+def _reset_pools_after_fork():
+    # A child must never reuse connections inherited from its parent; close=False leaves them to the parent
+    for db_engine in engines.values():
+        db_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        init_engines()
+        return super().__call__(**local_kw)
+
+
+class _LazyAsyncSessionmaker(async_sessionmaker):
+    def __call__(self, **local_kw):
+        init_engines()
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
+# expire_on_commit=False: attributes stay readable after commit without an implicit (sync) reload
+AsyncSessionLocal = _LazyAsyncSessionmaker(expire_on_commit=False, autoflush=False)
+AsyncReadSessionLocal = _LazyAsyncSessionmaker(expire_on_commit=False, autoflush=False)
 
 Base = declarative_base()
 
 def get_db():
+    # Timed as session setup plus teardown; the request itself runs in between
+    start = time.perf_counter()
     db = SessionLocal()
+    elapsed = time.perf_counter() - start
     try:
         yield db
     finally:
+        start = time.perf_counter()
         db.close()
+        dependency_latency.observe(("get_db",), elapsed + time.perf_counter() - start)
+
+
+async def get_async_db():
+    start = time.perf_counter()
+    db = AsyncSessionLocal()
+    elapsed = time.perf_counter() - start
+    try:
+        yield db
+    finally:
+        start = time.perf_counter()
+        await db.close()
+        dependency_latency.observe(("get_async_db",), elapsed + time.perf_counter() - start)
+
+
+async def get_async_read_db():
+    start = time.perf_counter()
+    db = AsyncReadSessionLocal()
+    elapsed = time.perf_counter() - start
+    try:
+        yield db
+    finally:
+        start = time.perf_counter()
+        await db.close()
+        dependency_latency.observe(("get_async_read_db",), elapsed + time.perf_counter() - start)
@@ -0,0 +1,285 @@
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+from .log import LogReader, OffsetStore, SegmentedLog
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_ENABLED = os.getenv("EVENT_BUS_ENABLED", "true").lower() == "true"
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "./event_log")
+# Each worker process appends to its own partition directory; this caps the workers per host
+EVENT_LOG_PARTITIONS = int(os.getenv("EVENT_LOG_PARTITIONS", "16"))
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+EVENT_LOG_FSYNC = os.getenv("EVENT_LOG_FSYNC", "true").lower() == "true"
+# Fully consumed segments are kept this long for replay before being deleted
+EVENT_LOG_RETENTION_HOURS = float(os.getenv("EVENT_LOG_RETENTION_HOURS", "168"))
+# Events are appended in batches at most this often
+EVENT_BUS_FLUSH_MS = float(os.getenv("EVENT_BUS_FLUSH_MS", "20"))
+EVENT_BUS_BATCH_SIZE = int(os.getenv("EVENT_BUS_BATCH_SIZE", "1000"))
+# Events accepted but not yet written; beyond this publish() drops rather than waits
+EVENT_BUS_MAX_PENDING = int(os.getenv("EVENT_BUS_MAX_PENDING", "100000"))
+
+
+class Event(NamedTuple):
+    offset: int
+    event_type: str
+    organization_id: Optional[str]
+    created_at: datetime
+    payload: dict
+
+
+def _encode(event_type: str, organization_id: Optional[str], created_at: float, payload: dict) -> bytes:
+    return json.dumps(
+        {"type": event_type, "org": organization_id, "ts": created_at, "data": payload}, separators=(",", ":")
+    ).encode()
+
+
+def _decode(offset: int, record: bytes) -> Event:
+    value = json.loads(record)
+    return Event(offset, value["type"], value["org"], datetime.utcfromtimestamp(value["ts"]), value["data"])
+
+
+class _Consumer:
+    def __init__(self, name: str, handler: Callable[[List[Event]], None], event_types, batch_size: int):
+        self.name = name
+        self.handler = handler
+        self.event_types = frozenset(event_types) if event_types else None
+        self.batch_size = batch_size
+        self.committed = 0
+        self.thread = None
+
+
+class EventBus:
+    """In-process event bus backed by an append-only log on local disk.
+
+    publish() only appends to an in-memory queue, so producers on the request
+    path never wait for disk or for consumers. A writer thread drains the
+    queue into the log in batches. Every consumer runs in its own thread,
+    reads the log from its committed offset and commits after its handler
+    returns: delivery is at-least-once, and a consumer that fails retries
+    the same batch without holding up the others.
+
+    Consumers are registered with subscribe() before start(); a new consumer
+    with no committed offset starts at the current end of the log.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        partitions: int,
+        segment_bytes: int,
+        fsync: bool,
+        flush_interval: float,
+        batch_size: int,
+        max_pending: int,
+        retention_seconds: float,
+    ):
+        self.directory = directory
+        self.partitions = partitions
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._consumers: Dict[str, _Consumer] = {}
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._appended = threading.Condition()
+        self._stopping = threading.Event()
+        self._writer = None
+        self._log = None
+        self._offsets = None
+        self._lock_file = None
+        self.partition = None
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._log is not None
+
+    def subscribe(
+        self,
+        name: str,
+        handler: Callable[[List[Event]], None],
+        event_types: Optional[Sequence[str]] = None,
+        batch_size: int = 100,
+    ):
+        # Registering a name again replaces the handler; its committed offset is kept
+        if self.running:
+            raise RuntimeError("Consumers must be registered before the event bus starts")
+        self._consumers[name] = _Consumer(name, handler, event_types, batch_size)
+
+    def publish(self, event_type: str, organization_id: Optional[str], payload: dict):
+        # Never blocks; `payload` must not be mutated afterwards
+        if not self.running or len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((event_type, organization_id, time.time(), payload))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _claim_partition(self) -> Optional[int]:
+        # The first partition no other live process holds; a restarted worker picks up a free one and its backlog
+        for partition in range(self.partitions):
+            path = os.path.join(self.directory, f"partition-{partition}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, ".lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            return partition
+        return None
+
+    def start(self):
+        if self.running or not EVENT_BUS_ENABLED:
+            return
+        self.partition = self._claim_partition()
+        if self.partition is None:
+            logger.error(f"All {self.partitions} event log partitions in {self.directory} are in use; events will be dropped")
+            return
+        partition_dir = os.path.join(self.directory, f"partition-{self.partition}")
+        log = SegmentedLog(os.path.join(partition_dir, "segments"), self.segment_bytes, self.fsync)
+        self._offsets = OffsetStore(os.path.join(partition_dir, "offsets"))
+        self._stopping.clear()
+        for consumer in self._consumers.values():
+            consumer.committed = self._offsets.get(consumer.name, log.end_offset)
+            consumer.thread = threading.Thread(
+                target=self._consume, args=(consumer, log), name=f"event-consumer-{consumer.name}", daemon=True
+            )
+        self._log = log
+        self._writer = threading.Thread(target=self._write, name="event-log-writer", daemon=True)
+        self._writer.start()
+        for consumer in self._consumers.values():
+            consumer.thread.start()
+        logger.info(f"Event bus on partition {self.partition} at offset {log.end_offset}")
+
+    def stop(self):
+        if not self.running:
+            return
+        # The writer drains what was published before the stop; consumers resume from their offsets next time
+        self._stopping.set()
+        self._wakeup.set()
+        self._writer.join()
+        with self._appended:
+            self._appended.notify_all()
+        for consumer in self._consumers.values():
+            consumer.thread.join()
+            consumer.thread = None
+        self._log.close()
+        self._log = None
+        self._lock_file.close()
+        self._lock_file = None
+
+    def flush(self) -> int:
+        # Appends everything pending to the log; writer thread only
+        written = 0
+        while self._pending:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(_encode(*self._pending.popleft()))
+            try:
+                self._log.append(batch)
+            except OSError as e:
+                logger.error(f"Failed to append {len(batch)} events to the event log: {e}")
+                self.dropped += len(batch)
+                continue
+            written += len(batch)
+        if written:
+            self.published += written
+            with self._appended:
+                self._appended.notify_all()
+        return written
+
+    def _write(self):
+        last_cleanup = time.monotonic()
+        while True:
+            stopping = self._stopping.is_set()
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if stopping:
+                return
+            if time.monotonic() - last_cleanup > 60:
+                last_cleanup = time.monotonic()
+                self._delete_consumed_segments()
+
+    def _delete_consumed_segments(self):
+        if not self._consumers:
+            return
+        consumed = min(consumer.committed for consumer in self._consumers.values())
+        deleted = self._log.delete_before(consumed, self.retention_seconds)
+        if deleted:
+            logger.info(f"Deleted {deleted} consumed event log segments")
+
+    def _consume(self, consumer: _Consumer, log: SegmentedLog):
+        reader = LogReader(log, consumer.committed)
+        try:
+            while not self._stopping.is_set():
+                records = reader.read(consumer.batch_size)
+                if not records:
+                    with self._appended:
+                        if log.end_offset <= reader.offset and not self._stopping.is_set():
+                            self._appended.wait(1.0)
+                    continue
+                events = [_decode(offset, record) for offset, record in records]
+                if consumer.event_types is not None:
+                    events = [event for event in events if event.event_type in consumer.event_types]
+                if events and not self._handle(consumer, events):
+                    # Stopped while retrying; the batch is redelivered after restart
+                    return
+                consumer.committed = reader.offset
+                self._offsets.commit(consumer.name, consumer.committed)
+        finally:
+            reader.close()
+
+    def _handle(self, consumer: _Consumer, events: List[Event]) -> bool:
+        # Retries with backoff until the handler succeeds; False if the bus stops first
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                consumer.handler(events)
+                return True
+            except Exception as e:
+                failures += 1
+                logger.error(
+                    f"Event consumer {consumer.name} failed on offsets {events[0].offset}-{events[-1].offset}: {e}"
+                )
+                self._stopping.wait(min(2 ** failures, 60))
+        return False
+
+    def stats(self) -> dict:
+        end = self._log.end_offset if self._log is not None else None
+        return {
+            "partition": self.partition,
+            "end_offset": end,
+            "pending": len(self._pending),
+            "published": self.published,
+            "dropped": self.dropped,
+            "consumer_lag": {
+                name: (end - consumer.committed if end is not None else None)
+                for name, consumer in self._consumers.items()
+            },
+        }
+
+
+event_bus = EventBus(
+    directory=EVENT_LOG_DIR,
+    partitions=EVENT_LOG_PARTITIONS,
+    segment_bytes=EVENT_LOG_SEGMENT_BYTES,
+    fsync=EVENT_LOG_FSYNC,
+    flush_interval=EVENT_BUS_FLUSH_MS / 1000,
+    batch_size=EVENT_BUS_BATCH_SIZE,
+    max_pending=EVENT_BUS_MAX_PENDING,
+    retention_seconds=EVENT_LOG_RETENTION_HOURS * 3600,
+)
@@ -0,0 +1,283 @@
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Every record: payload length and CRC-32 of the payload, then the payload bytes
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".log"
+
+
+def _segment_path(directory: str, base_offset: int) -> str:
+    # Zero-padded so segment files sort by base offset
+    return os.path.join(directory, f"{base_offset:020d}{SEGMENT_SUFFIX}")
+
+
+def _scan(buffer, start: int, end: int, max_records: Optional[int] = None):
+    """Valid records in buffer[start:end] as (payload start, payload end) pairs.
+
+    Stops at the first incomplete or corrupt record, i.e. a torn write at
+    the tail of the active segment.
+    """
+    position = start
+    while position + RECORD_HEADER.size <= end and (max_records is None or max_records > 0):
+        length, crc = RECORD_HEADER.unpack_from(buffer, position)
+        payload_start = position + RECORD_HEADER.size
+        payload_end = payload_start + length
+        if payload_end > end or zlib.crc32(buffer[payload_start:payload_end]) != crc:
+            return
+        yield payload_start, payload_end
+        position = payload_end
+        if max_records is not None:
+            max_records -= 1
+
+
+class Segment:
+    __slots__ = ("base_offset", "path", "size", "count")
+
+    def __init__(self, base_offset: int, path: str, size: int = 0, count: int = 0):
+        self.base_offset = base_offset
+        self.path = path
+        # Bytes and records written so far; only the active segment grows
+        self.size = size
+        self.count = count
+
+    @property
+    def end_offset(self) -> int:
+        return self.base_offset + self.count
+
+
+class SegmentedLog:
+    """Append-only record log split into segment files.
+
+    Records are numbered by offset. Appends take a whole batch and write it
+    with a single write() (and fsync, if enabled), so the cost is per batch,
+    not per record. Once the active segment passes ``segment_bytes`` a new
+    one is started; old segments are only ever deleted whole. On open, a
+    torn record at the end of the last segment is truncated away.
+
+    One process appends at a time; readers in the same process use
+    LogReader, which maps segments into memory instead of reading them.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._fd = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        bases = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for base, next_base in zip(bases, bases[1:]):
+            # A sealed segment holds exactly the offsets up to the next one's base
+            path = _segment_path(self.directory, base)
+            self._segments.append(Segment(base, path, os.path.getsize(path), next_base - base))
+        if not bases:
+            self._open_segment(0)
+            return
+        path = _segment_path(self.directory, bases[-1])
+        size, count = os.path.getsize(path), 0
+        if size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                valid = 0
+                for _, valid in _scan(mm, 0, size):
+                    count += 1
+            if valid < size:
+                logger.warning(f"Truncating {size - valid} bytes of incomplete records from {path}")
+                os.truncate(path, valid)
+                size = valid
+        self._segments.append(Segment(bases[-1], path, size, count))
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def _open_segment(self, base_offset: int):
+        path = _segment_path(self.directory, base_offset)
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segments.append(Segment(base_offset, path))
+
+    @property
+    def start_offset(self) -> int:
+        return self._segments[0].base_offset
+
+    @property
+    def end_offset(self) -> int:
+        # Offset the next appended record will get
+        return self._segments[-1].end_offset
+
+    def append(self, payloads: Sequence[bytes]) -> int:
+        # Returns the offset of the first record in the batch
+        with self._lock:
+            first = self.end_offset
+            pending, pending_bytes = [], 0
+            for payload in payloads:
+                active = self._segments[-1]
+                if active.count + len(pending) and active.size + pending_bytes >= self.segment_bytes:
+                    self._write(pending, pending_bytes)
+                    pending, pending_bytes = [], 0
+                    self._open_segment(self.end_offset)
+                record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+                pending.append(record)
+                pending_bytes += len(record)
+            self._write(pending, pending_bytes)
+            return first
+
+    def _write(self, records: List[bytes], size: int):
+        if not records:
+            return
+        data = memoryview(b"".join(records))
+        while data:
+            written = os.write(self._fd, data)
+            data = data[written:]
+        if self.fsync:
+            os.fsync(self._fd)
+        # Readers only see the records once they are fully written
+        active = self._segments[-1]
+        active.size += size
+        active.count += len(records)
+
+    def segments(self) -> List[Segment]:
+        with self._lock:
+            return [Segment(s.base_offset, s.path, s.size, s.count) for s in self._segments]
+
+    def segment_for(self, offset: int) -> Tuple[Segment, bool]:
+        # (segment containing offset, whether it is sealed); offsets before the first segment map to it
+        with self._lock:
+            index = max(bisect_right([s.base_offset for s in self._segments], offset) - 1, 0)
+            segment = self._segments[index]
+            return Segment(segment.base_offset, segment.path, segment.size, segment.count), index < len(self._segments) - 1
+
+    def delete_before(self, offset: int, older_than: float = 0) -> int:
+        """Deletes sealed segments whose records all precede ``offset``.
+
+        Only segments last written more than ``older_than`` seconds ago are
+        removed. Returns the number of segments deleted.
+        """
+        deleted = 0
+        with self._lock:
+            while len(self._segments) > 1 and self._segments[0].end_offset <= offset:
+                segment = self._segments[0]
+                if time.time() - os.path.getmtime(segment.path) < older_than:
+                    break
+                os.unlink(segment.path)
+                self._segments.pop(0)
+                deleted += 1
+        return deleted
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class LogReader:
+    """Sequential reader over a SegmentedLog through memory maps.
+
+    The current segment is mapped once and remapped only when the writer has
+    appended past the mapped length, so reading is a slice of page cache
+    rather than a read() per batch.
+    """
+
+    def __init__(self, log: SegmentedLog, offset: int):
+        self.log = log
+        self._mm = None
+        self._file = None
+        self._segment_base = None
+        self._mapped = 0
+        self.seek(offset)
+
+    def seek(self, offset: int):
+        start = self.log.start_offset
+        if offset < start:
+            logger.warning(f"Offset {offset} was deleted from {self.log.directory}; resuming at {start}")
+            offset = start
+        segment, _ = self.log.segment_for(offset)
+        self._map(segment)
+        self._position = 0
+        self.offset = segment.base_offset
+        # Skip records before the requested offset by walking their headers
+        for _, self._position in _scan(self._mm, 0, self._mapped, offset - segment.base_offset):
+            self.offset += 1
+
+    def _map(self, segment: Segment):
+        if segment.base_offset != self._segment_base:
+            self._unmap()
+            self._file = open(segment.path, "rb")
+            self._segment_base = segment.base_offset
+        if segment.size > self._mapped:
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self._file.fileno(), segment.size, access=mmap.ACCESS_READ)
+            self._mapped = segment.size
+
+    def _unmap(self):
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._mm, self._file, self._segment_base, self._mapped = None, None, None, 0
+
+    def read(self, max_records: int) -> List[Tuple[int, bytes]]:
+        # Up to max_records (offset, payload) pairs from the current offset; empty at the end of the log
+        records = []
+        while len(records) < max_records:
+            segment, sealed = self.log.segment_for(self.offset)
+            if segment.base_offset != self._segment_base:
+                # The reader fell behind segment deletion
+                self.seek(self.offset)
+                continue
+            if self._position >= segment.size:
+                if not sealed:
+                    break
+                next_segment, _ = self.log.segment_for(segment.end_offset)
+                self._map(next_segment)
+                self._position = 0
+                continue
+            self._map(segment)
+            for start, end in _scan(self._mm, self._position, segment.size, max_records - len(records)):
+                records.append((self.offset, self._mm[start:end]))
+                self.offset += 1
+                self._position = end
+        return records
+
+    def close(self):
+        self._unmap()
+
+
+class OffsetStore:
+    # Committed consumer offsets, one small file per consumer, replaced atomically
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, consumer: str) -> str:
+        return os.path.join(self.directory, f"{consumer}.offset")
+
+    def get(self, consumer: str, default: int = 0) -> int:
+        try:
+            with open(self._path(consumer)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return default
+
+    def commit(self, consumer: str, offset: int):
+        path = self._path(consumer)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(str(offset))
+        os.replace(f"{path}.tmp", path)
@@ -1,24 +1,51 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .auth import router as auth_router
+import time
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Cold start is measured from here: everything below, including the routers, is import cost
+_IMPORT_STARTED = time.perf_counter()
 
+from contextlib import asynccontextmanager
+from typing import Optional, Sequence
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from .database import SQLALCHEMY_DATABASE_URL, dispose_engines, engines, init_engines
+from .api_keys.last_used import last_used_recorder
+from .auth.hashing import password_hasher
+from .webhooks.delivery import delivery_engine
+from .webhooks.worker import outbox_worker, WEBHOOK_RUN_WORKER_IN_APP
+from .webhooks.dispatcher import dispatch_events
+from .webhooks.retention import retention_runner, WEBHOOK_RETENTION_IN_APP
+from .billing.metering import usage_meter
+from .events.bus import event_bus
+from .api_keys.cache import api_key_cache
+from .auth.principal import principal_cache
 from .exception_handlers import validation_exception_handler, sqlalchemy_exception_handler, global_exception_handler
+from .metrics.instrumentation import MetricsMiddleware
+from .metrics.registry import registry, CallbackCollector
+from .pagination import NEXT_CURSOR_HEADER
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError
+import importlib
+import inspect
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI(
-    title="AI Foundry Platform",
-    description="Unified API for BankCall AI and Anti-Fraud AI",
-    version="1.0.0"
-)
+# Optional product modules served by this deployment; others are never imported
+APP_MODULES = [name.strip() for name in os.getenv("APP_MODULES", "antifraud,bankcall").split(",") if name.strip()]
+# Workers create missing tables on startup only when asked to; by default only for local SQLite.
+# Elsewhere run `python -m app.schema` once per deploy, before the workers start.
+DB_AUTO_CREATE_SCHEMA = os.getenv(
+    "DB_AUTO_CREATE_SCHEMA", "true" if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else "false"
+).lower() == "true"
 
-app.add_exception_handler(RequestValidationError, validation_exception_handler)
-app.add_exception_handler(SQLAlchemyError, sqlalchemy_exception_handler)
-app.add_exception_handler(Exception, global_exception_handler)
+# name -> (router module, prefix, tag). A router module may also define startup(), shutdown()
+# (plain or async) and health() for the module's own background state.
+OPTIONAL_MODULES = {
+    "antifraud": (".modules.antifraud.router", "/api/antifraud", "Anti-Fraud AI"),
+    "bankcall": (".modules.bankcall.router", "/api/bankcall", "BankCall AI"),
+}
 
 # CORS Configuration
 origins = [
@@ -26,33 +53,175 @@ origins = [
     "http://localhost:8000",  # Backend
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
+def _load_modules(names: Sequence[str]) -> dict:
+    loaded = {}
+    for name in names:
+        if name not in OPTIONAL_MODULES:
+            raise ValueError(f"Unknown module {name!r}; expected one of {', '.join(OPTIONAL_MODULES)}")
+        loaded[name] = importlib.import_module(OPTIONAL_MODULES[name][0], __package__)
+    return loaded
+
+
+def _module_hooks(app: FastAPI, hook: str):
+    return [getattr(module, hook) for module in app.state.modules.values() if hasattr(module, hook)]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    # Runs in the worker process, after any fork: engines and their pools are created here
+    init_engines()
+    if DB_AUTO_CREATE_SCHEMA:
+        from .schema import ensure_schema
+        ensure_schema()
+    last_used_recorder.start()
+    usage_meter.start()
+    for startup in _module_hooks(app, "startup"):
+        if inspect.isawaitable(result := startup()):
+            await result
+    await delivery_engine.start()
+    if WEBHOOK_RUN_WORKER_IN_APP:
+        await outbox_worker.start()
+    if WEBHOOK_RETENTION_IN_APP:
+        retention_runner.start()
+    # Consumers of the event bus; producers only call event_bus.publish()
+    event_bus.subscribe("webhooks", dispatch_events)
+    event_bus.start()
+    timings = app.state.startup_timings
+    timings["lifespan"] = time.perf_counter() - start
+    timings["total"] = sum(timings[phase] for phase in ("import", "create_app", "lifespan"))
+    logger.info(
+        f"Worker {os.getpid()} ready in {timings['total'] * 1000:.0f} ms "
+        f"(import {timings['import'] * 1000:.0f} ms, create_app {timings['create_app'] * 1000:.0f} ms, "
+        f"startup {timings['lifespan'] * 1000:.0f} ms; modules: {', '.join(app.state.modules) or 'none'})"
+    )
+    yield
+    # Modules first: they may still publish events while winding down
+    for shutdown in _module_hooks(app, "shutdown"):
+        if inspect.isawaitable(result := shutdown()):
+            await result
+    # Before the delivery engine, which the webhooks consumer hands deliveries to
+    event_bus.stop()
+    retention_runner.stop()
+    await outbox_worker.stop()
+    await delivery_engine.stop()
+    # Flush buffered API key usage before the worker exits
+    last_used_recorder.stop()
+    usage_meter.stop()
+    password_hasher.shutdown()
+    await dispose_engines()
+
+
+def create_app(modules: Optional[Sequence[str]] = None) -> FastAPI:
+    """Builds the application without touching the database.
+
+    ``modules`` defaults to APP_MODULES. Engines are created and the
+    schema is (optionally) checked in the lifespan, i.e. in each worker.
+    """
+    start = time.perf_counter()
+    app = FastAPI(
+        title="AI Foundry Platform",
+        description="Unified API for BankCall AI and Anti-Fraud AI",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    app.state.startup_timings = {"import": start - _IMPORT_STARTED}
+    app.state.modules = _load_modules(APP_MODULES if modules is None else modules)
+
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(SQLAlchemyError, sqlalchemy_exception_handler)
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    app.add_middleware(MetricsMiddleware)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
+    )
+
+    from .auth.router import router as auth_router
+    app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
+
+    for name, module in app.state.modules.items():
+        _, prefix, tag = OPTIONAL_MODULES[name]
+        app.include_router(module.router, prefix=prefix, tags=[tag])
+
+    from .api_keys.router import router as api_key_router
+    app.include_router(api_key_router, prefix="/api/keys", tags=["API Keys"])
+
+    from .webhooks.router import router as webhook_router
+    app.include_router(webhook_router, prefix="/api/webhooks", tags=["Webhooks"])
+
+    from .billing.router import router as billing_router
+    app.include_router(billing_router, prefix="/api/billing", tags=["Billing"])
+
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to AI Foundry Platform API"}
 
-from .modules.antifraud import router as antifraud_router
-from .modules.bankcall import router as bankcall_router
+    @app.get("/health")
+    async def health_check():
+        status = {
+            "status": "healthy",
+            "modules": list(app.state.modules),
+            "startup_seconds": app.state.startup_timings,
+            "api_key_cache": api_key_cache.stats(),
+            "principal_cache": principal_cache.stats(),
+            "event_bus": event_bus.stats(),
+        }
+        for health in _module_hooks(app, "health"):
+            status.update(health())
+        return status
 
-app.include_router(antifraud_router, prefix="/api/antifraud", tags=["Anti-Fraud AI"])
-app.include_router(bankcall_router, prefix="/api/bankcall", tags=["BankCall AI"])
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-from .api_keys import router as api_key_router
-app.include_router(api_key_router, prefix="/api/keys", tags=["API Keys"])
+    registry.register(CallbackCollector(
+        "app_startup_seconds", "Worker cold-start time by phase.", ("phase",),
+        lambda: [((phase,), seconds) for phase, seconds in app.state.startup_timings.items()],
+    ))
 
-from .webhooks import router as webhook_router
-app.include_router(webhook_router, prefix="/api/webhooks", tags=["Webhooks"])
+    app.state.startup_timings["create_app"] = time.perf_counter() - start
+    return app
 
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to AI Foundry Platform API"}
+registry.register(CallbackCollector(
+    "webhook_deliveries_pending", "Webhook deliveries queued or in flight in this worker.", (),
+    lambda: [((), delivery_engine.pending)],
+))
+registry.register(CallbackCollector(
+    "db_pool_connections", "Pooled database connections by state.", ("pool", "state"),
+    lambda: [
+        ((name, state), count)
+        for name, db_engine in engines.items()
+        if hasattr(db_engine.pool, "checkedout")
+        for state, count in (("checked_out", db_engine.pool.checkedout()), ("idle", db_engine.pool.checkedin()))
+    ],
+))
+registry.register(CallbackCollector(
+    "event_bus_events_total", "Events accepted into the event log, or dropped.", ("result",),
+    lambda: [(("published",), event_bus.published), (("dropped",), event_bus.dropped)],
+    metric_type="counter",
+))
+registry.register(CallbackCollector(
+    "event_bus_consumer_lag", "Events in the log not yet committed by each consumer.", ("consumer",),
+    lambda: [((name,), lag) for name, lag in event_bus.stats()["consumer_lag"].items() if lag is not None],
+))
+registry.register(CallbackCollector(
+    "cache_lookups_total", "Lookups answered by in-process caches.", ("cache", "result"),
+    lambda: [
+        ((name, result), stats[result])
+        for name, stats in (("api_key", api_key_cache.stats()), ("principal", principal_cache.stats()))
+        for result in ("hits", "misses")
+    ],
+    metric_type="counter",
+))
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+# uvicorn app.main:app
+app = create_app()
@@ -0,0 +1,86 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .registry import http_requests, http_errors, http_latency, db_query_latency, db_pool_checkout_wait
+import time
+
+_STATEMENT_TYPES = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "WITH"))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request count, errors and latency per route.
+
+    Routes are labelled with the path template of the matched route
+    (``/api/keys/{key_id}``), so label cardinality stays bounded; unmatched
+    paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            route = _route_template(scope)
+            labels = (scope["method"], route)
+            http_latency.observe(labels, time.perf_counter() - start)
+            http_requests.inc((scope["method"], route, str(status_code)))
+            if status_code >= 500:
+                http_errors.inc(labels)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # FastAPI versions that include routers lazily leave the router's own path on the route;
+    # the prefixed template is on the effective route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(context, "path", None) or route.path
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip()[:8].split(None, 1)
+    keyword = keyword[0].upper() if keyword else ""
+    return keyword if keyword in _STATEMENT_TYPES else "OTHER"
+
+
+def instrument_engine(engine: Engine):
+    # Times every statement at the cursor level; failed statements are simply not observed
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info.pop("query_started_at", None)
+        if started_at is not None:
+            db_query_latency.observe((_statement_type(statement),), time.perf_counter() - started_at)
+
+
+def timed_pool_class(base: type, name: str) -> type:
+    # A QueuePool subclass whose checkouts are timed under the label `name`. It's a subclass rather
+    # than a pool event because SQLAlchemy only signals checkout once a connection is handed out.
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return base._do_get(self)
+        finally:
+            db_pool_checkout_wait.observe((name,), time.perf_counter() - start)
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
@@ -0,0 +1,194 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import math
+import threading
+
+# Seconds; spans sub-millisecond cache hits up to slow webhook receivers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# An idle pooled connection is handed out in microseconds; the tail reaches pool_timeout
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ShardedMetric(ABC):
+    """Per-thread value shards, so recording never takes a lock.
+
+    Each thread writes only its own shard; a scrape sums all shards. Shards
+    of threads that have exited are folded into ``_retired`` at scrape time,
+    so short-lived pool threads don't accumulate.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    @abstractmethod
+    def _merge(self, into: dict, values: dict):
+        # Adds one shard's series into `into`
+        ...
+
+    def _snapshot(self) -> dict:
+        merged = {}
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._merge(self._retired, values)
+            self._shards = live
+            self._merge(merged, self._retired)
+            for _, values in live:
+                self._merge(merged, dict(values))
+        return merged
+
+
+class Counter(_ShardedMetric):
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        values = self._shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge(self, into: dict, values: dict):
+        for labels, value in values.items():
+            into[labels] = into.get(labels, 0) + value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._snapshot().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_ShardedMetric):
+    """Fixed-bucket histogram; observe() is one bisect and two adds."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        # Shard values: labels -> [per-bucket counts (last one is +Inf), sum]
+        series = self._shard().get(labels)
+        if series is None:
+            series = self._shard()[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _merge(self, into: dict, values: dict):
+        for labels, (counts, total) in values.items():
+            merged = into.get(labels)
+            if merged is None:
+                into[labels] = [list(counts), total]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self._snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class CallbackCollector:
+    # Values read from existing component stats at scrape time, so the hot path pays nothing
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        read: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]],
+        metric_type: str = "gauge",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        self.metric_type = metric_type
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.read():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format, version 0.0.4
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+http_errors = registry.register(Counter(
+    "http_request_errors_total", "HTTP requests that failed with a 5xx or an unhandled exception.", ("method", "route")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")))
+dependency_latency = registry.register(Histogram(
+    "dependency_duration_seconds", "Time spent resolving request dependencies.", ("dependency",)))
+db_query_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time by statement type.", ("statement",)))
+db_pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection.", ("pool",),
+    buckets=POOL_WAIT_BUCKETS))
+webhook_delivery_latency = registry.register(Histogram(
+    "webhook_delivery_duration_seconds", "Webhook delivery latency by outcome.", ("outcome",)))
+webhook_deliveries = registry.register(Counter(
+    "webhook_deliveries_total", "Webhook delivery attempts by outcome.", ("outcome",)))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -44,3 +44,12 @@ class User(Base):
     webhooks = relationship("WebhookSubscription", back_populates="user")
 
 
+class UserRevocation(Base):
+    # Tokens issued to the user up to revoked_at are rejected by every worker; rows only matter
+    # for as long as such a token can live
+    __tablename__ = "user_revocations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    # Epoch seconds, compared directly with a token's iat claim
+    revoked_at = Column(Float, nullable=False, index=True)
@@ -0,0 +1,128 @@
+from concurrent.futures import Future
+from typing import List
+from .rules import CompiledRuleSet
+from .scoring import score_batch
+import logging
+import math
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ANTIFRAUD_MICROBATCH_ENABLED = os.getenv("ANTIFRAUD_MICROBATCH_ENABLED", "false").lower() == "true"
+ANTIFRAUD_MICROBATCH_WINDOW_MS = float(os.getenv("ANTIFRAUD_MICROBATCH_WINDOW_MS", "2"))
+ANTIFRAUD_MICROBATCH_MAX_SIZE = int(os.getenv("ANTIFRAUD_MICROBATCH_MAX_SIZE", "64"))
+
+# Upper bounds of the batch size histogram buckets; the last catches every larger batch
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, math.inf)
+
+
+class MicroBatcher:
+    """Groups concurrent single-transaction scoring calls into one vectorized call.
+
+    A collector thread takes the first waiting request and keeps collecting
+    until ``max_size`` requests are queued or ``window`` seconds have passed
+    since that first request arrived, whichever comes first. The window is
+    measured from arrival, so a lone request never waits longer than the
+    window before it is scored. Requests in a batch are grouped by plan.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch = 0
+        self.size_histogram = dict.fromkeys(_SIZE_BUCKETS, 0)
+
+    def submit(self, plan: CompiledRuleSet, transaction) -> Future:
+        # Resolves once the batch holding this transaction is scored; async callers wrap it
+        future = Future()
+        self._ensure_started()
+        self._queue.put((time.monotonic(), plan, transaction, future))
+        return future
+
+    def score(self, plan: CompiledRuleSet, transaction) -> dict:
+        # Blocking variant for request threads
+        return self.submit(plan, transaction).result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="antifraud-microbatch", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first[0] + self.window
+            stopping = False
+            while len(batch) < self.max_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._score(batch)
+            if stopping:
+                return
+
+    def _score(self, batch: List[tuple]):
+        self._record(len(batch))
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[1]), []).append(item)
+        for items in groups.values():
+            try:
+                results = score_batch(items[0][1], [item[2] for item in items])
+            except Exception as e:
+                logger.error(f"Micro-batch scoring failed: {e}")
+                for item in items:
+                    item[3].set_exception(e)
+                continue
+            for item, result in zip(items, results):
+                item[3].set_result(result)
+
+    def _record(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.max_batch = max(self.max_batch, size)
+        for bound in _SIZE_BUCKETS:
+            if size <= bound:
+                self.size_histogram[bound] += 1
+                break
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "batch_size_histogram": {
+                "le_+Inf" if bound == math.inf else f"le_{bound}": count for bound, count in self.size_histogram.items()
+            },
+        }
+
+
+micro_batcher = MicroBatcher(window=ANTIFRAUD_MICROBATCH_WINDOW_MS / 1000, max_size=ANTIFRAUD_MICROBATCH_MAX_SIZE)
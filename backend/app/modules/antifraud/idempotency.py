@@ -0,0 +1,265 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from fastapi import HTTPException, status
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import TransactionDecision
+import asyncio
+import math
+import os
+import threading
+import time
+
+ANTIFRAUD_IDEMPOTENCY_CACHE_SIZE = int(os.getenv("ANTIFRAUD_IDEMPOTENCY_CACHE_SIZE", "100000"))
+ANTIFRAUD_IDEMPOTENCY_TTL_SECONDS = float(os.getenv("ANTIFRAUD_IDEMPOTENCY_TTL_SECONDS", "600"))
+# How long a duplicate waits for the in-flight original before giving up
+ANTIFRAUD_IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("ANTIFRAUD_IDEMPOTENCY_WAIT_SECONDS", "10"))
+# Transaction ids per lookup query on the batch path
+ANTIFRAUD_IDEMPOTENCY_LOOKUP_CHUNK = 500
+
+
+class DecisionCache:
+    # Bounded LRU of (organization_id, transaction_id) -> response with a TTL
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[str, str], response: dict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class IdempotentScorer:
+    """Returns the original decision for retried transaction ids.
+
+    Lookup order is the in-memory cache, then transaction_decisions, and
+    only then scoring. Concurrent duplicates in this worker wait on the
+    first caller's future rather than scoring again. Duplicates racing
+    across workers are resolved by the table's primary key: the loser
+    discards its result and returns the stored one. ``stored`` (billing
+    and events) only sees decisions this caller actually inserted.
+
+    In-flight entries are thread-safe futures, so duplicates are coalesced
+    even when requests are served by different event loops.
+    """
+
+    def __init__(self, cache: DecisionCache, wait_timeout: float):
+        self.cache = cache
+        self.wait_timeout = wait_timeout
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.replayed = 0
+
+    async def _wait(self, futures: Sequence[Future]) -> List[dict]:
+        # Shielded: a timed-out waiter must not cancel the owner's future
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(asyncio.shield(asyncio.wrap_future(future)) for future in futures)), self.wait_timeout
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with the same transaction_id is still being processed",
+                headers={"Retry-After": str(max(1, math.ceil(self.wait_timeout / 2)))},
+            )
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        organization_id: str,
+        transaction_id: str,
+        score: Callable[[], Awaitable[dict]],
+        stored: Callable[[List[dict]], None],
+    ) -> dict:
+        key = (organization_id, transaction_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.replayed += 1
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self.coalesced += 1
+            return (await self._wait([future]))[0]
+
+        try:
+            response = await self._load(db, key)
+            if response is not None:
+                self.replayed += 1
+            else:
+                response = await self._score_and_store(db, key, score, stored)
+            self.cache.put(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def submit_many(
+        self,
+        db: AsyncSession,
+        organization_id: str,
+        transactions: Sequence,
+        score: Callable[[List], Awaitable[List[dict]]],
+        stored: Callable[[List[dict]], None],
+    ) -> List[dict]:
+        # submit() for a batch: one lookup and one insert for all of it. A transaction_id
+        # repeated within the batch gets the decision of its first occurrence.
+        responses: Dict[str, dict] = {}
+        first = {}
+        for transaction in transactions:
+            first.setdefault(transaction.transaction_id, transaction)
+        for transaction_id in first:
+            cached = self.cache.get((organization_id, transaction_id))
+            if cached is not None:
+                self.replayed += 1
+                responses[transaction_id] = cached
+
+        owned, waiting = {}, {}
+        with self._lock:
+            for transaction_id in first:
+                if transaction_id in responses:
+                    continue
+                key = (organization_id, transaction_id)
+                future = self._inflight.get(key)
+                if future is None:
+                    owned[transaction_id] = self._inflight[key] = Future()
+                else:
+                    waiting[transaction_id] = future
+        self.coalesced += len(waiting)
+
+        # Owned ids are settled before waiting on anyone else's, so two batches never wait on each other
+        try:
+            if owned:
+                loaded = await self._load_many(db, organization_id, list(owned))
+                self.replayed += len(loaded)
+                responses.update(loaded)
+                unscored = [first[transaction_id] for transaction_id in owned if transaction_id not in loaded]
+                if unscored:
+                    responses.update(await self._score_and_store_many(db, organization_id, unscored, score, stored))
+            for transaction_id, future in owned.items():
+                self.cache.put((organization_id, transaction_id), responses[transaction_id])
+                future.set_result(responses[transaction_id])
+        except BaseException as e:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                for transaction_id in owned:
+                    self._inflight.pop((organization_id, transaction_id), None)
+
+        if waiting:
+            responses.update(zip(waiting, await self._wait(list(waiting.values()))))
+        return [responses[transaction.transaction_id] for transaction in transactions]
+
+    async def _load(self, db: AsyncSession, key: Tuple[str, str]) -> Optional[dict]:
+        return await db.scalar(
+            select(TransactionDecision.response).where(
+                TransactionDecision.organization_id == key[0],
+                TransactionDecision.transaction_id == key[1]
+            )
+        )
+
+    async def _load_many(self, db: AsyncSession, organization_id: str, transaction_ids: List[str]) -> Dict[str, dict]:
+        loaded = {}
+        for start in range(0, len(transaction_ids), ANTIFRAUD_IDEMPOTENCY_LOOKUP_CHUNK):
+            rows = await db.execute(
+                select(TransactionDecision.transaction_id, TransactionDecision.response).where(
+                    TransactionDecision.organization_id == organization_id,
+                    TransactionDecision.transaction_id.in_(
+                        transaction_ids[start:start + ANTIFRAUD_IDEMPOTENCY_LOOKUP_CHUNK]
+                    ),
+                )
+            )
+            for transaction_id, response in rows:
+                loaded[transaction_id] = response
+        return loaded
+
+    async def _score_and_store(
+        self,
+        db: AsyncSession,
+        key: Tuple[str, str],
+        score: Callable[[], Awaitable[dict]],
+        stored: Callable[[List[dict]], None],
+    ) -> dict:
+        response = await score()
+        db.add(TransactionDecision(organization_id=key[0], transaction_id=key[1], response=response))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another worker stored this transaction first; its decision wins
+            await db.rollback()
+            self.replayed += 1
+            return await self._load(db, key)
+        stored([response])
+        return response
+
+    async def _score_and_store_many(
+        self,
+        db: AsyncSession,
+        organization_id: str,
+        transactions: List,
+        score: Callable[[List], Awaitable[List[dict]]],
+        stored: Callable[[List[dict]], None],
+    ) -> Dict[str, dict]:
+        responses = dict(zip((transaction.transaction_id for transaction in transactions), await score(transactions)))
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = (
+            dialect.insert(TransactionDecision)
+            .on_conflict_do_nothing(index_elements=["organization_id", "transaction_id"])
+            .returning(TransactionDecision.transaction_id)
+        )
+        inserted = set((await db.execute(stmt, [
+            {"organization_id": organization_id, "transaction_id": transaction_id, "response": response}
+            for transaction_id, response in responses.items()
+        ])).scalars())
+        await db.commit()
+        # Ids another worker stored first keep that worker's decision
+        lost = [transaction_id for transaction_id in responses if transaction_id not in inserted]
+        if lost:
+            self.replayed += len(lost)
+            responses.update(await self._load_many(db, organization_id, lost))
+        stored([responses[transaction_id] for transaction_id in responses if transaction_id in inserted])
+        return responses
+
+
+idempotent_scorer = IdempotentScorer(
+    cache=DecisionCache(ANTIFRAUD_IDEMPOTENCY_CACHE_SIZE, ANTIFRAUD_IDEMPOTENCY_TTL_SECONDS),
+    wait_timeout=ANTIFRAUD_IDEMPOTENCY_WAIT_SECONDS,
+)
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, ForeignKey, DateTime, JSON, Integer
+from sqlalchemy.sql import func
+from ...database import Base
+
+class AntifraudRuleSet(Base):
+    __tablename__ = "antifraud_rule_sets"
+
+    organization_id = Column(String, ForeignKey("organizations.id"), primary_key=True)
+    # Bumped on every update; workers recompile their cached plan when it changes
+    version = Column(Integer, nullable=False, default=1)
+    definition = Column(JSON, nullable=False)  # RuleSetDefinition
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TransactionDecision(Base):
+    # First decision per (organization, transaction_id); retries replay it instead of re-scoring
+    __tablename__ = "transaction_decisions"
+
+    organization_id = Column(String, ForeignKey("organizations.id"), primary_key=True)
+    transaction_id = Column(String, primary_key=True)
+    response = Column(JSON, nullable=False)  # TransactionResponse
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,21 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ...database import get_db
-from ...auth.router import oauth2_scheme
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence, Union
+from ...database import get_async_db, AsyncSessionLocal
+from ...auth.dependencies import get_current_user, get_principal, resolve_credentials
+from ...ratelimit.dependencies import charge_rate_limit, rate_limited_principal
+from ...ratelimit.limiter import rate_limiter, RATE_LIMIT_ENABLED
+from ...auth.principal import Principal
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from datetime import datetime
-from ...api_keys.security import get_api_key
-from ...api_keys.models import APIKey
+from .models import AntifraudRuleSet
+from .rules import RuleSetDefinition, CompiledRuleSet, rule_plan_cache
+from .scoring import score_transaction, score_batch
+from .velocity import velocity_store, VELOCITY_SNAPSHOT_PATH
+from .idempotency import idempotent_scorer
+from .batcher import micro_batcher, ANTIFRAUD_MICROBATCH_ENABLED
+from ...billing.metering import usage_meter
+from ...events.bus import event_bus
+import asyncio
+import json
+import os
+
+ANTIFRAUD_BATCH_MAX_ITEMS = int(os.getenv("ANTIFRAUD_BATCH_MAX_ITEMS", "10000"))
+# Streaming: messages received but not yet answered, per connection; the socket stops being read beyond this
+ANTIFRAUD_STREAM_MAX_PENDING = int(os.getenv("ANTIFRAUD_STREAM_MAX_PENDING", "1024"))
+# Messages scored together when a client sends faster than one at a time
+ANTIFRAUD_STREAM_MAX_BATCH = int(os.getenv("ANTIFRAUD_STREAM_MAX_BATCH", "256"))
+ANTIFRAUD_STREAM_MAX_LINE_BYTES = int(os.getenv("ANTIFRAUD_STREAM_MAX_LINE_BYTES", "65536"))
 
 router = APIRouter()
 
+# Decisions published on the event bus (and so to webhooks); approvals are not
+DECISION_EVENTS = {"BLOCKED": "transaction.blocked", "REVIEW": "transaction.review"}
+
+def _publish_decisions(organization_id: Optional[str], results: Sequence[dict]):
+    for result in results:
+        event_type = DECISION_EVENTS.get(result["decision"])
+        if event_type is not None:
+            event_bus.publish(event_type, organization_id, result)
+
+def _record_decisions(principal: Principal, results: Sequence[dict]):
+    # Billed per stored decision; idempotent replays are free and publish nothing
+    usage_meter.record(principal.organization_id, "antifraud", principal.api_key_id, len(results))
+    _publish_decisions(principal.organization_id, results)
+
+# Lifecycle hooks, called by the app factory when the module is enabled
+
+def startup():
+    if VELOCITY_SNAPSHOT_PATH:
+        velocity_store.load_snapshot(VELOCITY_SNAPSHOT_PATH)
+
+def shutdown():
+    micro_batcher.stop()
+    if VELOCITY_SNAPSHOT_PATH:
+        velocity_store.save_snapshot(VELOCITY_SNAPSHOT_PATH)
+
+def health() -> dict:
+    return {"antifraud_microbatch": micro_batcher.stats()}
+
 class TransactionCreate(BaseModel):
     transaction_id: str
-    amount: float
+    # NaN compares false against every limit, so the rule paths would disagree on it
+    amount: float = Field(..., allow_inf_nan=False)
     currency: str
     merchant: str
     location: str
+    # Optional card/account token; enables per-card velocity features
+    card_id: Optional[str] = None
 
 class TransactionResponse(BaseModel):
     transaction_id: str
@@ -24,27 +78,282 @@ class TransactionResponse(BaseModel):
     reasons: List[str]
 
 @router.post("/transactions/submit", response_model=TransactionResponse)
-def submit_transaction(
+async def submit_transaction(
     transaction: TransactionCreate,
-    # Allow either JWT or API Key. For now, we'll just check if one is present.
-    # In a real app, you might want a unified dependency that returns the user/org from either.
-    token: str = Depends(oauth2_scheme), 
-    # api_key: APIKey = Depends(get_api_key), # Uncomment when ready to test API Key only
-    db: Session = Depends(get_db)
+    # Either a JWT or an X-API-Key identifies the calling organization; charged against its rate limits
+    principal: Principal = Depends(rate_limited_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    async def score():
+        plan = await rule_plan_cache.get(db, principal.organization_id)
+        observed = velocity_store.observe(transaction, principal.organization_id)
+        if ANTIFRAUD_MICROBATCH_ENABLED:
+            return await asyncio.wrap_future(micro_batcher.submit(plan, observed))
+        # A single transaction is a few comparisons; cheaper inline than a threadpool hop
+        return score_transaction(plan, observed)
+
+    if principal.organization_id is None:
+        result = await score()
+        _record_decisions(principal, (result,))
+        return result
+    # Processor retries of the same transaction_id replay the first decision
+    return await idempotent_scorer.submit(
+        db, principal.organization_id, transaction.transaction_id, score,
+        lambda results: _record_decisions(principal, results),
+    )
+
+_transaction_list = TypeAdapter(List[TransactionCreate])
+
+def _parse_batch(body: bytes, content_type: str) -> List[TransactionCreate]:
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            transactions = []
+            for line_number, line in enumerate(body.splitlines(), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    transactions.append(TransactionCreate.model_validate_json(line))
+                except ValidationError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=[
+                            {**err, "loc": ["line", line_number, *err["loc"]]}
+                            for err in e.errors(include_url=False, include_input=False)
+                        ],
+                    )
+                if len(transactions) > ANTIFRAUD_BATCH_MAX_ITEMS:
+                    break
+        else:
+            transactions = _transaction_list.validate_json(body)
+    except ValidationError as e:
+        # Inputs are left out: they may be raw bytes, which the JSON error response cannot carry
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors(include_url=False, include_input=False)
+        )
+
+    if len(transactions) > ANTIFRAUD_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {ANTIFRAUD_BATCH_MAX_ITEMS} transactions"
+        )
+    return transactions
+
+def _score_batch(plan: CompiledRuleSet, principal: Principal, transactions: List[TransactionCreate]) -> List[dict]:
+    # Velocity features are taken in input order, exactly as if submitted one by one
+    observed = [velocity_store.observe(transaction, principal.organization_id) for transaction in transactions]
+    return score_batch(plan, observed)
+
+async def _score_idempotent(
+    db: AsyncSession, plan: CompiledRuleSet, principal: Principal, transactions: List[TransactionCreate]
+) -> List[dict]:
+    # Batch and stream scoring with the same replay rules as /transactions/submit
+    if principal.organization_id is None:
+        results = await run_in_threadpool(_score_batch, plan, principal, transactions)
+        _record_decisions(principal, results)
+        return results
+    return await idempotent_scorer.submit_many(
+        db, principal.organization_id, transactions,
+        lambda unscored: run_in_threadpool(_score_batch, plan, principal, unscored),
+        lambda results: _record_decisions(principal, results),
+    )
+
+@router.post("/transactions/submit/batch", response_model=List[TransactionResponse])
+async def submit_transaction_batch(
+    request: Request,
+    response: Response,
+    principal: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Accepts a JSON array or NDJSON (Content-Type: application/x-ndjson) of TransactionCreate;
+    # decisions come back in input order and match /transactions/submit exactly
+    body = await request.body()
+    # Parsing and vectorized scoring are CPU-bound and stay off the event loop
+    transactions = await run_in_threadpool(_parse_batch, body, request.headers.get("content-type", ""))
+    # Charged per transaction, like the same transactions submitted one by one; a batch above
+    # the burst is not refused but leaves the buckets in debt
+    await charge_rate_limit(response, principal, db, max(1, len(transactions)))
+    plan = await rule_plan_cache.get(db, principal.organization_id)
+    return await _score_idempotent(db, plan, principal, transactions)
+
+def _parse_messages(messages: Sequence[Union[str, bytes]]):
+    # (results with {"error": ...} at invalid messages and None elsewhere, [(index, TransactionCreate)])
+    results = [None] * len(messages)
+    valid = []
+    for index, message in enumerate(messages):
+        try:
+            valid.append((index, TransactionCreate.model_validate_json(message)))
+        except ValidationError as e:
+            results[index] = {"error": e.errors(include_url=False, include_context=False, include_input=False)}
+    return results, valid
+
+async def _score_messages(principal: Principal, messages: Sequence[Union[str, bytes]]) -> List[dict]:
+    # One response per message, in order: a TransactionResponse or {"error": ...} for an invalid message
+    results, valid = await run_in_threadpool(_parse_messages, messages)
+    if not valid:
+        return results
+    try:
+        # Short-lived session: a stream can stay open for hours and must not pin a pooled connection
+        async with AsyncSessionLocal() as db:
+            plan = await rule_plan_cache.get(db, principal.organization_id)
+            scored = await _score_idempotent(db, plan, principal, [transaction for _, transaction in valid])
+    except HTTPException as e:
+        # A duplicate still in flight elsewhere; the client retries these messages later
+        scored = [{"error": e.detail, "transaction_id": transaction.transaction_id} for _, transaction in valid]
+    for (index, _), result in zip(valid, scored):
+        results[index] = result
+    return results
+
+async def _check_rate_limit(principal: Principal, cost: int):
+    async with AsyncSessionLocal() as db:
+        return await rate_limiter.check(db, principal.organization_id, principal.api_key_id, cost)
+
+async def _pace(principal: Principal, cost: int):
+    # Streams are paced rather than rejected: scoring waits until the caller's buckets allow `cost`
+    if not RATE_LIMIT_ENABLED:
+        return
+    while True:
+        decision = await _check_rate_limit(principal, cost)
+        if decision is None or decision.allowed:
+            return
+        await asyncio.sleep(decision.retry_after)
+
+async def _authenticate_websocket(websocket: WebSocket) -> Principal:
+    # Browsers cannot set headers on a WebSocket handshake, so query parameters are accepted too
+    api_key = websocket.headers.get("x-api-key") or websocket.query_params.get("api_key")
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    async with AsyncSessionLocal() as db:
+        return await resolve_credentials(api_key, token, db)
+
+# Queued by the socket reader after a disconnect; never a valid message
+_CLOSED = object()
+
+@router.websocket("/transactions/stream")
+async def stream_transactions(websocket: WebSocket):
+    # Authenticates once at the handshake, then each message is a TransactionCreate
+    # and is answered by a TransactionResponse carrying the same transaction_id
+    try:
+        principal = await _authenticate_websocket(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    # Bounded: when scoring or the client's reads fall behind, the reader blocks and
+    # stops draining the socket, so backpressure reaches the client through TCP
+    pending = asyncio.Queue(maxsize=ANTIFRAUD_STREAM_MAX_PENDING)
+
+    async def read():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await pending.put(_CLOSED)
+                return
+            # Text or binary frames, each holding one JSON object; an empty frame is just an invalid message
+            data = message.get("text")
+            await pending.put(data if data is not None else message.get("bytes") or b"")
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            messages = [await pending.get()]
+            while len(messages) < ANTIFRAUD_STREAM_MAX_BATCH and not pending.empty():
+                messages.append(pending.get_nowait())
+            closed = messages[-1] is _CLOSED
+            if closed:
+                messages.pop()
+            if messages:
+                await _pace(principal, len(messages))
+                results = await _score_messages(principal, messages)
+                for result in results:
+                    await websocket.send_text(json.dumps(result))
+            if closed:
+                return
+    except (WebSocketDisconnect, RuntimeError):
+        # Client went away while responses were being sent
+        pass
+    finally:
+        reader.cancel()
+
+class _DuplexStreamingResponse(StreamingResponse):
+    # The body generator consumes the request stream itself, so Starlette's disconnect
+    # listener must not compete with it for receive(); disconnects surface as ClientDisconnect
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@router.post("/transactions/stream")
+async def stream_transactions_ndjson(
+    request: Request,
+    principal: Principal = Depends(rate_limited_principal)
 ):
-    # Mock logic for now, integrating existing logic would go here
-    risk_score = 150  # Low risk
-    decision = "APPROVED"
-    reasons = []
-
-    if transaction.amount > 10000:
-        risk_score = 850
-        decision = "BLOCKED"
-        reasons.append("High transaction amount")
-
-    return {
-        "transaction_id": transaction.transaction_id,
-        "decision": decision,
-        "risk_score": risk_score,
-        "reasons": reasons
-    }
+    # NDJSON in, NDJSON out over one long-lived request. The body is only read as fast as
+    # responses are written, so a slow reader throttles the sender instead of filling memory.
+    async def results():
+        buffer = b""
+        try:
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                if len(buffer) > ANTIFRAUD_STREAM_MAX_LINE_BYTES:
+                    yield json.dumps({"error": f"Line exceeds {ANTIFRAUD_STREAM_MAX_LINE_BYTES} bytes"}) + "\n"
+                    return
+                lines = [line for line in lines if line.strip()]
+                for start in range(0, len(lines), ANTIFRAUD_STREAM_MAX_BATCH):
+                    await _pace(principal, len(lines[start:start + ANTIFRAUD_STREAM_MAX_BATCH]))
+                    scored = await _score_messages(principal, lines[start:start + ANTIFRAUD_STREAM_MAX_BATCH])
+                    yield "".join(json.dumps(result) + "\n" for result in scored)
+        except ClientDisconnect:
+            return
+        if buffer.strip():
+            await _pace(principal, 1)
+            scored = await _score_messages(principal, [buffer])
+            yield json.dumps(scored[0]) + "\n"
+
+    return _DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+class RuleSetResponse(BaseModel):
+    version: int
+    definition: RuleSetDefinition
+
+@router.get("/rules", response_model=RuleSetResponse)
+async def get_rules(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    rule_set = await db.scalar(
+        select(AntifraudRuleSet).where(AntifraudRuleSet.organization_id == current_user.organization_id)
+    )
+    if not rule_set:
+        return {"version": 0, "definition": rule_plan_cache.default_plan.definition}
+    return {"version": rule_set.version, "definition": rule_set.definition}
+
+@router.put("/rules", response_model=RuleSetResponse)
+async def update_rules(
+    definition: RuleSetDefinition,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role not in ("org_admin", "super_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to change rules")
+    # Compile up front so a broken rule set is rejected instead of stored
+    CompiledRuleSet(definition)
+
+    rule_set = await db.scalar(
+        select(AntifraudRuleSet).where(AntifraudRuleSet.organization_id == current_user.organization_id)
+    )
+    if rule_set:
+        rule_set.version += 1
+        rule_set.definition = definition.model_dump()
+    else:
+        rule_set = AntifraudRuleSet(
+            organization_id=current_user.organization_id,
+            version=1,
+            definition=definition.model_dump()
+        )
+        db.add(rule_set)
+    await db.commit()
+    # Other workers pick the new version up within ANTIFRAUD_RULES_RELOAD_SECONDS
+    rule_plan_cache.invalidate(current_user.organization_id)
+    return {"version": rule_set.version, "definition": rule_set.definition}
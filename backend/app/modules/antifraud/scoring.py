@@ -0,0 +1,25 @@
+from typing import List, Sequence
+from .rules import CompiledRuleSet
+
+
+def score_transaction(plan: CompiledRuleSet, transaction) -> dict:
+    decision, risk_score, reasons = plan.evaluate(transaction)
+    return {
+        "transaction_id": transaction.transaction_id,
+        "decision": decision,
+        "risk_score": risk_score,
+        "reasons": reasons
+    }
+
+
+def score_batch(plan: CompiledRuleSet, transactions: Sequence) -> List[dict]:
+    # Columnar evaluation of the same plan as score_transaction; results keep input order
+    return [
+        {
+            "transaction_id": transaction.transaction_id,
+            "decision": decision,
+            "risk_score": risk_score,
+            "reasons": reasons,
+        }
+        for transaction, (decision, risk_score, reasons) in zip(transactions, plan.evaluate_batch(transactions))
+    ]
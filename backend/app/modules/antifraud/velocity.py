@@ -0,0 +1,264 @@
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional
+import json
+import logging
+import math
+import numpy as np
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+VELOCITY_MAX_ENTITIES = int(os.getenv("VELOCITY_MAX_ENTITIES", "100000"))
+# Entities idle for longer than the widest window carry no signal and are evicted
+VELOCITY_IDLE_SECONDS = float(os.getenv("VELOCITY_IDLE_SECONDS", str(24 * 60 * 60)))
+VELOCITY_MAX_LOCATIONS = int(os.getenv("VELOCITY_MAX_LOCATIONS", "64"))
+VELOCITY_SNAPSHOT_PATH = os.getenv("VELOCITY_SNAPSHOT_PATH", "")
+
+# Feature names exposed to the rule engine
+VELOCITY_FEATURES = (
+    "card_tx_count_1m",
+    "card_amount_1h",
+    "card_distinct_locations_24h",
+    "merchant_tx_count_1m",
+    "merchant_amount_1h",
+    "merchant_distinct_locations_24h",
+)
+
+
+class SlidingCounter:
+    """Ring of fixed-width time buckets with a running total.
+
+    Advancing the clock expires whole buckets and subtracts them from the
+    total, so add() and total() are amortized O(1) regardless of traffic.
+    Buckets are a flat array of doubles rather than a list of float objects.
+    """
+
+    __slots__ = ("bucket_seconds", "buckets", "head", "head_bucket", "running")
+
+    def __init__(self, buckets: int, bucket_seconds: float):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = array("d", bytes(8 * buckets))
+        self.head = 0
+        self.head_bucket = None
+        self.running = 0.0
+
+    def _advance(self, now: float):
+        bucket = int(now // self.bucket_seconds)
+        if self.head_bucket is None:
+            self.head_bucket = bucket
+            return
+        steps = bucket - self.head_bucket
+        if steps <= 0:
+            return
+        size = len(self.buckets)
+        if steps >= size:
+            self.buckets = array("d", bytes(8 * size))
+            self.running = 0.0
+            self.head = 0
+        else:
+            for _ in range(steps):
+                self.head = (self.head + 1) % size
+                self.running -= self.buckets[self.head]
+                self.buckets[self.head] = 0.0
+        self.head_bucket = bucket
+
+    def add(self, now: float, value: float = 1.0):
+        self._advance(now)
+        self.buckets[self.head] += value
+        self.running += value
+
+    def total(self, now: float) -> float:
+        self._advance(now)
+        return self.running
+
+
+class EntityState:
+    __slots__ = ("tx_count_1m", "amount_1h", "locations", "last_seen")
+
+    def __init__(self):
+        self.tx_count_1m = SlidingCounter(buckets=60, bucket_seconds=1)
+        self.amount_1h = SlidingCounter(buckets=60, bucket_seconds=60)
+        # location -> last seen, oldest first; len() is the distinct count once expired entries are pruned
+        self.locations = OrderedDict()
+        self.last_seen = 0.0
+
+    def observe(self, now: float, amount: float, location: str):
+        self.tx_count_1m.add(now)
+        self.amount_1h.add(now, amount)
+        self.locations[location] = now
+        self.locations.move_to_end(location)
+        while len(self.locations) > VELOCITY_MAX_LOCATIONS:
+            self.locations.popitem(last=False)
+        self.last_seen = now
+
+    def distinct_locations(self, now: float) -> int:
+        cutoff = now - 24 * 60 * 60
+        while self.locations:
+            location, seen = next(iter(self.locations.items()))
+            if seen > cutoff:
+                break
+            del self.locations[location]
+        return len(self.locations)
+
+
+class FeatureView:
+    # Transaction fields plus velocity features, as one attribute namespace for the rule engine
+    __slots__ = ("transaction", "features")
+
+    def __init__(self, transaction, features: Dict[str, float]):
+        self.transaction = transaction
+        self.features = features
+
+    def __getattr__(self, name):
+        if name in self.features:
+            return self.features[name]
+        return getattr(self.transaction, name)
+
+
+_EMPTY_FEATURES = dict.fromkeys(VELOCITY_FEATURES, 0)
+_CARD_FEATURES = ("card",) + VELOCITY_FEATURES[:3]
+_MERCHANT_FEATURES = ("merchant",) + VELOCITY_FEATURES[3:]
+# EntityState counters stored in snapshots
+_COUNTERS = ("tx_count_1m", "amount_1h")
+
+
+class VelocityStore:
+    """In-process sliding-window counters keyed by card and merchant.
+
+    Memory is bounded by an LRU over entities; idle entities are evicted
+    from the cold end as new ones arrive. Snapshots let a restarted worker
+    resume with warm windows.
+    """
+
+    def __init__(self, max_entities: int, idle_seconds: float):
+        self.max_entities = max_entities
+        self.idle_seconds = idle_seconds
+        self._entities = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entities)
+
+    def _entity(self, key, now: float) -> EntityState:
+        state = self._entities.get(key)
+        if state is not None:
+            self._entities.move_to_end(key)
+            return state
+        # Only inserts can grow memory, so that's where the cold end gets trimmed
+        while self._entities:
+            oldest_key, oldest = next(iter(self._entities.items()))
+            if len(self._entities) < self.max_entities and now - oldest.last_seen < self.idle_seconds:
+                break
+            del self._entities[oldest_key]
+        state = self._entities[key] = EntityState()
+        return state
+
+    def observe(self, transaction, namespace: Optional[str] = None, now: Optional[float] = None) -> FeatureView:
+        # Records the transaction and returns features that include it.
+        # `namespace` (the organization) keeps tenants' counters apart.
+        now = time.time() if now is None else now
+        # A NaN or infinite amount would poison the running totals for the whole window
+        if not math.isfinite(transaction.amount):
+            raise ValueError(f"Transaction amount must be finite, got {transaction.amount}")
+        features = dict(_EMPTY_FEATURES)
+        with self._lock:
+            for (prefix, count_name, amount_name, locations_name), key in (
+                (_CARD_FEATURES, getattr(transaction, "card_id", None)),
+                (_MERCHANT_FEATURES, transaction.merchant),
+            ):
+                if not key:
+                    continue
+                state = self._entity((namespace, prefix, key), now)
+                state.observe(now, transaction.amount, transaction.location)
+                features[count_name] = int(state.tx_count_1m.running)
+                features[amount_name] = state.amount_1h.running
+                features[locations_name] = state.distinct_locations(now)
+        return FeatureView(transaction, features)
+
+    def clear(self):
+        with self._lock:
+            self._entities.clear()
+
+    def save_snapshot(self, path: str):
+        # Plain numpy arrays, so loading a snapshot never executes code from the file
+        keys, last_seen, location_counts, location_names, location_seen = [], [], [], [], []
+        counters = {name: ([], [], []) for name in _COUNTERS}
+        with self._lock:
+            for key, state in self._entities.items():
+                keys.append(json.dumps(key))
+                last_seen.append(state.last_seen)
+                location_counts.append(len(state.locations))
+                location_names.extend(state.locations)
+                location_seen.extend(state.locations.values())
+                for name, (buckets, positions, running) in counters.items():
+                    counter = getattr(state, name)
+                    buckets.append(np.frombuffer(counter.buckets))
+                    positions.append((counter.head, -1 if counter.head_bucket is None else counter.head_bucket))
+                    running.append(counter.running)
+        arrays = {}
+        for name, (buckets, positions, running) in counters.items():
+            width = len(getattr(EntityState(), name).buckets)
+            arrays[f"{name}_buckets"] = np.array(buckets, dtype=np.float64).reshape(-1, width)
+            arrays[f"{name}_position"] = np.array(positions, dtype=np.int64).reshape(-1, 2)
+            arrays[f"{name}_running"] = np.array(running, dtype=np.float64)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                keys=np.array(keys, dtype=str),
+                last_seen=np.array(last_seen, dtype=np.float64),
+                location_counts=np.array(location_counts, dtype=np.int64),
+                location_names=np.array(location_names, dtype=str),
+                location_seen=np.array(location_seen, dtype=np.float64),
+                **arrays,
+            )
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: str) -> bool:
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            entities = OrderedDict()
+            with np.load(path, allow_pickle=False) as data:
+                location_offsets = np.concatenate(([0], np.cumsum(data["location_counts"]))).tolist()
+                location_names = data["location_names"].tolist()
+                location_seen = data["location_seen"].tolist()
+                counters = {
+                    name: (
+                        data[f"{name}_buckets"].astype(np.float64),
+                        data[f"{name}_position"].tolist(),
+                        data[f"{name}_running"].astype(np.float64),
+                    )
+                    for name in _COUNTERS
+                }
+                if not all(np.isfinite(buckets).all() and np.isfinite(running).all() for buckets, _, running in counters.values()):
+                    raise ValueError("non-finite counter values")
+                for row, (key, last_seen) in enumerate(zip(data["keys"].tolist(), data["last_seen"].tolist())):
+                    state = EntityState()
+                    for name, (buckets, positions, running) in counters.items():
+                        counter = getattr(state, name)
+                        if len(buckets[row]) != len(counter.buckets):
+                            raise ValueError(f"{name} has {len(buckets[row])} buckets, expected {len(counter.buckets)}")
+                        counter.buckets = array("d", buckets[row].tobytes())
+                        counter.head, head_bucket = positions[row]
+                        if not 0 <= counter.head < len(counter.buckets):
+                            raise ValueError(f"{name} head {counter.head} is out of range")
+                        counter.head_bucket = None if head_bucket < 0 else head_bucket
+                        counter.running = float(running[row])
+                    start, end = location_offsets[row], location_offsets[row + 1]
+                    state.locations = OrderedDict(zip(location_names[start:end], location_seen[start:end]))
+                    state.last_seen = last_seen
+                    entities[tuple(json.loads(key))] = state
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable velocity snapshot {path}: {e}")
+            return False
+        with self._lock:
+            self._entities = entities
+        logger.info(f"Loaded velocity snapshot with {len(entities)} entities")
+        return True
+
+
+velocity_store = VelocityStore(max_entities=VELOCITY_MAX_ENTITIES, idle_seconds=VELOCITY_IDLE_SECONDS)
@@ -0,0 +1,70 @@
+from typing import NamedTuple, Optional, Tuple
+import asyncio
+import os
+import random
+
+# Local stand-in for the telephony provider; real trunks plug in behind the same dial() call
+BANKCALL_SIM_ANSWER_RATE = float(os.getenv("BANKCALL_SIM_ANSWER_RATE", "0.6"))
+BANKCALL_SIM_BUSY_RATE = float(os.getenv("BANKCALL_SIM_BUSY_RATE", "0.1"))
+BANKCALL_SIM_FAILURE_RATE = float(os.getenv("BANKCALL_SIM_FAILURE_RATE", "0.02"))
+BANKCALL_SIM_TALK_SECONDS = float(os.getenv("BANKCALL_SIM_TALK_SECONDS", "60"))
+# Simulated time runs this much faster than real time (e.g. 0.01 replays a 60 s call in 0.6 s)
+BANKCALL_SIM_TIME_SCALE = float(os.getenv("BANKCALL_SIM_TIME_SCALE", "1.0"))
+
+
+class DialResult(NamedTuple):
+    outcome: str  # answered, no_answer, busy, failed
+    # Seconds connected; 0 unless answered
+    duration: float = 0.0
+
+
+class SimulatedDialer:
+    """Dials nobody: rings, then answers, stays busy or fails at configured rates.
+
+    Durations are reported in simulated seconds while the coroutine sleeps
+    them scaled by ``time_scale``, so the scheduler's pacing, caps and
+    fairness can be exercised offline and faster than real time.
+    """
+
+    def __init__(
+        self,
+        answer_rate: float,
+        busy_rate: float,
+        failure_rate: float,
+        talk_seconds: float,
+        time_scale: float,
+        ring_seconds: Tuple[float, float] = (5.0, 25.0),
+        seed: Optional[int] = None,
+    ):
+        self.answer_rate = answer_rate
+        self.busy_rate = busy_rate
+        self.failure_rate = failure_rate
+        self.talk_seconds = talk_seconds
+        self.time_scale = time_scale
+        self.ring_seconds = ring_seconds
+        self._random = random.Random(seed)
+
+    async def dial(self, phone_number: str, trunk: int) -> DialResult:
+        draw = self._random.random()
+        ring = self._random.uniform(*self.ring_seconds)
+        if draw < self.failure_rate:
+            await asyncio.sleep(0.5 * self.time_scale)
+            return DialResult("failed")
+        if draw < self.failure_rate + self.busy_rate:
+            await asyncio.sleep(2.0 * self.time_scale)
+            return DialResult("busy")
+        if draw < self.failure_rate + self.busy_rate + self.answer_rate:
+            talk = self._random.expovariate(1 / self.talk_seconds)
+            await asyncio.sleep((ring / 2 + talk) * self.time_scale)
+            return DialResult("answered", talk)
+        await asyncio.sleep(ring * self.time_scale)
+        return DialResult("no_answer")
+
+
+simulated_dialer = SimulatedDialer(
+    answer_rate=BANKCALL_SIM_ANSWER_RATE,
+    busy_rate=BANKCALL_SIM_BUSY_RATE,
+    failure_rate=BANKCALL_SIM_FAILURE_RATE,
+    talk_seconds=BANKCALL_SIM_TALK_SECONDS,
+    time_scale=BANKCALL_SIM_TIME_SCALE,
+)
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Float, Index
+from sqlalchemy.sql import func
+from ...database import Base
+from datetime import datetime
+import uuid
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+class BankCall(Base):
+    # Outbound call queue and history; the scheduler claims queued rows and records every attempt
+    __tablename__ = "bankcall_calls"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    organization_id = Column(String, ForeignKey("organizations.id"), nullable=False)
+    phone_number = Column(String, nullable=False)
+    scenario_id = Column(String, nullable=False)
+    customer_name = Column(String, nullable=False)
+    # Higher is dialed first; equal priorities are dialed oldest first
+    priority = Column(Integer, nullable=False, default=5)
+    # queued -> scheduled -> dialing -> completed | unanswered | failed; retries go back to scheduled
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    last_outcome = Column(String, nullable=True)  # answered, no_answer, busy, failed
+    duration_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Claiming queued calls in dialing order
+        Index("ix_bankcall_calls_status_priority_created", "status", "priority", "created_at"),
+        # Queue depth by priority for start time estimates
+        Index("ix_bankcall_calls_status_priority", "status", "priority", "organization_id"),
+    )
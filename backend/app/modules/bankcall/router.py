@@ -1,31 +1,165 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from ...auth.router import oauth2_scheme
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from ...database import get_async_db
+from ...ratelimit.dependencies import rate_limited_principal
+from ...auth.principal import Principal
+from ...billing.metering import usage_meter
+from ...ratelimit.limiter import rate_limiter
+from .models import BankCall
+from .scheduler import call_scheduler, estimate_wait_seconds, BANKCALL_SCHEDULER_IN_APP, IN_FLIGHT_STATUS, PENDING_STATUSES
+import os
+import time
+
+# Queue depth used for estimated start times is re-counted at most this often per worker
+BANKCALL_QUEUE_DEPTH_REFRESH_SECONDS = float(os.getenv("BANKCALL_QUEUE_DEPTH_REFRESH_SECONDS", "1"))
 
 router = APIRouter()
 
+# Lifecycle hooks, called by the app factory when the module is enabled
+
+def startup():
+    if BANKCALL_SCHEDULER_IN_APP:
+        call_scheduler.start()
+
+async def shutdown():
+    await call_scheduler.stop()
+
+def health() -> dict:
+    return {"bankcall_scheduler": call_scheduler.stats() if call_scheduler.running else None}
+
 class CallInitiate(BaseModel):
     phone_number: str
     scenario_id: str
     customer_name: str
+    # 1-10, higher is dialed first
+    priority: int = Field(5, ge=1, le=10)
 
 class CallResponse(BaseModel):
     call_id: str
     status: str
     estimated_start_time: str
 
-from ...api_keys.security import get_api_key
-from ...api_keys.models import APIKey
+class CallStatusResponse(BaseModel):
+    call_id: str
+    status: str
+    priority: int
+    attempts: int
+    last_outcome: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    created_at: datetime
+    next_attempt_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class QueueDepth:
+    """Due calls by organization and priority, and calls on the line, as of the last refresh.
+
+    One grouped count per refresh interval keeps the cost of estimates flat
+    however fast calls are enqueued; calls this worker enqueues in between
+    are added locally. Retries scheduled for later are not counted: they
+    are not dialed ahead of anything that is due now.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._counts: Dict[str, Dict[int, int]] = {}
+        self._totals: Dict[int, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._expires = 0.0
+
+    async def _refresh(self, db: AsyncSession):
+        counts, totals, in_flight = {}, {}, {}
+        rows = await db.execute(
+            select(BankCall.organization_id, BankCall.priority, BankCall.status, func.count())
+            .where(or_(
+                BankCall.status == IN_FLIGHT_STATUS,
+                BankCall.status.in_(PENDING_STATUSES)
+                & or_(BankCall.next_attempt_at.is_(None), BankCall.next_attempt_at <= datetime.utcnow()),
+            ))
+            .group_by(BankCall.organization_id, BankCall.priority, BankCall.status)
+        )
+        for row_organization_id, row_priority, row_status, count in rows:
+            if row_status == IN_FLIGHT_STATUS:
+                in_flight[row_organization_id] = in_flight.get(row_organization_id, 0) + count
+                continue
+            per_priority = counts.setdefault(row_organization_id, {})
+            per_priority[row_priority] = per_priority.get(row_priority, 0) + count
+            totals[row_priority] = totals.get(row_priority, 0) + count
+        self._counts, self._totals, self._in_flight = counts, totals, in_flight
+        self._expires = time.monotonic() + self.refresh_seconds
+
+    async def ahead(self, db: AsyncSession, organization_id: str, priority: int) -> Tuple[int, int, int]:
+        # (the organization's, everyone's) due calls that will be dialed before one of `priority`,
+        # and the organization's calls on the line
+        if time.monotonic() >= self._expires:
+            await self._refresh(db)
+        organization_ahead = sum(
+            count for row_priority, count in self._counts.get(organization_id, {}).items() if row_priority >= priority
+        )
+        total_ahead = sum(count for row_priority, count in self._totals.items() if row_priority >= priority)
+        return organization_ahead, total_ahead, self._in_flight.get(organization_id, 0)
+
+    def added(self, organization_id: str, priority: int):
+        per_priority = self._counts.setdefault(organization_id, {})
+        per_priority[priority] = per_priority.get(priority, 0) + 1
+        self._totals[priority] = self._totals.get(priority, 0) + 1
+
+queue_depth = QueueDepth(BANKCALL_QUEUE_DEPTH_REFRESH_SECONDS)
 
 @router.post("/calls/initiate", response_model=CallResponse)
-def initiate_call(
+async def initiate_call(
     call_data: CallInitiate,
-    token: str = Depends(oauth2_scheme),
-    # api_key: APIKey = Depends(get_api_key)
+    # Either a JWT or an X-API-Key identifies the organization that is billed for the call
+    principal: Principal = Depends(rate_limited_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if principal.organization_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Calls must belong to an organization")
+    usage_meter.record(principal.organization_id, "bankcall", principal.api_key_id)
+    organization_ahead, total_ahead, in_flight = await queue_depth.ahead(db, principal.organization_id, call_data.priority)
+    tier = await rate_limiter.tier(db, principal.organization_id)
+    # The scheduler claims the row on its next poll
+    call = BankCall(
+        organization_id=principal.organization_id,
+        phone_number=call_data.phone_number,
+        scenario_id=call_data.scenario_id,
+        customer_name=call_data.customer_name,
+        priority=call_data.priority,
+    )
+    db.add(call)
+    await db.commit()
+    queue_depth.added(principal.organization_id, call_data.priority)
+    wait = estimate_wait_seconds(tier, organization_ahead, total_ahead, in_flight)
+    return {
+        "call_id": call.id,
+        "status": call.status,
+        "estimated_start_time": (datetime.utcnow() + timedelta(seconds=wait)).isoformat(),
+    }
+
+@router.get("/calls/{call_id}", response_model=CallStatusResponse)
+async def get_call(
+    call_id: str,
+    principal: Principal = Depends(rate_limited_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Mock logic for BankCall
+    call = await db.scalar(
+        select(BankCall).where(BankCall.id == call_id, BankCall.organization_id == principal.organization_id)
+    )
+    if call is None:
+        raise HTTPException(status_code=404, detail="Call not found")
     return {
-        "call_id": "call_12345",
-        "status": "initiated",
-        "estimated_start_time": "Now"
+        "call_id": call.id,
+        "status": call.status,
+        "priority": call.priority,
+        "attempts": call.attempts,
+        "last_outcome": call.last_outcome,
+        "duration_seconds": call.duration_seconds,
+        "created_at": call.created_at,
+        "next_attempt_at": call.next_attempt_at,
+        "started_at": call.started_at,
+        "completed_at": call.completed_at,
     }
@@ -0,0 +1,558 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, select, text, update
+from ...database import SessionLocal, get_engine
+from ... import models  # noqa: F401  (registers Organization/User for relationship resolution)
+from ...models import Organization
+from ...events.bus import event_bus
+from .dialer import simulated_dialer, DialResult
+from .models import BankCall
+import asyncio
+import fcntl
+import heapq
+import json
+import logging
+import os
+import random
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+# tier -> calls one organization may have on the line at once
+DEFAULT_TIER_CONCURRENCY = {"starter": 5, "business": 50, "enterprise": 300}
+BANKCALL_TIER_CONCURRENCY = json.loads(os.getenv("BANKCALL_TIER_CONCURRENCY", "null")) or DEFAULT_TIER_CONCURRENCY
+# Organizations without a subscription tier are capped like starter, as for rate limits
+DEFAULT_TIER = "starter"
+BANKCALL_TRUNKS = int(os.getenv("BANKCALL_TRUNKS", "8"))
+# Dialer pacing: new calls per second each trunk may start, and calls it can carry at once
+BANKCALL_TRUNK_CPS = float(os.getenv("BANKCALL_TRUNK_CPS", "10"))
+BANKCALL_TRUNK_CHANNELS = int(os.getenv("BANKCALL_TRUNK_CHANNELS", "120"))
+BANKCALL_MAX_ATTEMPTS = int(os.getenv("BANKCALL_MAX_ATTEMPTS", "3"))
+BANKCALL_RETRY_BASE_SECONDS = float(os.getenv("BANKCALL_RETRY_BASE_SECONDS", "600"))
+BANKCALL_RETRY_MAX_SECONDS = float(os.getenv("BANKCALL_RETRY_MAX_SECONDS", "14400"))
+# Average time one attempt holds a channel, ringing included; used for start time estimates
+BANKCALL_AVG_CALL_SECONDS = float(os.getenv("BANKCALL_AVG_CALL_SECONDS", "60"))
+BANKCALL_POLL_SECONDS = float(os.getenv("BANKCALL_POLL_SECONDS", "1"))
+# Calls claimed per poll, and held in memory by the scheduler; the rest wait in the table
+BANKCALL_CLAIM_BATCH = int(os.getenv("BANKCALL_CLAIM_BATCH", "1000"))
+BANKCALL_MAX_BACKLOG = int(os.getenv("BANKCALL_MAX_BACKLOG", "50000"))
+# Run the scheduler inside the API processes; one of them wins the lock and dials
+BANKCALL_SCHEDULER_IN_APP = os.getenv("BANKCALL_SCHEDULER_IN_APP", "false").lower() == "true"
+BANKCALL_SCHEDULER_LOCK = os.getenv("BANKCALL_SCHEDULER_LOCK", "./bankcall_scheduler.lock")
+
+# Waiting to be dialed, as counted for start time estimates (once due)
+PENDING_STATUSES = ("queued", "scheduled")
+# On the line, holding one of the organization's concurrent call slots
+IN_FLIGHT_STATUS = "dialing"
+# Outcomes worth another attempt later
+RETRYABLE_OUTCOMES = ("no_answer", "busy", "failed")
+
+
+def tier_concurrency(tier: Optional[str]) -> int:
+    return BANKCALL_TIER_CONCURRENCY.get(tier) or BANKCALL_TIER_CONCURRENCY[DEFAULT_TIER]
+
+
+def dial_rate() -> float:
+    # Calls per second the trunks can sustain: bounded by pacing, and by channels freeing up
+    return BANKCALL_TRUNKS * min(BANKCALL_TRUNK_CPS, BANKCALL_TRUNK_CHANNELS / BANKCALL_AVG_CALL_SECONDS)
+
+
+def estimate_wait_seconds(
+    tier: Optional[str], organization_ahead: int, total_ahead: int, organization_in_flight: int = 0
+) -> float:
+    """Seconds until a call with the given queue depth ahead of it is dialed.
+
+    The organization's cap lets it dial its queue in waves of `cap` calls, each
+    lasting about one call, and calls already on the line hold slots of the
+    first wave; across organizations the trunks drain the queue at
+    dial_rate(). The slower of the two decides.
+    """
+    waves = (organization_ahead + organization_in_flight) // tier_concurrency(tier)
+    return max(waves * BANKCALL_AVG_CALL_SECONDS, total_ahead / dial_rate())
+
+
+def _epoch(value: datetime) -> float:
+    # Naive datetimes in the database are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def retry_delay(attempts: int, base: float, maximum: float) -> float:
+    # Exponential backoff with equal jitter, as for webhook retries
+    delay = min(maximum, base * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class QueuedCall:
+    __slots__ = ("id", "organization_id", "phone_number", "priority", "attempts", "sequence", "payload")
+
+    def __init__(self, id: str, organization_id: str, phone_number: str, priority: int, attempts: int, payload: dict):
+        self.id = id
+        self.organization_id = organization_id
+        self.phone_number = phone_number
+        self.priority = priority
+        self.attempts = attempts
+        # Arrival order within a priority; kept across retries
+        self.sequence = 0
+        # scenario_id and customer_name, passed through to the call.completed event
+        self.payload = payload
+
+
+class _Trunk:
+    __slots__ = ("index", "in_use", "next_slot")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.in_use = 0
+        # Monotonic time before which this trunk may not start another call
+        self.next_slot = 0.0
+
+
+class SqlCallStore:
+    """The bankcall_calls table as seen by the scheduler.
+
+    Only the scheduler holding the lock reads or changes scheduled and
+    dialing rows, so claims are plain conditional updates.
+    """
+
+    def recover(self) -> int:
+        # Calls a previous scheduler had claimed or was dialing go back to the queue
+        with SessionLocal() as db:
+            result = db.execute(
+                update(BankCall).where(BankCall.status.in_(("scheduled", "dialing"))).values(status="queued")
+            )
+            db.commit()
+            return result.rowcount
+
+    def claim(self, limit: int) -> List[Tuple[QueuedCall, Optional[str], Optional[datetime]]]:
+        # Highest-priority, then oldest, queued calls with their organization's tier and retry time
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(
+                    BankCall.id, BankCall.organization_id, BankCall.phone_number, BankCall.scenario_id,
+                    BankCall.customer_name, BankCall.priority, BankCall.attempts, BankCall.next_attempt_at,
+                    Organization.subscription_tier,
+                )
+                .join(Organization, Organization.id == BankCall.organization_id)
+                .where(BankCall.status == "queued")
+                .order_by(BankCall.priority.desc(), BankCall.created_at)
+                .limit(limit)
+            ).all()
+            if not rows:
+                return []
+            db.execute(
+                update(BankCall).where(BankCall.id.in_([row.id for row in rows]), BankCall.status == "queued")
+                .values(status="scheduled")
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        return [
+            (
+                QueuedCall(
+                    row.id, row.organization_id, row.phone_number, row.priority, row.attempts,
+                    {"scenario_id": row.scenario_id, "customer_name": row.customer_name},
+                ),
+                row.subscription_tier,
+                row.next_attempt_at,
+            )
+            for row in rows
+        ]
+
+    def save(self, updates: Dict[str, dict]):
+        # One executemany per distinct set of changed columns
+        groups = {}
+        for call_id, values in updates.items():
+            groups.setdefault(tuple(sorted(values)), []).append({"call_id": call_id, **values})
+        with SessionLocal() as db:
+            for columns, params in groups.items():
+                db.execute(
+                    update(BankCall.__table__)
+                    .where(BankCall.__table__.c.id == bindparam("call_id"))
+                    .values({column: bindparam(column) for column in columns}),
+                    params,
+                )
+            db.commit()
+
+
+class SchedulerLock:
+    # Host-local file lock plus, on PostgreSQL, a session advisory lock, so one scheduler dials per deployment
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._connection = None
+
+    def acquire(self) -> bool:
+        lock_file = open(self.path, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        connection = get_engine().connect()
+        if connection.dialect.name == "postgresql" and not connection.execute(
+            text("SELECT pg_try_advisory_lock(hashtext('bankcall_scheduler'))")
+        ).scalar():
+            connection.close()
+            lock_file.close()
+            return False
+        connection.commit()
+        self._file, self._connection = lock_file, connection
+        return True
+
+    def release(self):
+        if self._connection is not None:
+            # Closing the session releases the advisory lock
+            self._connection.close()
+            self._connection = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CallScheduler:
+    """Dials queued calls under per-organization caps and per-trunk pacing.
+
+    Ready calls sit in one heap per organization, highest priority first.
+    Whenever a trunk has a free channel and its pacing allows another call,
+    the next call is taken from the organizations below their tier's
+    concurrency cap: the best priority wins, and organizations with equal
+    priorities take turns, so one large campaign cannot starve the rest.
+    Unanswered attempts wait in a delayed heap until their retry is due.
+
+    State changes are buffered and written in batches every poll interval,
+    when new queued calls are also claimed from the store.
+    """
+
+    def __init__(
+        self,
+        store,
+        dialer,
+        trunks: int,
+        trunk_cps: float,
+        trunk_channels: int,
+        max_attempts: int,
+        retry_base: float,
+        retry_max: float,
+        poll_interval: float,
+        claim_batch: int,
+        max_backlog: int,
+        lock: Optional[SchedulerLock] = None,
+    ):
+        self.store = store
+        self.dialer = dialer
+        self.trunk_cps = trunk_cps
+        self.trunk_channels = trunk_channels
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self.claim_batch = claim_batch
+        self.max_backlog = max_backlog
+        self.lock = lock
+        self._trunks = [_Trunk(index) for index in range(trunks)]
+        self._ready: Dict[str, list] = {}
+        # Organizations with ready calls, in turn order
+        self._rotation = deque()
+        self._delayed = []
+        self._in_flight: Dict[str, int] = {}
+        self._tiers: Dict[str, Optional[str]] = {}
+        self._updates: Dict[str, dict] = {}
+        # call.completed events, published once the flush holding their terminal status has committed
+        self._completions: List[Tuple[str, dict]] = []
+        self._sequence = 0
+        self._backlog = 0
+        self._tasks = set()
+        self._wakeup = None
+        self._stopping = None
+        self._runner = None
+        self._db_executor = None
+        self.leader = False
+        self.dialed = 0
+        self.finished: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    # Queue
+
+    def add(self, call: QueuedCall, tier: Optional[str], due: Optional[float] = None):
+        self._tiers[call.organization_id] = tier
+        if not call.sequence:
+            self._sequence += 1
+            call.sequence = self._sequence
+        self._backlog += 1
+        if due is not None and due > time.time():
+            heapq.heappush(self._delayed, (due, call.sequence, call))
+            return
+        self._make_ready(call)
+
+    def _make_ready(self, call: QueuedCall):
+        heap = self._ready.get(call.organization_id)
+        if heap is None:
+            heap = self._ready[call.organization_id] = []
+            self._rotation.append(call.organization_id)
+        heapq.heappush(heap, (-call.priority, call.sequence, call))
+
+    def _release_due(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            self._make_ready(heapq.heappop(self._delayed)[2])
+
+    def _next_call(self) -> Optional[QueuedCall]:
+        best, best_key = None, None
+        for organization_id in self._rotation:
+            if self._in_flight.get(organization_id, 0) >= tier_concurrency(self._tiers.get(organization_id)):
+                continue
+            key = self._ready[organization_id][0][:2]
+            # Strict priority across organizations; on ties the one earliest in turn order
+            if best is None or key[0] < best_key[0]:
+                best, best_key = organization_id, key
+        if best is None:
+            return None
+        heap = self._ready[best]
+        call = heapq.heappop(heap)[2]
+        self._rotation.remove(best)
+        if heap:
+            self._rotation.append(best)
+        else:
+            del self._ready[best]
+        return call
+
+    def _free_trunk(self, now: float) -> Optional[_Trunk]:
+        free = [trunk for trunk in self._trunks if trunk.in_use < self.trunk_channels and trunk.next_slot <= now]
+        return min(free, key=lambda trunk: trunk.in_use) if free else None
+
+    def _next_wakeup(self, now: float) -> float:
+        # Seconds until pacing or a retry could let another call start
+        delay = self.poll_interval
+        if self._ready:
+            slots = [trunk.next_slot for trunk in self._trunks if trunk.in_use < self.trunk_channels]
+            if slots:
+                delay = min(delay, max(min(slots) - now, 0))
+        if self._delayed:
+            delay = min(delay, max(self._delayed[0][0] - time.time(), 0))
+        return delay
+
+    # Dialing
+
+    def _start(self, trunk: _Trunk, call: QueuedCall, now: float):
+        trunk.in_use += 1
+        trunk.next_slot = max(trunk.next_slot, now) + 1 / self.trunk_cps
+        self._in_flight[call.organization_id] = self._in_flight.get(call.organization_id, 0) + 1
+        call.attempts += 1
+        self.dialed += 1
+        values = {"status": "dialing", "attempts": call.attempts, "next_attempt_at": None}
+        if call.attempts == 1:
+            values["started_at"] = datetime.utcnow()
+        self._record(call.id, values)
+        task = asyncio.get_running_loop().create_task(self._dial(trunk, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dial(self, trunk: _Trunk, call: QueuedCall):
+        try:
+            result = await self.dialer.dial(call.phone_number, trunk.index)
+        except Exception as e:
+            logger.error(f"Dialer failed on call {call.id}: {e}")
+            result = DialResult("failed")
+        finally:
+            trunk.in_use -= 1
+            self._in_flight[call.organization_id] -= 1
+            if not self._in_flight[call.organization_id]:
+                del self._in_flight[call.organization_id]
+        self._finish(call, result)
+        self._wakeup.set()
+
+    def _finish(self, call: QueuedCall, result: DialResult):
+        if result.outcome in RETRYABLE_OUTCOMES and call.attempts < self.max_attempts:
+            due = time.time() + retry_delay(call.attempts, self.retry_base, self.retry_max)
+            self._record(call.id, {
+                "status": "scheduled", "last_outcome": result.outcome,
+                "next_attempt_at": datetime.utcfromtimestamp(due),
+            })
+            heapq.heappush(self._delayed, (due, call.sequence, call))
+            return
+        self._backlog -= 1
+        status = "completed" if result.outcome == "answered" else ("unanswered" if result.outcome in ("no_answer", "busy") else "failed")
+        completed_at = datetime.utcnow()
+        self._record(call.id, {
+            "status": status, "last_outcome": result.outcome,
+            "duration_seconds": result.duration, "completed_at": completed_at,
+        })
+        self.finished[status] = self.finished.get(status, 0) + 1
+        self._completions.append((call.organization_id, {
+            "call_id": call.id, "status": status, "outcome": result.outcome, "attempts": call.attempts,
+            "duration_seconds": result.duration, "completed_at": completed_at.isoformat(), **call.payload,
+        }))
+
+    def _record(self, call_id: str, values: dict):
+        self._updates.setdefault(call_id, {}).update(values)
+
+    # Loops
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            # Cleared first, so a call finishing while this pass runs still wakes the next one
+            self._wakeup.clear()
+            now = loop.time()
+            self._release_due(time.time())
+            while True:
+                trunk = self._free_trunk(now)
+                if trunk is None:
+                    break
+                call = self._next_call()
+                if call is None:
+                    break
+                self._start(trunk, call, now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wakeup(loop.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sync(self):
+        # Flushes buffered state changes and claims new calls, once per poll interval
+        loop = asyncio.get_running_loop()
+        while True:
+            stopping = self._stopping.is_set()
+            await self._flush()
+            if stopping:
+                return
+            room = min(self.max_backlog - self._backlog, self.claim_batch)
+            if room > 0:
+                try:
+                    claimed = await loop.run_in_executor(self._db_executor, self.store.claim, room)
+                except Exception as e:
+                    logger.error(f"Failed to claim queued calls: {e}")
+                    claimed = []
+                for call, tier, next_attempt_at in claimed:
+                    self.add(call, tier, _epoch(next_attempt_at) if next_attempt_at else None)
+                if claimed:
+                    self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush(self):
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, {}
+        completions, self._completions = self._completions, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._db_executor, self.store.save, updates)
+        except Exception as e:
+            logger.error(f"Failed to save {len(updates)} call updates: {e}")
+            # Merged back under anything recorded meanwhile, which is newer
+            for call_id, values in updates.items():
+                self._updates[call_id] = {**values, **self._updates.get(call_id, {})}
+            self._completions[:0] = completions
+            return
+        # Consumers reading the call on receipt see its terminal status; a crash before this
+        # point loses the event rather than announcing a call that is dialled again
+        for organization_id, payload in completions:
+            event_bus.publish("call.completed", organization_id, payload)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Standby until this process holds the lock; in-app, every worker but one waits here
+        while not self._stopping.is_set() and self.lock is not None:
+            if await loop.run_in_executor(self._db_executor, self.lock.acquire):
+                break
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=max(self.poll_interval, 5))
+            except asyncio.TimeoutError:
+                pass
+        if self._stopping.is_set():
+            return
+        self.leader = True
+        recovered = await loop.run_in_executor(self._db_executor, self.store.recover)
+        if recovered:
+            logger.info(f"Requeued {recovered} calls left scheduled or dialing by a previous scheduler")
+        logger.info(f"Call scheduler started with {len(self._trunks)} trunks")
+        try:
+            await asyncio.gather(self._dispatch(), self._sync())
+        finally:
+            self.leader = False
+
+    def start(self):
+        if self._runner is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bankcall-scheduler")
+        self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 10.0):
+        if self._runner is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        if self._tasks:
+            # Calls on the line get a chance to finish; the rest are requeued by the next scheduler
+            await asyncio.wait(set(self._tasks), timeout=drain_timeout)
+        for task in list(self._tasks):
+            task.cancel()
+        await self._runner
+        self._runner = None
+        # Outcomes of the calls that finished while draining
+        await self._flush()
+        self._db_executor.shutdown(wait=True)
+        self._db_executor = None
+        if self.lock is not None:
+            self.lock.release()
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.leader,
+            "ready": sum(len(heap) for heap in self._ready.values()),
+            "waiting_retry": len(self._delayed),
+            "in_flight": sum(trunk.in_use for trunk in self._trunks),
+            "dialed": self.dialed,
+            "finished": dict(self.finished),
+        }
+
+
+call_scheduler = CallScheduler(
+    store=SqlCallStore(),
+    dialer=simulated_dialer,
+    trunks=BANKCALL_TRUNKS,
+    trunk_cps=BANKCALL_TRUNK_CPS,
+    trunk_channels=BANKCALL_TRUNK_CHANNELS,
+    max_attempts=BANKCALL_MAX_ATTEMPTS,
+    retry_base=BANKCALL_RETRY_BASE_SECONDS,
+    retry_max=BANKCALL_RETRY_MAX_SECONDS,
+    poll_interval=BANKCALL_POLL_SECONDS,
+    claim_batch=BANKCALL_CLAIM_BATCH,
+    max_backlog=BANKCALL_MAX_BACKLOG,
+    lock=SchedulerLock(BANKCALL_SCHEDULER_LOCK),
+)
+
+
+async def main():
+    from ...webhooks.dispatcher import dispatch_events
+    from ...webhooks.delivery import delivery_engine
+    # call.completed events reach webhooks through this process's own event log partition
+    await delivery_engine.start()
+    event_bus.subscribe("webhooks", dispatch_events)
+    event_bus.start()
+    call_scheduler.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await call_scheduler.stop()
+    event_bus.stop()
+    await delivery_engine.stop()
+
+
+if __name__ == "__main__":
+    # python -m app.modules.bankcall.scheduler
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, row_id = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def keyset_page(
+    db: AsyncSession, query: Select, model, cursor: Optional[str], limit: Optional[int], response: Response
+) -> List:
+    """Newest-first page of ``model`` rows from ``query``, continuing after ``cursor``.
+
+    Rows are ordered by (created_at, id) descending. When the query's filters
+    are an index prefix followed by (created_at, id), every page is a single
+    index range scan, however deep into the listing it is. The cursor for the
+    next page is returned in the X-Next-Cursor header, absent on the last page.
+
+    Without ``limit`` or ``cursor`` every row is returned, as listings did
+    before they were paginated; a ``cursor`` alone gets PAGE_SIZE_DEFAULT rows.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if limit is None and not cursor:
+        return (await db.scalars(query)).all()
+    limit = limit or PAGE_SIZE_DEFAULT
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < (created_at, row_id))
+    query = query.limit(limit + 1)
+    rows = (await db.scalars(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows
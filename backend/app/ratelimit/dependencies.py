@@ -0,0 +1,40 @@
+from fastapi import Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..auth.dependencies import get_principal
+from ..auth.principal import Principal
+from .limiter import Decision, rate_limiter, RATE_LIMIT_ENABLED
+import math
+
+def rate_limit_headers(decision: Decision) -> dict:
+    return {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset)),
+    }
+
+async def charge_rate_limit(response: Response, principal: Principal, db: AsyncSession, cost: int = 1):
+    # Raises 429 unless the caller's buckets allow `cost` tokens, and takes them if they do.
+    # A cost above the burst is never refused outright: it goes through on a full bucket and leaves debt.
+    if not RATE_LIMIT_ENABLED:
+        return
+    decision = await rate_limiter.check(db, principal.organization_id, principal.api_key_id, cost)
+    if decision is None:
+        return
+    headers = rate_limit_headers(decision)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={**headers, "Retry-After": str(math.ceil(decision.retry_after))},
+        )
+    response.headers.update(headers)
+
+async def rate_limited_principal(
+    response: Response,
+    principal: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    # Drop-in for get_principal on module endpoints: authenticates, then charges one request
+    await charge_rate_limit(response, principal, db)
+    return principal
@@ -0,0 +1,300 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from ..models import Organization
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# local: buckets live in this worker; sqlite: buckets are shared by every worker on the host through one file
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limits.db")
+# Tokens a worker takes from the shared bucket at a time; later checks are served from that lease in-process
+RATE_LIMIT_LEASE_TOKENS = int(os.getenv("RATE_LIMIT_LEASE_TOKENS", "10"))
+RATE_LIMIT_TIER_CACHE_SECONDS = float(os.getenv("RATE_LIMIT_TIER_CACHE_SECONDS", "60"))
+
+# tier -> {"organization": [requests per second, burst], "api_key": [...]}
+DEFAULT_TIER_LIMITS = {
+    "starter": {"organization": [20, 40], "api_key": [10, 20]},
+    "business": {"organization": [200, 400], "api_key": [100, 200]},
+    "enterprise": {"organization": [2000, 4000], "api_key": [1000, 2000]},
+}
+TIER_LIMITS = json.loads(os.getenv("RATE_LIMIT_TIERS", "null")) or DEFAULT_TIER_LIMITS
+# Organizations without a subscription tier are limited like starter
+DEFAULT_TIER = "starter"
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens refilled per second
+    burst: int  # bucket capacity
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the bucket is full again
+    reset: float
+    # Seconds until the tokens asked for are available; 0 when allowed
+    retry_after: float
+
+
+def _refill(tokens: float, updated: float, now: float, limit: Limit) -> float:
+    return min(float(limit.burst), tokens + max(0.0, now - updated) * limit.rate)
+
+
+def _decision(allowed: bool, tokens: float, cost: int, limit: Limit) -> Decision:
+    return Decision(
+        allowed=allowed,
+        limit=limit.burst,
+        remaining=max(0, int(tokens)),
+        reset=max(0.0, limit.burst - tokens) / limit.rate,
+        retry_after=0.0 if allowed else max(0.0, cost - tokens) / limit.rate,
+    )
+
+
+class LocalBackend:
+    # Token buckets in a dict: one lookup and a little arithmetic per check
+    blocking = False
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets: Sequence[Tuple[str, Limit]], cost: int, now: float) -> List[Decision]:
+        # `cost` comes out of every bucket or out of none
+        with self._lock:
+            tokens = []
+            for key, limit in buckets:
+                bucket = self._buckets.get(key)
+                tokens.append(float(limit.burst) if bucket is None else _refill(bucket[0], bucket[1], now, limit))
+            allowed = all(available >= cost for available in tokens)
+            if allowed:
+                tokens = [available - cost for available in tokens]
+            for (key, _), available in zip(buckets, tokens):
+                self._buckets[key] = (available, now)
+        return [_decision(allowed, available, cost, limit) for (_, limit), available in zip(buckets, tokens)]
+
+    def debit(self, buckets: Sequence[Tuple[str, Limit]], amount: int, now: float) -> List[Decision]:
+        # Takes `amount` unconditionally; a bucket may go negative and then refills from below zero
+        with self._lock:
+            tokens = []
+            for key, limit in buckets:
+                bucket = self._buckets.get(key)
+                available = (float(limit.burst) if bucket is None else _refill(bucket[0], bucket[1], now, limit)) - amount
+                self._buckets[key] = (available, now)
+                tokens.append(available)
+        return [_decision(True, available, amount, limit) for (_, limit), available in zip(buckets, tokens)]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """Token buckets shared across worker processes through a SQLite file.
+
+    Each worker takes up to ``lease_tokens`` tokens per round-trip and serves
+    further checks from that lease in memory, so most checks never touch the
+    file. The cost is bounded slack: up to one lease per worker and key can
+    sit unused while the shared bucket reports it as spent.
+    """
+
+    # A round-trip can wait on another worker's write lock, so it runs off the event loop
+    blocking = True
+
+    def __init__(self, path: str, lease_tokens: int):
+        self.path = path
+        self.lease_tokens = lease_tokens
+        self._local = threading.local()
+        self._leases = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _spend(self, buckets: Sequence[Tuple[str, Limit]], cost: int, now: float) -> Optional[List[Decision]]:
+        # Under self._lock. Decides from the leases alone when it can: spends from every lease if
+        # all of them hold `cost`, or denies if some bucket cannot have refilled enough yet
+        leases = [self._leases.get(key) for key, _ in buckets]
+        if all(lease is not None and lease[0] >= cost for lease in leases):
+            for (key, _), (held, shared, synced) in zip(buckets, leases):
+                self._leases[key] = (held - cost, shared, synced)
+            return [
+                _decision(True, held - cost + shared, cost, limit)
+                for (_, limit), (held, shared, _) in zip(buckets, leases)
+            ]
+        projected = [
+            None if lease is None else lease[0] + _refill(lease[1], lease[2], now, limit)
+            for (_, limit), lease in zip(buckets, leases)
+        ]
+        if any(available is not None and available < cost for available in projected):
+            return [
+                _decision(False, float(limit.burst) if available is None else available, cost, limit)
+                for (_, limit), available in zip(buckets, projected)
+            ]
+        return None
+
+    def take(self, buckets: Sequence[Tuple[str, Limit]], cost: int, now: float) -> List[Decision]:
+        # `cost` comes out of every bucket or out of none; tokens leased for a denied
+        # request stay in this worker's lease for the next one
+        with self._lock:
+            decisions = self._spend(buckets, cost, now)
+            if decisions is not None:
+                return decisions
+            wants = {}
+            for key, limit in buckets:
+                # lease: (tokens held by this worker, shared tokens left at the last round-trip, its time)
+                held = self._leases[key][0] if key in self._leases else 0.0
+                if held < cost:
+                    wants[key] = (limit, max(cost, min(self.lease_tokens, limit.burst)) - held)
+
+        acquired = self._acquire(wants, now)
+        with self._lock:
+            # Another thread may have used or topped up the leases meanwhile
+            for key, (granted, shared) in acquired.items():
+                lease = self._leases.get(key)
+                self._leases[key] = ((lease[0] if lease is not None else 0.0) + granted, shared, now)
+            held = [self._leases[key][0] for key, _ in buckets]
+            allowed = all(tokens >= cost for tokens in held)
+            decisions = []
+            for (key, limit), tokens in zip(buckets, held):
+                _, shared, synced = self._leases[key]
+                if allowed:
+                    tokens -= cost
+                    self._leases[key] = (tokens, shared, synced)
+                decisions.append(_decision(allowed, tokens + shared, cost, limit))
+        return decisions
+
+    def debit(self, buckets: Sequence[Tuple[str, Limit]], amount: int, now: float) -> List[Decision]:
+        # Takes `amount` from the shared buckets unconditionally, so every worker sees the debt
+        acquired = self._acquire({key: (limit, amount) for key, limit in buckets}, now, debt=True)
+        with self._lock:
+            decisions = []
+            for key, limit in buckets:
+                _, shared = acquired[key]
+                held = self._leases[key][0] if key in self._leases else 0.0
+                self._leases[key] = (held, shared, now)
+                decisions.append(_decision(True, held + shared, amount, limit))
+        return decisions
+
+    def _acquire(
+        self, wants: Dict[str, Tuple[Limit, float]], now: float, debt: bool = False
+    ) -> Dict[str, Tuple[float, float]]:
+        # key -> (tokens granted, shared tokens left), for every key in one transaction.
+        # Grants what the bucket holds, or with `debt` all of it, leaving the bucket negative.
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        acquired = {}
+        try:
+            for key, (limit, want) in wants.items():
+                row = conn.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = float(limit.burst) if row is None else _refill(row[0], row[1], now, limit)
+                granted = want if debt else min(want, max(0, math.floor(tokens)))
+                tokens -= granted
+                conn.execute(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                acquired[key] = (granted, tokens)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def clear(self):
+        with self._lock:
+            self._leases.clear()
+        self._connect().execute("DELETE FROM rate_limit_buckets")
+
+
+class RateLimiter:
+    """Per-API-key and per-organization token buckets sized by subscription tier.
+
+    A request costing more than a bucket can hold (a large batch) is allowed
+    once the buckets hold a full burst; the rest is taken as debt, which
+    later requests wait out while the buckets refill from below zero.
+    """
+
+    def __init__(self, backend, tier_limits: Dict[str, dict], tier_cache_seconds: float):
+        self.backend = backend
+        self.tier_limits = {
+            tier: {scope: Limit(*values) for scope, values in scopes.items()}
+            for tier, scopes in tier_limits.items()
+        }
+        self.tier_cache_seconds = tier_cache_seconds
+        self._tiers = {}
+        self._lock = threading.Lock()
+
+    async def tier(self, db: AsyncSession, organization_id: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tiers.get(organization_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        tier = await db.scalar(select(Organization.subscription_tier).where(Organization.id == organization_id))
+        if tier not in self.tier_limits:
+            tier = DEFAULT_TIER
+        with self._lock:
+            self._tiers[organization_id] = (tier, now + self.tier_cache_seconds)
+        return tier
+
+    async def check(
+        self, db: AsyncSession, organization_id: Optional[str], api_key_id: Optional[str], cost: int = 1
+    ) -> Optional[Decision]:
+        tier = await self.tier(db, organization_id) if organization_id else DEFAULT_TIER
+        if self.backend.blocking:
+            return await run_in_threadpool(self.take, tier, organization_id, api_key_id, cost)
+        return self.take(tier, organization_id, api_key_id, cost)
+
+    def take(
+        self, tier: str, organization_id: Optional[str], api_key_id: Optional[str], cost: int = 1
+    ) -> Optional[Decision]:
+        # Charged against the API key and organization buckets together; the most restrictive decides
+        limits = self.tier_limits[tier]
+        buckets = []
+        if api_key_id is not None:
+            buckets.append((f"key:{api_key_id}", limits["api_key"]))
+        if organization_id is not None:
+            buckets.append((f"org:{organization_id}", limits["organization"]))
+        if not buckets:
+            return None
+        now = time.time()
+        charge = min(cost, min(limit.burst for _, limit in buckets))
+        decisions = self.backend.take(buckets, charge, now)
+        if not decisions[0].allowed:
+            # The bucket that takes longest to allow it
+            return max(decisions, key=lambda decision: decision.retry_after)
+        if cost > charge:
+            decisions = self.backend.debit(buckets, cost - charge, now)
+        return min(decisions, key=lambda decision: decision.remaining)
+
+    def invalidate_tier(self, organization_id: str):
+        with self._lock:
+            self._tiers.pop(organization_id, None)
+
+
+def _backend():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend(RATE_LIMIT_SQLITE_PATH, RATE_LIMIT_LEASE_TOKENS)
+    return LocalBackend()
+
+
+rate_limiter = RateLimiter(_backend(), TIER_LIMITS, RATE_LIMIT_TIER_CACHE_SECONDS)
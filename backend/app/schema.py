@@ -0,0 +1,82 @@
+from sqlalchemy import inspect
+from .database import Base, SessionLocal, get_engine
+from . import models  # noqa: F401
+from .api_keys import models as api_key_models  # noqa: F401
+from .webhooks import models as webhook_models  # noqa: F401
+from .modules.antifraud import models as antifraud_models  # noqa: F401
+from .modules.bankcall import models as bankcall_models  # noqa: F401
+from .billing import models as billing_models  # noqa: F401
+from .webhooks.dispatcher import backfill_event_routes
+from .webhooks.retention import ensure_partitions
+from typing import List
+import argparse
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Schema setup runs once per deployment (python -m app.schema), not in every worker.
+# Every module's tables are created, enabled or not, so turning a module on needs no migration.
+
+
+def missing_tables() -> List[str]:
+    existing = set(inspect(get_engine()).get_table_names())
+    return [name for name in Base.metadata.tables if name not in existing]
+
+
+def missing_indexes() -> List[str]:
+    # Indexes added to existing tables; create_all only covers tables it creates
+    inspector = inspect(get_engine())
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index.name for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def ensure_schema() -> List[str]:
+    # Creates missing tables and backfills derived rows; safe to re-run
+    start = time.perf_counter()
+    missing = missing_tables()
+    if missing:
+        Base.metadata.create_all(bind=get_engine())
+        logger.info(f"Created tables: {', '.join(missing)}")
+    indexes = missing_indexes()
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name in indexes:
+                index.create(bind=get_engine())
+    if indexes:
+        logger.info(f"Created indexes: {', '.join(indexes)}")
+    with SessionLocal() as db:
+        backfill_event_routes(db)
+        partitions = ensure_partitions(db)
+    if partitions:
+        logger.info(f"Created partitions: {', '.join(partitions)}")
+    logger.info(f"Schema up to date in {time.perf_counter() - start:.3f}s")
+    return missing
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Create or check the database schema.")
+    parser.add_argument("--check", action="store_true", help="only report missing tables and indexes; exit 1 if any")
+    args = parser.parse_args()
+    if args.check:
+        tables, indexes = missing_tables(), missing_indexes()
+        for name in tables:
+            print(f"missing table: {name}")
+        for name in indexes:
+            print(f"missing index: {name}")
+        return 1 if tables or indexes else 0
+    ensure_schema()
+    return 0
+
+
+if __name__ == "__main__":
+    # python -m app.schema [--check]
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+from .outbox import record_result
+from ..metrics.registry import webhook_delivery_latency, webhook_deliveries
+import asyncio
+import hashlib
+import hmac
+import httpx
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sockets across all destinations; httpx keeps a keep-alive pool per origin inside this budget
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+WEBHOOK_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_KEEPALIVE_CONNECTIONS", "50"))
+# Requests actually on the wire; queued deliveries beyond this just wait as cheap coroutines
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))
+WEBHOOK_MAX_IN_FLIGHT_PER_SUBSCRIPTION = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT_PER_SUBSCRIPTION", "4"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+
+# X-Event-Type sent with batch envelopes; the individual types are inside the envelope
+BATCH_EVENT_TYPE = "batch"
+
+
+def encode_payload(payload: dict) -> bytes:
+    return json.dumps(payload).encode('utf-8')
+
+
+def sign_body(body: bytes, secret: str) -> str:
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def encode_batch(events: List[dict]) -> bytes:
+    # events: [{"id", "event_type", "payload"}]; receivers deduplicate on the per-event id
+    return json.dumps({"events": events}).encode('utf-8')
+
+
+class WebhookDelivery(NamedTuple):
+    # More than one id when several events are coalesced into a batch envelope
+    event_ids: Tuple[str, ...]
+    subscription_id: str
+    url: str
+    secret: str
+    event_type: str
+    # Serialized once; the exact bytes that are signed are the bytes that are sent
+    body: bytes
+    # Set for batch envelopes: failed batches are retried together, aligned to this window
+    batch_linger_ms: Optional[int] = None
+
+
+class DeliveryResult(NamedTuple):
+    succeeded: bool
+    response_code: int
+    error: Optional[str] = None
+
+
+class _SubscriptionLimiter:
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class WebhookDeliveryEngine:
+    """Delivers webhooks over a shared async HTTP client on the app's event loop.
+
+    Concurrency is bounded globally and per subscription with semaphores, so
+    thousands of queued deliveries cost only coroutines while the number of
+    sockets stays within the connection pool limits. Result bookkeeping runs
+    on a single database thread and goes through the outbox, which schedules
+    retries for failed attempts.
+    """
+
+    def __init__(
+        self,
+        max_connections: int,
+        max_keepalive_connections: int,
+        max_in_flight: int,
+        max_in_flight_per_subscription: int,
+        timeout: float,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_subscription = max_in_flight_per_subscription
+        self.timeout = timeout
+        self._client = None
+        self._loop = None
+        self._global_limit = None
+        self._subscription_limits = {}
+        self._tasks = set()
+        self._db_executor = None
+
+    @property
+    def running(self) -> bool:
+        return self._client is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def start(self):
+        if self._client is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._global_limit = asyncio.Semaphore(self.max_in_flight)
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-results")
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+            ),
+            timeout=self.timeout,
+        )
+
+    async def stop(self, drain_timeout: float = 10.0):
+        if self._client is None:
+            return
+        if self._tasks:
+            # Give in-flight deliveries a chance to finish; the rest stay pending in the database
+            await asyncio.wait(set(self._tasks), timeout=drain_timeout)
+        for task in list(self._tasks):
+            task.cancel()
+        await self._client.aclose()
+        self._client = None
+        self._db_executor.shutdown(wait=True)
+        self._db_executor = None
+
+    def submit(self, delivery: WebhookDelivery) -> bool:
+        # Safe to call from sync route handlers running in the threadpool
+        if self._client is None:
+            return False
+        self._loop.call_soon_threadsafe(self._spawn, delivery)
+        return True
+
+    def _spawn(self, delivery: WebhookDelivery):
+        task = self._loop.create_task(self._deliver_and_record(delivery))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver_and_record(self, delivery: WebhookDelivery):
+        result = await self.deliver(delivery)
+        await self.record(delivery, result)
+
+    async def record(self, delivery: WebhookDelivery, result: DeliveryResult):
+        await self._loop.run_in_executor(
+            self._db_executor, record_result,
+            list(delivery.event_ids), result.succeeded, result.response_code, result.error, delivery.batch_linger_ms,
+        )
+
+    async def deliver(self, delivery: WebhookDelivery) -> DeliveryResult:
+        limiter = self._subscription_limits.get(delivery.subscription_id)
+        if limiter is None:
+            limiter = _SubscriptionLimiter(self.max_in_flight_per_subscription)
+            self._subscription_limits[delivery.subscription_id] = limiter
+        limiter.users += 1
+        try:
+            async with limiter.semaphore, self._global_limit:
+                return await self._post(delivery)
+        finally:
+            limiter.users -= 1
+            if limiter.users == 0:
+                del self._subscription_limits[delivery.subscription_id]
+
+    async def _post(self, delivery: WebhookDelivery) -> DeliveryResult:
+        headers = {
+            "Content-Type": "application/json",
+            "X-Hub-Signature-256": f"sha256={sign_body(delivery.body, delivery.secret)}",
+            "X-Event-Type": delivery.event_type,
+        }
+        if delivery.event_type == BATCH_EVENT_TYPE:
+            headers["X-Webhook-Batch-Size"] = str(len(delivery.event_ids))
+        start = time.perf_counter()
+        try:
+            response = await self._client.post(delivery.url, content=delivery.body, headers=headers)
+        except Exception as e:
+            logger.error(f"Webhook failed: {e}")
+            self._observe("network_error", start)
+            return DeliveryResult(succeeded=False, response_code=0, error=str(e))
+        succeeded = 200 <= response.status_code < 300
+        self._observe("success" if succeeded else "http_error", start)
+        return DeliveryResult(succeeded=succeeded, response_code=response.status_code)
+
+    @staticmethod
+    def _observe(outcome: str, start: float):
+        webhook_delivery_latency.observe((outcome,), time.perf_counter() - start)
+        webhook_deliveries.inc((outcome,))
+
+
+delivery_engine = WebhookDeliveryEngine(
+    max_connections=WEBHOOK_MAX_CONNECTIONS,
+    max_keepalive_connections=WEBHOOK_MAX_KEEPALIVE_CONNECTIONS,
+    max_in_flight=WEBHOOK_MAX_IN_FLIGHT,
+    max_in_flight_per_subscription=WEBHOOK_MAX_IN_FLIGHT_PER_SUBSCRIPTION,
+    timeout=WEBHOOK_TIMEOUT_SECONDS,
+)
@@ -1,80 +1,102 @@
-import requests
-import hmac
-import hashlib
-import json
+from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from .models import WebhookSubscription, WebhookEvent
+from typing import List
 from ..database import SessionLocal
-from fastapi import BackgroundTasks
+from ..events.bus import Event
+from .models import WebhookSubscription, WebhookSubscriptionEvent, WebhookEvent, generate_uuid
+from .delivery import delivery_engine, WebhookDelivery, encode_payload, sign_body
+from .outbox import batch_due_at, new_lease
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
-def sign_payload(payload: dict, secret: str) -> str:
-    payload_bytes = json.dumps(payload).encode('utf-8')
-    secret_bytes = secret.encode('utf-8')
-    signature = hmac.new(secret_bytes, payload_bytes, hashlib.sha256).hexdigest()
-    return signature
-
-def _send_webhook_task(event_id: str, url: str, secret: str, payload: dict, event_type: str):
-    db = SessionLocal()
-    try:
-        event_record = db.query(WebhookEvent).filter(WebhookEvent.id == event_id).first()
-        if not event_record:
-            return
+# Attempt delivery straight away from the API process; the outbox worker retries failures
+WEBHOOK_INLINE_DELIVERY = os.getenv("WEBHOOK_INLINE_DELIVERY", "true").lower() == "true"
 
-        signature = sign_payload(payload, secret)
-        headers = {
-            "Content-Type": "application/json",
-            "X-Hub-Signature-256": f"sha256={signature}",
-            "X-Event-Type": event_type
-        }
-        
-        try:
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
-            event_record.status = "success" if 200 <= response.status_code < 300 else "failed"
-            event_record.response_code = response.status_code
-        except Exception as e:
-            logger.error(f"Webhook failed: {e}")
-            event_record.status = "failed"
-            event_record.response_code = 0
-        
-        db.commit()
-    finally:
-        db.close()
+def sign_payload(payload: dict, secret: str) -> str:
+    return sign_body(encode_payload(payload), secret)
 
 def dispatch_event(
     db: Session, 
     organization_id: str, 
     event_type: str, 
-    payload: dict, 
-    background_tasks: BackgroundTasks
+    payload: dict
 ):
-    # Find subscriptions for this org and event
-    subscriptions = db.query(WebhookSubscription).filter(
-        WebhookSubscription.organization_id == organization_id,
+    # Find subscriptions for this org and event through the routing index
+    subscriptions = db.query(
+        WebhookSubscription.id, WebhookSubscription.url, WebhookSubscription.secret,
+        WebhookSubscription.batch_enabled, WebhookSubscription.batch_linger_ms
+    ).join(
+        WebhookSubscriptionEvent, WebhookSubscriptionEvent.subscription_id == WebhookSubscription.id
+    ).filter(
+        WebhookSubscriptionEvent.organization_id == organization_id,
+        WebhookSubscriptionEvent.event_type == event_type,
         WebhookSubscription.is_active == True
     ).all()
+    if not subscriptions:
+        return
 
+    # Serialize once and reuse the same bytes for every subscriber
+    body = encode_payload(payload)
+    inline = WEBHOOK_INLINE_DELIVERY and delivery_engine.running
+    now = datetime.utcnow()
+    lease_owner, lease_expires_at = new_lease("api") if inline else (None, None)
+
+    # The outbox rows are the source of truth; they survive restarts and drive retries.
+    # When delivering inline they're leased to this process so outbox workers skip them.
+    # Batched subscriptions are always left to the outbox worker, which coalesces them.
+    rows = []
     for sub in subscriptions:
-        if event_type in sub.events:
-            # Create event record immediately as pending
-            event_record = WebhookEvent(
+        deliver_inline = inline and not sub.batch_enabled
+        rows.append({
+            "id": generate_uuid(),
+            "subscription_id": sub.id,
+            "event_type": event_type,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": batch_due_at(now, sub.batch_linger_ms) if sub.batch_enabled else now,
+            "lease_owner": lease_owner if deliver_inline else None,
+            "lease_expires_at": lease_expires_at if deliver_inline else None,
+        })
+    # One multi-row INSERT and one commit regardless of fan-out
+    db.execute(insert(WebhookEvent), rows)
+    db.commit()
+
+    if inline:
+        for sub, row in zip(subscriptions, rows):
+            if sub.batch_enabled:
+                continue
+            delivery_engine.submit(WebhookDelivery(
+                event_ids=(row["id"],),
                 subscription_id=sub.id,
+                url=sub.url,
+                secret=sub.secret,
                 event_type=event_type,
-                payload=payload,
-                status="pending"
-            )
-            db.add(event_record)
-            db.commit()
-            db.refresh(event_record)
+                body=body,
+            ))
 
-            # Schedule background task
-            background_tasks.add_task(
-                _send_webhook_task, 
-                event_record.id, 
-                sub.url, 
-                sub.secret, 
-                payload, 
-                event_type
-            )
+def dispatch_events(events: List[Event]):
+    # Event bus consumer; a batch that fails part-way is redelivered, so subscribers may see duplicates
+    with SessionLocal() as db:
+        for event in events:
+            if event.organization_id is not None:
+                dispatch_event(db, event.organization_id, event.event_type, event.payload)
+
+def backfill_event_routes(db: Session) -> int:
+    # Subscriptions created before the routing index existed have no route rows yet
+    missing = db.query(WebhookSubscription).outerjoin(
+        WebhookSubscriptionEvent, WebhookSubscriptionEvent.subscription_id == WebhookSubscription.id
+    ).filter(WebhookSubscriptionEvent.subscription_id.is_(None)).all()
+    for sub in missing:
+        sub.event_routes = [
+            WebhookSubscriptionEvent(event_type=event_type, organization_id=sub.organization_id)
+            for event_type in dict.fromkeys(sub.events or [])
+        ]
+    if missing:
+        db.commit()
+        logger.info(f"Backfilled webhook routing index for {len(missing)} subscriptions")
+    return len(missing)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, JSON, Integer
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, JSON, Integer, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
+from datetime import datetime
 import uuid
 
 def generate_uuid():
@@ -17,18 +18,65 @@ class WebhookSubscription(Base):
     events = Column(JSON, nullable=False)  # List of events e.g., ["transaction.blocked", "call.completed"]
     secret = Column(String, nullable=False) # For signature verification
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set client-side so values round-trip exactly through pagination cursors
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+
+    # Opt-in batching: events are coalesced into one signed envelope of up to
+    # batch_max_size events, held for at most batch_linger_ms
+    batch_enabled = Column(Boolean, nullable=False, default=False)
+    batch_max_size = Column(Integer, nullable=False, default=100)
+    batch_linger_ms = Column(Integer, nullable=False, default=1000)
 
     user = relationship("User", back_populates="webhooks")
     organization = relationship("Organization", back_populates="webhooks")
+    event_routes = relationship("WebhookSubscriptionEvent", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Keyset pagination of a user's subscriptions, newest first
+        Index("ix_webhook_subscriptions_user_created", "user_id", "created_at", "id"),
+        Index("ix_webhook_subscriptions_organization", "organization_id"),
+    )
+
+class WebhookSubscriptionEvent(Base):
+    # Normalized routing index: (organization_id, event_type) -> subscription, kept in step with `events`
+    __tablename__ = "webhook_subscription_events"
+
+    subscription_id = Column(String, ForeignKey("webhook_subscriptions.id", ondelete="CASCADE"), primary_key=True)
+    event_type = Column(String, primary_key=True)
+    organization_id = Column(String, ForeignKey("organizations.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_webhook_subscription_events_route", "organization_id", "event_type"),
+    )
 
 class WebhookEvent(Base):
+    # Partitioned by day on PostgreSQL; see webhooks/retention.py
     __tablename__ = "webhook_events"
 
     id = Column(String, primary_key=True, default=generate_uuid)
     subscription_id = Column(String, ForeignKey("webhook_subscriptions.id"))
     event_type = Column(String, nullable=False)
     payload = Column(JSON, nullable=False)
-    status = Column(String, default="pending") # pending, success, failed
+    status = Column(String, default="pending") # pending, success, dead
     response_code = Column(Integer, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Part of the primary key because PostgreSQL requires the partition key in it
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=datetime.utcnow, server_default=func.now())
+
+    # Outbox bookkeeping: a pending row is due once next_attempt_at has passed
+    # and nobody holds an unexpired lease on it
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_webhook_events_due", "status", "next_attempt_at"),
+        # Delivery history per subscription, newest first, optionally narrowed to one status
+        Index("ix_webhook_events_subscription_created", "subscription_id", "created_at", "id"),
+        Index("ix_webhook_events_subscription_status_created", "subscription_id", "status", "created_at", "id"),
+        # Retention finds and deletes expired days by range
+        Index("ix_webhook_events_created", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
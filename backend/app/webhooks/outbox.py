@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from .models import WebhookSubscription, WebhookEvent
+import logging
+import os
+import random
+import uuid
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "5"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "3600"))
+# How long a claimed event is reserved before another worker may take it over
+WEBHOOK_LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+
+
+def backoff_delay(attempts: int) -> float:
+    # Exponential backoff with equal jitter: half fixed, half random
+    delay = min(WEBHOOK_BACKOFF_MAX_SECONDS, WEBHOOK_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def batch_due_at(when: datetime, linger_ms: int) -> datetime:
+    # Align to the end of the linger window containing `when`, so every event of a
+    # subscription that falls in the window becomes due at the same instant and is claimed together
+    window = max(linger_ms, 1)
+    epoch_ms = int((when - datetime(1970, 1, 1)).total_seconds() * 1000)
+    return datetime(1970, 1, 1) + timedelta(milliseconds=(epoch_ms // window + 1) * window)
+
+
+def new_lease(owner: str) -> Tuple[str, datetime]:
+    # Each claim gets its own token so a worker can tell its batches apart
+    return f"{owner}:{uuid.uuid4().hex[:12]}", datetime.utcnow() + timedelta(seconds=WEBHOOK_LEASE_SECONDS)
+
+
+def _is_due(now: datetime):
+    return (
+        (WebhookEvent.status == "pending")
+        & (WebhookEvent.next_attempt_at <= now)
+        & or_(WebhookEvent.lease_expires_at.is_(None), WebhookEvent.lease_expires_at < now)
+    )
+
+
+def claim_due_events(db: Session, owner: str, limit: int) -> List[Tuple[WebhookEvent, Optional[WebhookSubscription]]]:
+    now = datetime.utcnow()
+    lease_owner, lease_expires_at = new_lease(owner)
+
+    if db.bind.dialect.name == "postgresql":
+        # Concurrent workers skip each other's locked rows instead of queueing on them
+        ids = [
+            row.id for row in db.query(WebhookEvent.id)
+            .filter(_is_due(now))
+            .order_by(WebhookEvent.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ]
+        if ids:
+            db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.id.in_(ids))
+                .values(lease_owner=lease_owner, lease_expires_at=lease_expires_at)
+            )
+    else:
+        # SQLite serializes writers, so one conditional UPDATE is an atomic claim
+        due = (
+            db.query(WebhookEvent.id)
+            .filter(_is_due(now))
+            .order_by(WebhookEvent.next_attempt_at)
+            .limit(limit)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(due), _is_due(now))
+            .values(lease_owner=lease_owner, lease_expires_at=lease_expires_at)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    return (
+        db.query(WebhookEvent, WebhookSubscription)
+        .outerjoin(WebhookSubscription, WebhookSubscription.id == WebhookEvent.subscription_id)
+        .filter(WebhookEvent.lease_owner == lease_owner)
+        .order_by(WebhookEvent.next_attempt_at)
+        .all()
+    )
+
+
+def mark_dead(db: Session, event_ids: List[str], error: str):
+    db.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_(event_ids))
+        .values(status="dead", last_error=error, lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def record_result(
+    event_ids: List[str], succeeded: bool, response_code: int, error: Optional[str] = None,
+    batch_linger_ms: Optional[int] = None,
+):
+    # A batched delivery succeeds or fails as a whole, but every event keeps its own status.
+    # Its retries share one time, aligned to the linger window, so they are claimed as one batch again.
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        events = db.query(WebhookEvent).filter(WebhookEvent.id.in_(event_ids)).all()
+        batch_retry_at = None
+        if batch_linger_ms is not None and events:
+            attempts = max(event.attempts or 0 for event in events) + 1
+            batch_retry_at = batch_due_at(now + timedelta(seconds=backoff_delay(attempts)), batch_linger_ms)
+        for event in events:
+            event.attempts = (event.attempts or 0) + 1
+            event.response_code = response_code
+            event.lease_owner = None
+            event.lease_expires_at = None
+            if succeeded:
+                event.status = "success"
+                event.delivered_at = now
+                event.last_error = None
+            elif event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                event.status = "dead"
+                event.last_error = error or f"HTTP {response_code}"
+                logger.warning(f"Webhook event {event.id} dead-lettered after {event.attempts} attempts")
+            else:
+                event.status = "pending"
+                event.last_error = error or f"HTTP {response_code}"
+                event.next_attempt_at = batch_retry_at or now + timedelta(seconds=backoff_delay(event.attempts))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,387 @@
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Iterator, List, Optional
+from sqlalchemy import Column, MetaData, Table, and_, case, delete, func, or_, select, text
+from sqlalchemy.orm import Session
+from ..database import SessionLocal, get_engine
+from .. import models  # noqa: F401  (registers Organization/User for relationship resolution)
+from ..api_keys import models as api_key_models  # noqa: F401
+from .models import WebhookEvent, WebhookSubscription
+import argparse
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Events older than this many whole days are archived and removed from the hot table.
+# Keep it well beyond the retry horizon (WEBHOOK_MAX_ATTEMPTS with backoff), since a day goes as a whole.
+WEBHOOK_RETENTION_DAYS = int(os.getenv("WEBHOOK_RETENTION_DAYS", "30"))
+WEBHOOK_ARCHIVE_DIR = os.getenv("WEBHOOK_ARCHIVE_DIR", "./webhook_archive")
+# PostgreSQL: daily partitions created this many days ahead of today
+WEBHOOK_PARTITION_DAYS_AHEAD = int(os.getenv("WEBHOOK_PARTITION_DAYS_AHEAD", "7"))
+# Run retention periodically inside the API process; otherwise run `python -m app.webhooks.retention` from cron
+WEBHOOK_RETENTION_IN_APP = os.getenv("WEBHOOK_RETENTION_IN_APP", "false").lower() == "true"
+WEBHOOK_RETENTION_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_RETENTION_INTERVAL_SECONDS", "3600"))
+
+PARENT_TABLE = WebhookEvent.__tablename__
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{8}})$")
+# Archive directory for events whose subscription no longer exists. Nobody can prove ownership of
+# those any more, so they are kept for operators and never served by the export endpoint.
+_ORPHANED = "_orphaned"
+# Archive directory for subscriptions of users outside any organization
+_NO_ORGANIZATION = "_no_organization"
+# A day with more unsettled events than this is left whole until they settle
+_KEPT_IDS_MAX = 10000
+_ARCHIVE_COLUMNS = [column.name for column in WebhookEvent.__table__.columns if column.name not in ("lease_owner", "lease_expires_at")]
+
+
+def archive_key(organization_id: Optional[str]) -> str:
+    # Archive directory of an existing subscription
+    return organization_id or _NO_ORGANIZATION
+
+
+def _settled(table, now: datetime):
+    # Delivered or given up on, and not leased by a worker that may still write to it
+    return and_(
+        table.c.status.in_(("success", "dead")),
+        or_(table.c.lease_expires_at.is_(None), table.c.lease_expires_at <= now),
+    )
+
+
+def partition_name(day: date) -> str:
+    return f"{PARENT_TABLE}_p{day:%Y%m%d}"
+
+
+def _day_bounds(day: date):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.bind.dialect.name != "postgresql":
+        return False
+    return db.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": PARENT_TABLE}
+    ).first() is not None
+
+
+def ensure_partitions(db: Session, today: Optional[date] = None, days_ahead: int = WEBHOOK_PARTITION_DAYS_AHEAD) -> List[str]:
+    """Creates the default partition and daily partitions up to ``days_ahead`` days out.
+
+    The default partition catches rows for days without a partition, so
+    inserts never fail; retention purges it with range deletes.
+    """
+    if not is_partitioned(db):
+        return []
+    today = today or datetime.utcnow().date()
+    created = []
+    db.execute(text(f"CREATE TABLE IF NOT EXISTS {PARENT_TABLE}_default PARTITION OF {PARENT_TABLE} DEFAULT"))
+    db.commit()
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        name = partition_name(day)
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            continue
+        start, end = _day_bounds(day)
+        try:
+            db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}+00') TO ('{end.isoformat()}+00')"
+            ))
+            db.commit()
+            created.append(name)
+        except Exception as e:
+            # Typically the default partition already holds rows for that day
+            db.rollback()
+            logger.warning(f"Could not create partition {name}: {e}")
+    return created
+
+
+class ArchiveWriter:
+    """Gzipped NDJSON archives, one file per organization and day.
+
+    Files are written to a temporary name and renamed into place. If a file
+    for the same day already exists (a run interrupted between archiving and
+    deleting, or late rows), the new rows are appended as another gzip
+    member and ids already in the file are skipped, so nothing is archived
+    twice.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def path(self, organization_id: str, day: date) -> str:
+        return os.path.join(self.base_dir, organization_id, f"{day.isoformat()}.ndjson.gz")
+
+    def write_day(self, day: date, rows: Iterable[dict]) -> int:
+        # `rows` must be grouped by their "archive_key" entry, which is not written
+        written = 0
+        current, out, tmp_path, seen = None, None, None, set()
+        try:
+            for row in rows:
+                organization_id = row.pop("archive_key")
+                if organization_id != current:
+                    if out is not None:
+                        self._commit(out, tmp_path, current, day)
+                    current = organization_id
+                    out, tmp_path, seen = self._open(organization_id, day)
+                if row["id"] in seen:
+                    continue
+                out.write(json.dumps(row, default=_json_default, separators=(",", ":")).encode() + b"\n")
+                written += 1
+            if out is not None:
+                self._commit(out, tmp_path, current, day)
+                out = None
+        finally:
+            if out is not None:
+                out.close()
+                os.unlink(tmp_path)
+        return written
+
+    def _open(self, organization_id: str, day: date):
+        path = self.path(organization_id, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        seen = set()
+        if os.path.exists(path):
+            seen = {json.loads(line)["id"] for line in self._lines(path)}
+            shutil.copyfile(path, tmp_path)
+        return gzip.open(tmp_path, "ab"), tmp_path, seen
+
+    def _commit(self, out, tmp_path: str, organization_id: str, day: date):
+        out.close()
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(organization_id, day))
+
+    @staticmethod
+    def _lines(path: str) -> Iterator[bytes]:
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+    def read(self, organization_id: str, start: date, end: date) -> Iterator[bytes]:
+        # Archived NDJSON lines for days in [start, end), oldest first
+        day = start
+        while day < end:
+            path = self.path(organization_id, day)
+            if os.path.exists(path):
+                yield from self._lines(path)
+            day += timedelta(days=1)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _source_table(name: str) -> Table:
+    # Same columns as webhook_events under another name, e.g. a detached partition
+    return Table(name, MetaData(), *(Column(column.name, column.type) for column in WebhookEvent.__table__.columns))
+
+
+def _archive_rows(db: Session, table: Table, *criteria) -> Iterator[dict]:
+    key = case(
+        (WebhookSubscription.id.is_(None), _ORPHANED),
+        else_=func.coalesce(WebhookSubscription.organization_id, _NO_ORGANIZATION),
+    ).label("archive_key")
+    query = (
+        select(*(table.c[name] for name in _ARCHIVE_COLUMNS), WebhookSubscription.organization_id, key)
+        .outerjoin(WebhookSubscription, WebhookSubscription.id == table.c.subscription_id)
+        .where(*criteria)
+        .order_by(key, table.c.created_at, table.c.id)
+        .execution_options(yield_per=1000)
+    )
+    for row in db.execute(query):
+        yield dict(row._mapping)
+
+
+class RetentionManager:
+    """Moves expired days of webhook_events to compressed archives.
+
+    On a partitioned PostgreSQL table, expired daily partitions are
+    detached, archived and dropped whole. Anything else (SQLite, an
+    unpartitioned table, rows in the default partition, partitions still
+    holding undelivered events) is archived and removed with one range
+    DELETE per day. Events still pending or leased are never removed: they
+    stay, counted as kept, until a later run finds them settled.
+    """
+
+    def __init__(self, retention_days: int, archive: ArchiveWriter):
+        self.retention_days = retention_days
+        self.archive = archive
+
+    def cutoff(self, now: Optional[datetime] = None) -> date:
+        # First day that is kept
+        return (now or datetime.utcnow()).date() - timedelta(days=self.retention_days)
+
+    def run(self, now: Optional[datetime] = None) -> dict:
+        os.makedirs(self.archive.base_dir, exist_ok=True)
+        with open(os.path.join(self.archive.base_dir, ".retention.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Webhook retention already running on this host")
+                return {"skipped": True}
+            with get_engine().connect() as lock_conn:
+                if lock_conn.dialect.name == "postgresql" and not lock_conn.execute(
+                    text("SELECT pg_try_advisory_lock(hashtext('webhook_event_retention'))")
+                ).scalar():
+                    logger.info("Webhook retention already running on another host")
+                    return {"skipped": True}
+                try:
+                    return self._run(now)
+                finally:
+                    if lock_conn.dialect.name == "postgresql":
+                        lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext('webhook_event_retention'))"))
+
+    def _run(self, now: Optional[datetime]) -> dict:
+        cutoff = self.cutoff(now)
+        summary = {
+            "cutoff": cutoff.isoformat(), "partitions_dropped": [], "days_purged": [], "rows_archived": 0, "rows_kept": 0,
+        }
+        with SessionLocal() as db:
+            if is_partitioned(db):
+                ensure_partitions(db, (now or datetime.utcnow()).date())
+                for name, day in self._expired_partitions(db, cutoff):
+                    written = self._drop_partition(db, name, day)
+                    if written is not None:
+                        summary["rows_archived"] += written
+                        summary["partitions_dropped"].append(name)
+            for day in self._expired_days(db, cutoff):
+                written, kept = self._purge_day(db, day)
+                summary["rows_archived"] += written
+                summary["rows_kept"] += kept
+                summary["days_purged"].append(day.isoformat())
+        if summary["rows_archived"]:
+            logger.info(
+                f"Archived {summary['rows_archived']} webhook events before {cutoff} "
+                f"({len(summary['partitions_dropped'])} partitions, {len(summary['days_purged'])} range deletes)"
+            )
+        if summary["rows_kept"]:
+            logger.warning(
+                f"Kept {summary['rows_kept']} expired webhook events before {cutoff} that are still pending or leased"
+            )
+        return summary
+
+    def _expired_partitions(self, db: Session, cutoff: date):
+        # Attached partitions, and ones left detached by an interrupted run
+        names = db.execute(
+            text("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE :pattern"),
+            {"pattern": f"{PARENT_TABLE}_p%"},
+        ).scalars()
+        expired = []
+        for name in names:
+            match = _PARTITION_NAME.match(name)
+            if match:
+                day = datetime.strptime(match.group(1), "%Y%m%d").date()
+                if day < cutoff:
+                    expired.append((name, day))
+        return sorted(expired, key=lambda item: item[1])
+
+    def _drop_partition(self, db: Session, name: str, day: date) -> Optional[int]:
+        # None when the partition still holds unsettled events; the range delete then handles its settled rows
+        attached = db.execute(
+            text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name)"), {"name": name}
+        ).first() is not None
+        if attached:
+            table = _source_table(name)
+            if db.execute(select(table.c.id).where(~_settled(table, datetime.utcnow())).limit(1)).first() is not None:
+                return None
+            # Detaching first takes the partition out of every query before the slow archive step
+            db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            db.commit()
+        written = self.archive.write_day(day, _archive_rows(db, _source_table(name)))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        return written
+
+    def _expired_days(self, db: Session, cutoff: date) -> List[date]:
+        start, _ = _day_bounds(cutoff)
+        oldest = db.execute(select(func.min(WebhookEvent.created_at)).where(WebhookEvent.created_at < start)).scalar()
+        if oldest is None:
+            return []
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        return [oldest.date() + timedelta(days=offset) for offset in range((cutoff - oldest.date()).days)]
+
+    def _purge_day(self, db: Session, day: date):
+        # (rows archived, unsettled rows kept for a later run)
+        start, end = _day_bounds(day)
+        in_day = (WebhookEvent.created_at >= start, WebhookEvent.created_at < end)
+        # Taken before archiving: a row that settles in between is in neither the archive nor the delete
+        kept = db.execute(
+            select(WebhookEvent.id).where(*in_day, ~_settled(WebhookEvent.__table__, datetime.utcnow()))
+        ).scalars().all()
+        if len(kept) > _KEPT_IDS_MAX:
+            return 0, len(kept)
+        archived = (*in_day, _settled(WebhookEvent.__table__, datetime.utcnow()), WebhookEvent.id.not_in(kept))
+        written = self.archive.write_day(day, _archive_rows(db, WebhookEvent.__table__, *archived))
+        # Rows inserted for this day after the archive query (clock skew) are left for the next run
+        db.execute(
+            delete(WebhookEvent)
+            .where(*archived, WebhookEvent.created_at <= datetime.utcnow() - timedelta(days=self.retention_days))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return written, len(kept)
+
+
+retention_manager = RetentionManager(WEBHOOK_RETENTION_DAYS, ArchiveWriter(WEBHOOK_ARCHIVE_DIR))
+
+
+class RetentionRunner:
+    # Background thread for WEBHOOK_RETENTION_IN_APP; every worker may run one, the locks keep runs exclusive
+
+    def __init__(self, manager: RetentionManager, interval: float):
+        self.manager = manager
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.manager.run()
+            except Exception as e:
+                logger.error(f"Webhook retention failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="webhook-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+
+retention_runner = RetentionRunner(retention_manager, WEBHOOK_RETENTION_INTERVAL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and remove expired webhook events.")
+    parser.add_argument("--partitions-only", action="store_true", help="only create upcoming partitions (PostgreSQL)")
+    args = parser.parse_args()
+    if args.partitions_only:
+        with SessionLocal() as db:
+            print(json.dumps({"created": ensure_partitions(db)}))
+        return
+    print(json.dumps(retention_manager.run()))
+
+
+if __name__ == "__main__":
+    # python -m app.webhooks.retention  (e.g. daily from cron)
+    logging.basicConfig(level=logging.INFO)
+    main()
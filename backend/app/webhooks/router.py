@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Any, List, Literal, Optional
+from ..database import get_async_db, get_async_read_db
 from ..auth.dependencies import get_current_user
-from ..models import User
-from .models import WebhookSubscription
-from pydantic import BaseModel, HttpUrl
-from datetime import datetime
+from ..auth.principal import Principal
+from ..pagination import keyset_page, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from .models import WebhookEvent, WebhookSubscription, WebhookSubscriptionEvent
+from .retention import archive_key, retention_manager
+from .worker import WEBHOOK_BATCHING_AVAILABLE
+from pydantic import BaseModel, HttpUrl, Field
+from datetime import date, datetime, timedelta
+import json
 import secrets
 
 router = APIRouter()
@@ -14,6 +21,9 @@ router = APIRouter()
 class WebhookCreate(BaseModel):
     url: HttpUrl
     events: List[str]
+    batch_enabled: bool = False
+    batch_max_size: int = Field(100, ge=1, le=1000)
+    batch_linger_ms: int = Field(1000, ge=10, le=60000)
 
 class WebhookResponse(BaseModel):
     id: str
@@ -21,6 +31,9 @@ class WebhookResponse(BaseModel):
     events: List[str]
     is_active: bool
     created_at: datetime
+    batch_enabled: bool
+    batch_max_size: int
+    batch_linger_ms: int
 
     class Config:
         from_attributes = True
@@ -28,41 +41,179 @@ class WebhookResponse(BaseModel):
 class WebhookCreatedResponse(WebhookResponse):
     secret: str # Only returned once
 
+class WebhookEventResponse(BaseModel):
+    id: str
+    event_type: str
+    payload: Any
+    status: str
+    response_code: Optional[int] = None
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    next_attempt_at: Optional[datetime] = None
+    delivered_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 @router.get("/", response_model=List[WebhookResponse])
-def list_webhooks(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def list_webhooks(
+    response: Response,
+    is_active: Optional[bool] = None,
+    # Only subscriptions receiving this event type
+    event_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    # Newest first; pass limit to paginate, then the previous page's X-Next-Cursor header to continue.
+    # Without either, every row is returned.
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    query = select(WebhookSubscription).where(WebhookSubscription.user_id == current_user.id)
+    if is_active is not None:
+        query = query.where(WebhookSubscription.is_active == is_active)
+    if event_type is not None:
+        # Probes the routing index's primary key per candidate row
+        query = query.where(
+            select(WebhookSubscriptionEvent.subscription_id).where(
+                WebhookSubscriptionEvent.subscription_id == WebhookSubscription.id,
+                WebhookSubscriptionEvent.event_type == event_type,
+            ).exists()
+        )
+    if start is not None:
+        query = query.where(WebhookSubscription.created_at >= start)
+    if end is not None:
+        query = query.where(WebhookSubscription.created_at < end)
+    return await keyset_page(db, query, WebhookSubscription, cursor, limit, response)
+
+@router.get("/{webhook_id}/events", response_model=List[WebhookEventResponse])
+async def list_webhook_events(
+    webhook_id: str,
+    response: Response,
+    status: Optional[Literal["pending", "success", "dead"]] = None,
+    event_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    # Newest first; pass the previous page's X-Next-Cursor header to continue
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    # Delivery history of one subscription
+    owned = await db.scalar(
+        select(WebhookSubscription.id).where(
+            WebhookSubscription.id == webhook_id, WebhookSubscription.user_id == current_user.id
+        )
+    )
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Webhook not found")
+
+    query = select(WebhookEvent).where(WebhookEvent.subscription_id == webhook_id)
+    if status is not None:
+        query = query.where(WebhookEvent.status == status)
+    if event_type is not None:
+        query = query.where(WebhookEvent.event_type == event_type)
+    if start is not None:
+        query = query.where(WebhookEvent.created_at >= start)
+    if end is not None:
+        query = query.where(WebhookEvent.created_at < end)
+    return await keyset_page(db, query, WebhookEvent, cursor, limit, response)
+
+# Longest span one archive export may cover
+ARCHIVE_EXPORT_MAX_DAYS = 366
+
+def _archived_events(key: str, webhook_id: str, start: date, end: date, status, event_type):
+    # Runs in the threadpool as the response streams; one archive file open at a time
+    for line in retention_manager.archive.read(key, start, end):
+        event = json.loads(line)
+        if event["subscription_id"] != webhook_id:
+            continue
+        if status is not None and event["status"] != status:
+            continue
+        if event_type is not None and event["event_type"] != event_type:
+            continue
+        yield line
+
+@router.get("/{webhook_id}/events/archive")
+async def export_archived_events(
+    webhook_id: str,
+    start: date,
+    # Exclusive; defaults to the day after start
+    end: Optional[date] = None,
+    status: Optional[Literal["pending", "success", "dead"]] = None,
+    event_type: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    return db.query(WebhookSubscription).filter(WebhookSubscription.user_id == current_user.id).all()
+    # Deliveries moved out of the database by retention, as NDJSON, oldest first. Only existing
+    # subscriptions can be exported: archives of deleted ones have no owner left to check against.
+    owned = (await db.execute(
+        select(WebhookSubscription.organization_id).where(
+            WebhookSubscription.id == webhook_id, WebhookSubscription.user_id == current_user.id
+        )
+    )).first()
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    end = end or start + timedelta(days=1)
+    if not start < end <= start + timedelta(days=ARCHIVE_EXPORT_MAX_DAYS):
+        raise HTTPException(
+            status_code=400, detail=f"end must be after start and at most {ARCHIVE_EXPORT_MAX_DAYS} days later"
+        )
+    return StreamingResponse(
+        _archived_events(archive_key(owned.organization_id), webhook_id, start, end, status, event_type),
+        media_type="application/x-ndjson",
+    )
 
 @router.post("/", response_model=WebhookCreatedResponse)
-def create_webhook(
+async def create_webhook(
     webhook_data: WebhookCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    if webhook_data.batch_enabled and not WEBHOOK_BATCHING_AVAILABLE:
+        # The events would sit in the outbox with nothing to send them
+        raise HTTPException(
+            status_code=400,
+            detail="Batched delivery needs an outbox worker; set WEBHOOK_WORKER_DEPLOYED or WEBHOOK_RUN_WORKER_IN_APP",
+        )
     new_webhook = WebhookSubscription(
         url=str(webhook_data.url),
         events=webhook_data.events,
         secret=secrets.token_hex(24),
+        batch_enabled=webhook_data.batch_enabled,
+        batch_max_size=webhook_data.batch_max_size,
+        batch_linger_ms=webhook_data.batch_linger_ms,
         user_id=current_user.id,
         organization_id=current_user.organization_id
     )
+    # Routing index rows let dispatch_event find subscribers with one indexed lookup
+    new_webhook.event_routes = [
+        WebhookSubscriptionEvent(event_type=event_type, organization_id=current_user.organization_id)
+        for event_type in dict.fromkeys(webhook_data.events)
+    ]
     db.add(new_webhook)
-    db.commit()
-    db.refresh(new_webhook)
+    await db.commit()
+    await db.refresh(new_webhook)
     return new_webhook
 
 @router.delete("/{webhook_id}")
-def delete_webhook(
+async def delete_webhook(
     webhook_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    webhook = db.query(WebhookSubscription).filter(WebhookSubscription.id == webhook_id, WebhookSubscription.user_id == current_user.id).first()
+    # Routes are loaded up front so the delete-orphan cascade doesn't need a lazy load
+    webhook = await db.scalar(
+        select(WebhookSubscription)
+        .options(selectinload(WebhookSubscription.event_routes))
+        .where(WebhookSubscription.id == webhook_id, WebhookSubscription.user_id == current_user.id)
+    )
     if not webhook:
         raise HTTPException(status_code=404, detail="Webhook not found")
     
-    db.delete(webhook)
-    db.commit()
+    await db.delete(webhook)
+    await db.commit()
     return {"message": "Webhook deleted"}
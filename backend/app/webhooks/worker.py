@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from ..database import SessionLocal
+from .. import models  # noqa: F401  (registers Organization/User for relationship resolution)
+from ..api_keys import models as api_key_models  # noqa: F401
+from .delivery import delivery_engine, WebhookDelivery, WebhookDeliveryEngine, encode_payload, encode_batch, BATCH_EVENT_TYPE
+from .outbox import claim_due_events, mark_dead
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKER_BATCH_SIZE = int(os.getenv("WEBHOOK_WORKER_BATCH_SIZE", "100"))
+WEBHOOK_WORKER_POLL_SECONDS = float(os.getenv("WEBHOOK_WORKER_POLL_SECONDS", "1"))
+# Run the outbox worker inside the API process (handy for development)
+WEBHOOK_RUN_WORKER_IN_APP = os.getenv("WEBHOOK_RUN_WORKER_IN_APP", "false").lower() == "true"
+# Set where `python -m app.webhooks.worker` is deployed alongside the API
+WEBHOOK_WORKER_DEPLOYED = os.getenv("WEBHOOK_WORKER_DEPLOYED", "false").lower() == "true"
+# Batched events are only ever sent by an outbox worker, never inline
+WEBHOOK_BATCHING_AVAILABLE = WEBHOOK_RUN_WORKER_IN_APP or WEBHOOK_WORKER_DEPLOYED
+
+
+class OutboxWorker:
+    """Claims due outbox events in batches and feeds them to the delivery engine.
+
+    Several workers can run side by side: claims are leased, using
+    SKIP LOCKED on PostgreSQL, so throughput scales with worker processes.
+    """
+
+    def __init__(self, engine: WebhookDeliveryEngine, batch_size: int, poll_interval: float):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = None
+        self._task = None
+        self._db_executor = None
+
+    def _claim(self, limit: int):
+        db = SessionLocal()
+        try:
+            deliveries, orphaned, batches = [], [], {}
+            for event, subscription in claim_due_events(db, self.owner, limit):
+                if subscription is None or not subscription.is_active:
+                    orphaned.append(event.id)
+                    continue
+                if subscription.batch_enabled:
+                    batches.setdefault(subscription.id, (subscription, []))[1].append(event)
+                    continue
+                deliveries.append(WebhookDelivery(
+                    event_ids=(event.id,),
+                    subscription_id=subscription.id,
+                    url=subscription.url,
+                    secret=subscription.secret,
+                    event_type=event.event_type,
+                    body=encode_payload(event.payload),
+                ))
+            for subscription, events in batches.values():
+                deliveries.extend(self._batch_deliveries(subscription, events))
+            if orphaned:
+                mark_dead(db, orphaned, "Subscription deleted or inactive")
+            return deliveries
+        finally:
+            db.close()
+
+    def _batch_deliveries(self, subscription, events):
+        # One signed envelope per batch_max_size events for the same endpoint
+        size = max(subscription.batch_max_size or 1, 1)
+        for start in range(0, len(events), size):
+            chunk = events[start:start + size]
+            yield WebhookDelivery(
+                event_ids=tuple(event.id for event in chunk),
+                subscription_id=subscription.id,
+                url=subscription.url,
+                secret=subscription.secret,
+                event_type=BATCH_EVENT_TYPE,
+                body=encode_batch([
+                    {"id": event.id, "event_type": event.event_type, "payload": event.payload}
+                    for event in chunk
+                ]),
+                batch_linger_ms=subscription.batch_linger_ms,
+            )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            capacity = self.batch_size - self.engine.pending
+            deliveries = []
+            if capacity > 0:
+                try:
+                    deliveries = await loop.run_in_executor(self._db_executor, self._claim, capacity)
+                except Exception as e:
+                    logger.error(f"Failed to claim webhook events: {e}")
+            for delivery in deliveries:
+                self.engine.submit(delivery)
+            if len(deliveries) < capacity or capacity <= 0:
+                # Nothing more is due (or we're saturated); wait before polling again
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self):
+        await self.engine.start()
+        self._stopping = asyncio.Event()
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-outbox")
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        self._db_executor.shutdown(wait=True)
+
+
+outbox_worker = OutboxWorker(
+    engine=delivery_engine,
+    batch_size=WEBHOOK_WORKER_BATCH_SIZE,
+    poll_interval=WEBHOOK_WORKER_POLL_SECONDS,
+)
+
+
+async def main():
+    await outbox_worker.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info(f"Webhook outbox worker {outbox_worker.owner} started")
+    await stop.wait()
+    await outbox_worker.stop()
+    await delivery_engine.stop()
+
+
+if __name__ == "__main__":
+    # python -m app.webhooks.worker
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
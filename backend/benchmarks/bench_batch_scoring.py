@@ -0,0 +1,169 @@
+"""Per-transaction cost of bulk scoring versus N single-transaction calls.
+
+Run from backend/:  python -m benchmarks.bench_batch_scoring [N]
+
+Uses a throwaway SQLite database; scoring runs against the default rule set.
+
+Before timing anything, both paths score the same edge-case inputs under a
+rule set that uses every rule type and comparison, and must agree.
+
+Measures two levels:
+  * core  - score_batch() over N transactions vs N score_transaction() calls
+  * http  - one POST /transactions/submit/batch vs N POST /transactions/submit,
+            driven in-process through the ASGI app (no network)
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+# Measures scoring cost, not admission control
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx
+from fastapi import FastAPI
+
+from app.database import Base, get_engine
+from app import models  # noqa: F401
+from app.api_keys import models as api_key_models  # noqa: F401
+from app.webhooks import models as webhook_models  # noqa: F401
+from app.auth.dependencies import get_principal
+from app.auth.principal import Principal
+from app.modules.antifraud.router import router, TransactionCreate
+from app.modules.antifraud.rules import CompiledRuleSet, RuleSetDefinition, rule_plan_cache
+from app.modules.antifraud.scoring import score_batch, score_transaction
+from app.modules.antifraud.velocity import VelocityStore, velocity_store
+
+
+def make_transactions(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        TransactionCreate(
+            transaction_id=f"tx_{i}",
+            amount=round(rng.uniform(1, 20000), 2),
+            currency=rng.choice(["USD", "EUR", "UZS"]),
+            merchant=f"merchant_{rng.randint(1, 500)}",
+            location=rng.choice(["Tashkent", "Samarkand", "Bukhara"]),
+            card_id=f"card_{rng.randint(1, 2000)}",
+        )
+        for i in range(count)
+    ]
+
+
+PARITY_RULE_SET = RuleSetDefinition(
+    review_threshold=400,
+    rules=[
+        {"type": "threshold", "field": "amount", "op": op, "value": value, "score": 100, "reason": f"amount {op} {value}"}
+        for op in ("gt", "gte", "lt", "lte")
+        for value in (0, 100, 100, 5000)
+    ] + [
+        {"type": "threshold", "field": "card_tx_count_1m", "op": "gte", "value": 2, "score": 50, "reason": "velocity"},
+        {"type": "in_set", "field": "location", "values": ["Bukhara"], "score": 200, "reason": "location"},
+        {"type": "in_set", "field": "currency", "values": ["USD", "EUR"], "negate": True, "score": 150, "reason": "currency"},
+        {"type": "currency_limit", "limits": {"USD": 100, "EUR": 5000}, "default_limit": 0, "score": 300, "reason": "limit"},
+        {"type": "currency_limit", "limits": {"UZS": 100}, "score": -100, "reason": "limit, no default"},
+    ],
+)
+
+
+def check_parity():
+    # Amounts on, just around and far from every limit, across known and unknown currencies
+    amounts = [-1, 0, 1e-9, 99.99, 100, 100.01, 4999.99, 5000, 5000.01, 1e300]
+    transactions = [
+        TransactionCreate(
+            transaction_id=f"edge_{i}_{currency}_{location}",
+            amount=amount,
+            currency=currency,
+            merchant="merchant",
+            location=location,
+            card_id="card_1",
+        )
+        for i, amount in enumerate(amounts)
+        for currency in ("USD", "EUR", "UZS", "GBP")
+        for location in ("Tashkent", "Bukhara")
+    ]
+    plan = CompiledRuleSet(PARITY_RULE_SET)
+    store = VelocityStore(max_entities=100, idle_seconds=86400)
+    observed = [store.observe(t, now=0.0) for t in transactions]
+    single = [score_transaction(plan, t) for t in observed]
+    batch = score_batch(plan, observed)
+    for expected, actual in zip(single, batch):
+        assert expected == actual, f"batch scoring diverges: {expected} != {actual}"
+    return len(transactions)
+
+
+def bench_core(transactions):
+    plan = rule_plan_cache.default_plan
+    # Fixed clock and a fresh store per run so both paths see identical velocity features
+    start = time.perf_counter()
+    store = VelocityStore(max_entities=100000, idle_seconds=86400)
+    single = [score_transaction(plan, store.observe(t, now=0.0)) for t in transactions]
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = VelocityStore(max_entities=100000, idle_seconds=86400)
+    batch = score_batch(plan, [store.observe(t, now=0.0) for t in transactions])
+    batch_elapsed = time.perf_counter() - start
+
+    assert single == batch, "batch results diverge from the single-transaction path"
+    return single_elapsed, batch_elapsed
+
+
+async def bench_http(transactions, single_calls):
+    Base.metadata.create_all(bind=get_engine())
+    app = FastAPI()
+    app.include_router(router, prefix="/api/antifraud")
+    # Authentication is benchmarked separately; pin a caller with no custom rule set
+    app.dependency_overrides[get_principal] = lambda: Principal(
+        id="bench", email="bench@example.com", organization_id="bench-org", role="org_admin"
+    )
+    headers = {}
+    payloads = [t.model_dump() for t in transactions]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        start = time.perf_counter()
+        single = []
+        for payload in payloads[:single_calls]:
+            response = await client.post("/api/antifraud/transactions/submit", json=payload, headers=headers)
+            single.append(response.json())
+        single_elapsed = time.perf_counter() - start
+
+        # Start the batch from the same empty velocity state the single calls saw
+        velocity_store.clear()
+        body = "\n".join(json.dumps(p) for p in payloads).encode()
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/antifraud/transactions/submit/batch",
+            content=body,
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+        )
+        batch_elapsed = time.perf_counter() - start
+        batch = response.json()
+
+    assert batch[:single_calls] == single, "HTTP batch results diverge from single submissions"
+    return single_elapsed / single_calls, batch_elapsed / len(transactions)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    transactions = make_transactions(count)
+    print(f"parity: {check_parity()} edge-case transactions scored identically by both paths")
+
+    single_elapsed, batch_elapsed = bench_core(transactions)
+    print(f"core  N={count}")
+    print(f"  single: {single_elapsed / count * 1e6:8.2f} us/tx")
+    print(f"  batch:  {batch_elapsed / count * 1e6:8.2f} us/tx  ({single_elapsed / batch_elapsed:.1f}x)")
+
+    single_calls = min(count, 1000)
+    single_per_tx, batch_per_tx = asyncio.run(bench_http(transactions, single_calls))
+    print(f"http  N={count} (single path sampled over {single_calls} requests)")
+    print(f"  single: {single_per_tx * 1e6:8.2f} us/tx")
+    print(f"  batch:  {batch_per_tx * 1e6:8.2f} us/tx  ({single_per_tx / batch_per_tx:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
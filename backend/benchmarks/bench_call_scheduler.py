@@ -0,0 +1,117 @@
+"""Throughput, pacing and fairness of the BankCall scheduler against the simulated dialer.
+
+Run from backend/:  python -m benchmarks.bench_call_scheduler [seconds] [time_scale]
+
+No database: calls come from an in-memory store. One large enterprise
+campaign competes with several business and starter organizations. Reports
+the dial rate against the trunks' pacing limit, each organization's peak
+concurrent calls against its tier cap, and how early each one got its
+first call out (a starved organization would wait for the big campaign).
+"""
+import asyncio
+import sys
+import time
+
+from app.modules.bankcall.dialer import SimulatedDialer
+from app.modules.bankcall.scheduler import CallScheduler, QueuedCall, tier_concurrency
+
+TRUNKS = 4
+TRUNK_CPS = 50
+TRUNK_CHANNELS = 200
+# organization -> (tier, calls queued at start)
+CAMPAIGNS = {
+    "bank_enterprise": ("enterprise", 20000),
+    "bank_business_1": ("business", 2000),
+    "bank_business_2": ("business", 2000),
+    "mfi_starter_1": ("starter", 200),
+    "mfi_starter_2": ("starter", 200),
+    "fintech_untiered": (None, 200),
+}
+
+
+class MemoryCallStore:
+    def __init__(self, calls):
+        self.calls = calls
+        self.saved = 0
+
+    def recover(self) -> int:
+        return 0
+
+    def claim(self, limit: int):
+        batch, self.calls = self.calls[:limit], self.calls[limit:]
+        return batch
+
+    def save(self, updates):
+        self.saved += len(updates)
+
+
+class TrackingDialer(SimulatedDialer):
+    # Records concurrency per organization and dial start times
+
+    def __init__(self, organizations, **kwargs):
+        super().__init__(**kwargs)
+        self.organizations = organizations
+        self.active = {}
+        self.peak = {}
+        self.first_dial = {}
+        self.starts = []
+
+    async def dial(self, phone_number: str, trunk: int):
+        organization = self.organizations[phone_number]
+        now = time.perf_counter()
+        self.starts.append(now)
+        self.first_dial.setdefault(organization, now)
+        self.active[organization] = self.active.get(organization, 0) + 1
+        self.peak[organization] = max(self.peak.get(organization, 0), self.active[organization])
+        try:
+            return await super().dial(phone_number, trunk)
+        finally:
+            self.active[organization] -= 1
+
+
+async def run(seconds: float, time_scale: float):
+    calls, organizations = [], {}
+    for organization, (tier, count) in CAMPAIGNS.items():
+        for i in range(count):
+            phone = f"{organization}:{i}"
+            organizations[phone] = organization
+            calls.append((QueuedCall(phone, organization, phone, 5, 0, {}), tier, None))
+    # The enterprise campaign was enqueued first, so FIFO alone would starve everyone else
+    store = MemoryCallStore(calls)
+    dialer = TrackingDialer(
+        organizations, answer_rate=0.6, busy_rate=0.1, failure_rate=0.02,
+        talk_seconds=60, time_scale=time_scale, seed=7,
+    )
+    scheduler = CallScheduler(
+        store=store, dialer=dialer, trunks=TRUNKS, trunk_cps=TRUNK_CPS, trunk_channels=TRUNK_CHANNELS,
+        max_attempts=3, retry_base=600 * time_scale, retry_max=3600 * time_scale,
+        poll_interval=0.05, claim_batch=50000, max_backlog=50000,
+    )
+    start = time.perf_counter()
+    scheduler.start()
+    await asyncio.sleep(seconds)
+    await scheduler.stop(drain_timeout=0)
+    return start, dialer, scheduler, store
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    time_scale = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    start, dialer, scheduler, store = asyncio.run(run(seconds, time_scale))
+    limit = TRUNKS * TRUNK_CPS
+    # Steady state: skip the first second while channels fill
+    steady = [t for t in dialer.starts if t - start >= 1.0]
+    print(f"{seconds}s at time scale {time_scale}: {len(dialer.starts)} dials, {store.saved} state changes written")
+    print(f"dial rate {len(steady) / max(seconds - 1.0, 1e-9):.0f}/s (pacing limit {limit}/s)")
+    print(f"{'organization':<20}{'tier':<12}{'cap':>6}{'peak':>6}{'first dial ms':>15}")
+    for organization, (tier, _) in CAMPAIGNS.items():
+        first = dialer.first_dial.get(organization)
+        print(
+            f"{organization:<20}{tier or '-':<12}{tier_concurrency(tier):>6}{dialer.peak.get(organization, 0):>6}"
+            f"{(first - start) * 1e3 if first else float('nan'):>15.1f}"
+        )
+    print(f"scheduler {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
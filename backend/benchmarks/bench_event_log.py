@@ -0,0 +1,83 @@
+"""Event bus cost on the producer side, and log throughput.
+
+Run from backend/:  python -m benchmarks.bench_event_log [N]
+
+Uses a throwaway log directory. Measures:
+  * publish  - per-call cost of EventBus.publish() while the writer runs
+  * append   - SegmentedLog.append() one record per call vs batches, with fsync on and off
+  * read     - sequential LogReader throughput over the whole log
+  * e2e      - time from the first publish until a consumer has seen all N events
+"""
+import sys
+import tempfile
+import threading
+import time
+
+from app.events.bus import EventBus
+from app.events.log import LogReader, SegmentedLog
+
+PAYLOAD = {"transaction_id": "tx_0", "decision": "BLOCKED", "risk_score": 90, "reasons": ["High amount"]}
+RECORD = b'{"type":"transaction.blocked","org":"org_1","ts":0,"data":{"transaction_id":"tx_0","risk_score":90}}'
+
+
+def bench_append(count: int, batch: int, fsync: bool):
+    log = SegmentedLog(tempfile.mkdtemp(), 64 * 1024 * 1024, fsync)
+    start = time.perf_counter()
+    for _ in range(0, count, batch):
+        log.append([RECORD] * batch)
+    elapsed = time.perf_counter() - start
+    return log, count / elapsed
+
+
+def bench_read(log: SegmentedLog):
+    reader = LogReader(log, 0)
+    start = time.perf_counter()
+    total = 0
+    while True:
+        records = reader.read(1000)
+        if not records:
+            break
+        total += len(records)
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return total / elapsed
+
+
+def bench_bus(count: int):
+    seen = threading.Event()
+    received = [0]
+
+    def consumer(events):
+        received[0] += len(events)
+        if received[0] >= count:
+            seen.set()
+
+    bus = EventBus(tempfile.mkdtemp(), 1, 64 * 1024 * 1024, True, 0.02, 1000, count, 0)
+    bus.subscribe("bench", consumer, batch_size=1000)
+    bus.start()
+    start = time.perf_counter()
+    for _ in range(count):
+        bus.publish("transaction.blocked", "org_1", PAYLOAD)
+    publish_elapsed = time.perf_counter() - start
+    seen.wait(60)
+    e2e = time.perf_counter() - start
+    bus.stop()
+    return publish_elapsed / count, e2e, bus.dropped
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    per_publish, e2e, dropped = bench_bus(count)
+    print(f"publish   {per_publish * 1e6:8.2f} us/call   ({count} events, {dropped} dropped)")
+    print(f"e2e       {e2e * 1e3:8.1f} ms until the consumer saw all events")
+    for fsync in (False, True):
+        for batch in (1, 100, 1000):
+            n = min(count, 2000) if batch == 1 and fsync else count
+            log, rate = bench_append(n, batch, fsync)
+            print(f"append    fsync={'on ' if fsync else 'off'} batch={batch:<5}{rate:>12.0f} records/s")
+    log, _ = bench_append(count, 1000, False)
+    print(f"read      mmap{bench_read(log):>24.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""In-process load benchmark for the API, with baseline comparison.
+
+Run from backend/:
+  python -m benchmarks.bench_load                         # run, print, save JSON
+  python -m benchmarks.bench_load --save-baseline --note "..."   # also store as the baseline
+  python -m benchmarks.bench_load --scenarios login,submit_transaction --concurrency 1,16
+
+Drives app.main.app through httpx's ASGI transport (no server, no network)
+against a throwaway SQLite database. Each scenario runs closed-loop for
+--duration seconds at every concurrency level and reports req/s and
+p50/p95/p99 latency. Results are written to benchmarks/results/ and compared
+with the stored baseline; a scenario regresses when its throughput drops, or
+its p99 rises, by more than --threshold. The exit status is 1 on regressions.
+Every report records the machine and configuration it was produced with;
+numbers are only comparable against a baseline from a similar machine.
+
+Lifespan hooks are not run: the schema is created up front, background
+flushers and the webhook delivery engine stay idle, so dispatch_event only
+writes outbox rows. Rate limiting is
+disabled so the numbers measure request cost rather than admission control.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.main import app
+from app.database import SessionLocal
+from app.schema import ensure_schema
+from app.webhooks.dispatcher import dispatch_event
+from app.auth.jwt import BCRYPT_ROUNDS
+from app.pagination import PAGE_SIZE_DEFAULT
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "baseline_load.json")
+# Subscriptions each dispatched event fans out to
+FANOUT_SUBSCRIPTIONS = 20
+
+TRANSACTION = {"amount": 120.5, "currency": "UZS", "merchant": "merchant_1", "location": "Tashkent"}
+CALL = {"phone_number": "+998901234567", "scenario_id": "reminder", "customer_name": "Bench"}
+
+
+class Context:
+    # Credentials and counters shared by the scenarios of one run
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.sequence = 0
+        self.token_headers = {}
+        self.api_key_headers = {}
+        self.organization_id = None
+
+    def next_id(self, prefix: str) -> str:
+        self.sequence += 1
+        return f"{prefix}_{self.sequence}"
+
+
+async def setup(ctx: Context):
+    user = {"email": "bench@example.com", "password": "bench-password", "full_name": "Bench", "organization_name": "Bench"}
+    response = await ctx.client.post("/auth/register", json=user)
+    response.raise_for_status()
+    ctx.organization_id = response.json()["organization_id"]
+    response = await ctx.client.post("/auth/login", data={"username": user["email"], "password": user["password"]})
+    ctx.token_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await ctx.client.post("/api/keys/", json={"name": "bench"}, headers=ctx.token_headers)
+    ctx.api_key_headers = {"X-API-Key": response.json()["key"]}
+    for i in range(FANOUT_SUBSCRIPTIONS):
+        response = await ctx.client.post(
+            "/api/webhooks/",
+            json={"url": f"http://127.0.0.1:9/hook/{i}", "events": ["transaction.blocked"]},
+            headers=ctx.token_headers,
+        )
+        response.raise_for_status()
+
+
+# Each scenario performs one operation and returns whether it succeeded
+
+async def register(ctx: Context) -> bool:
+    user = {
+        "email": f"{ctx.next_id('user')}@example.com", "password": "bench-password",
+        "full_name": "Bench", "organization_name": "Bench",
+    }
+    return (await ctx.client.post("/auth/register", json=user)).is_success
+
+
+async def login(ctx: Context) -> bool:
+    data = {"username": "bench@example.com", "password": "bench-password"}
+    return (await ctx.client.post("/auth/login", data=data)).is_success
+
+
+async def api_key_auth(ctx: Context) -> bool:
+    # The cheapest API-key endpoint, so the number is dominated by key resolution
+    return (await ctx.client.post("/api/bankcall/calls/initiate", json=CALL, headers=ctx.api_key_headers)).is_success
+
+
+async def submit_transaction(ctx: Context) -> bool:
+    payload = {**TRANSACTION, "transaction_id": ctx.next_id("tx"), "card_id": f"card_{random.randint(1, 1000)}"}
+    response = await ctx.client.post("/api/antifraud/transactions/submit", json=payload, headers=ctx.token_headers)
+    return response.is_success
+
+
+async def submit_transaction_api_key(ctx: Context) -> bool:
+    payload = {**TRANSACTION, "transaction_id": ctx.next_id("tx"), "card_id": f"card_{random.randint(1, 1000)}"}
+    response = await ctx.client.post("/api/antifraud/transactions/submit", json=payload, headers=ctx.api_key_headers)
+    return response.is_success
+
+
+async def initiate_call(ctx: Context) -> bool:
+    return (await ctx.client.post("/api/bankcall/calls/initiate", json=CALL, headers=ctx.token_headers)).is_success
+
+
+async def webhook_create(ctx: Context) -> bool:
+    payload = {"url": f"http://127.0.0.1:9/{ctx.next_id('hook')}", "events": ["call.completed"]}
+    return (await ctx.client.post("/api/webhooks/", json=payload, headers=ctx.token_headers)).is_success
+
+
+async def webhook_list(ctx: Context) -> bool:
+    # One page, as the baseline measured; unpaginated, the listing grows with every webhook_create
+    params = {"limit": PAGE_SIZE_DEFAULT}
+    return (await ctx.client.get("/api/webhooks/", params=params, headers=ctx.token_headers)).is_success
+
+
+def _dispatch(organization_id: str, transaction_id: str):
+    with SessionLocal() as db:
+        dispatch_event(db, organization_id, "transaction.blocked", {"transaction_id": transaction_id})
+
+
+async def dispatch_fanout(ctx: Context) -> bool:
+    await run_in_threadpool(_dispatch, ctx.organization_id, ctx.next_id("event"))
+    return True
+
+
+SCENARIOS = {
+    "register": register,
+    "login": login,
+    "api_key_auth": api_key_auth,
+    "submit_transaction": submit_transaction,
+    "submit_transaction_api_key": submit_transaction_api_key,
+    "initiate_call": initiate_call,
+    "webhook_create": webhook_create,
+    "webhook_list": webhook_list,
+    "dispatch_event": dispatch_fanout,
+}
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def run_scenario(ctx: Context, scenario, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = await scenario(ctx)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+    }
+
+
+async def run(scenarios, concurrency_levels, duration) -> dict:
+    ensure_schema()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ctx = Context(client)
+        await setup(ctx)
+        results = {}
+        for name in scenarios:
+            results[name] = {}
+            for concurrency in concurrency_levels:
+                stats = await run_scenario(ctx, SCENARIOS[name], concurrency, duration)
+                results[name][str(concurrency)] = stats
+                print(
+                    f"{name:<28}{concurrency:>6}{stats['rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+                    f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+                )
+    return results
+
+
+def machine() -> dict:
+    model = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            model = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), model)
+    except OSError:
+        pass
+    return {"cpu": model, "cpu_count": os.cpu_count(), "platform": platform.platform(), "python": platform.python_version()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, levels in results.items():
+        for concurrency, stats in levels.items():
+            base = baseline.get(name, {}).get(concurrency)
+            if base is None:
+                continue
+            if stats["rps"] < base["rps"] * (1 - threshold):
+                regressions.append(f"{name} @{concurrency}: {base['rps']:.1f} -> {stats['rps']:.1f} req/s")
+            if stats["p99_ms"] > base["p99_ms"] * (1 + threshold):
+                regressions.append(f"{name} @{concurrency}: p99 {base['p99_ms']:.2f} -> {stats['p99_ms']:.2f} ms")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per scenario and concurrency level")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--note", default="", help="free text stored in the report, e.g. where a baseline came from")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    random.seed(args.seed)
+
+    print(f"{'scenario':<28}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = asyncio.run(run(scenarios, concurrency_levels, args.duration))
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": machine(),
+        "config": {
+            "scenarios": scenarios,
+            "concurrency": concurrency_levels,
+            "duration": args.duration,
+            "seed": args.seed,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+        },
+        "note": args.note,
+        "duration": args.duration,
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        print(f"compared with baseline {baseline.get('revision', '?')} ({args.baseline})")
+        if baseline.get("machine") != report["machine"]:
+            print(f"  baseline is from a different machine: {baseline.get('machine')}")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if regressions:
+            status = 1
+        else:
+            print("  no regressions")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
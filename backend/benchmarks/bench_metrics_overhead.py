@@ -0,0 +1,93 @@
+"""Hot-path cost of the metrics subsystem.
+
+Run from backend/:  python -m benchmarks.bench_metrics_overhead [N]
+
+Measures:
+  * primitives - Counter.inc and Histogram.observe per call
+  * middleware - per-request cost of MetricsMiddleware, calling a FastAPI app
+                 directly over ASGI (no server, no network) with and without it
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from fastapi import FastAPI
+
+from app.metrics.instrumentation import MetricsMiddleware
+from app.metrics.registry import Counter, Histogram
+
+
+def bench_primitives(count):
+    counter = Counter("bench_total", "bench", ("route",))
+    histogram = Histogram("bench_seconds", "bench", ("route",))
+    labels = ("/bench",)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        counter.inc(labels)
+    inc_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(count):
+        histogram.observe(labels, (i % 1000) / 10000)
+    observe_elapsed = time.perf_counter() - start
+    return inc_elapsed / count, observe_elapsed / count
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: str):
+        return {"item_id": item_id}
+
+    return app
+
+
+async def drive(app, count):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/items/42", "raw_path": b"/items/42", "root_path": "",
+        "query_string": b"", "headers": [], "server": ("bench", 80), "client": ("bench", 1),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    inc, observe = bench_primitives(count * 10)
+    print(f"Counter.inc          {inc * 1e9:8.0f} ns")
+    print(f"Histogram.observe    {observe * 1e9:8.0f} ns")
+
+    plain = make_app()
+    instrumented = make_app()
+    instrumented.add_middleware(MetricsMiddleware)
+    # Warm up routing and middleware stacks before timing
+    asyncio.run(drive(plain, 100))
+    asyncio.run(drive(instrumented, 100))
+    # Alternate runs and keep the best of each so machine noise hits both sides alike
+    without, with_metrics = float("inf"), float("inf")
+    for _ in range(5):
+        without = min(without, asyncio.run(drive(plain, count)))
+        with_metrics = min(with_metrics, asyncio.run(drive(instrumented, count)))
+    print(f"request without      {without * 1e6:8.2f} us")
+    print(f"request with metrics {with_metrics * 1e6:8.2f} us  (+{(with_metrics - without) * 1e6:.2f} us)")
+
+
+if __name__ == "__main__":
+    main()
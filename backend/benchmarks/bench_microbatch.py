@@ -0,0 +1,112 @@
+"""Throughput vs p99 latency of single-transaction scoring with and without micro-batching.
+
+Run from backend/:  python -m benchmarks.bench_microbatch [SECONDS] [MODEL_MS]
+
+Closed-loop client threads each score one transaction at a time, at several
+concurrency levels. MODEL_MS adds a fixed per-call cost to every scoring call
+(single or batched) to stand in for a model whose call overhead dominates.
+Calls into the model are serialized, as with one inference session per
+worker; with 0 only the rule engine runs.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from app.modules.antifraud.batcher import MicroBatcher
+from app.modules.antifraud.rules import CompiledRuleSet, DEFAULT_RULE_SET
+from app.modules.antifraud.scoring import score_transaction
+from app.modules.antifraud.velocity import VelocityStore
+
+from .bench_batch_scoring import make_transactions
+
+CONCURRENCY = (1, 8, 32, 128)
+
+
+class ModelPlan(CompiledRuleSet):
+    # Rule plan with a fixed per-call cost, paid once per call regardless of batch size
+    def __init__(self, definition, call_seconds):
+        super().__init__(definition)
+        self.call_seconds = call_seconds
+        self._session = threading.Lock()
+
+    def evaluate(self, transaction):
+        with self._session:
+            time.sleep(self.call_seconds)
+            return super().evaluate(transaction)
+
+    def evaluate_batch(self, transactions):
+        with self._session:
+            time.sleep(self.call_seconds)
+            return super().evaluate_batch(transactions)
+
+
+def run(score, transactions, threads, seconds):
+    latencies = [[] for _ in range(threads)]
+    stop = time.perf_counter() + seconds
+
+    def client(index):
+        out = latencies[index]
+        i = index
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            score(transactions[i % len(transactions)])
+            out.append(time.perf_counter() - start)
+            i += threads
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    samples = sorted(x for out in latencies for x in out)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return len(samples) / seconds, p50, p99
+
+
+def check_histogram(plan, transactions):
+    # One batch above the largest finite bucket must land in the overflow bucket
+    size = 300
+    batcher = MicroBatcher(window=1.0, max_size=size)
+    futures = [batcher.submit(plan, t) for t in transactions[:size]]
+    for future in futures:
+        future.result()
+    stats = batcher.stats()
+    batcher.stop()
+    histogram = stats["batch_size_histogram"]
+    assert stats["max_batch_size"] == size, f"expected one batch of {size}, got {stats}"
+    assert histogram["le_+Inf"] == 1, f"batch of {size} not counted: {histogram}"
+    assert sum(histogram.values()) == stats["batches"], f"histogram misses batches: {histogram}"
+    return size
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    model_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    plan = ModelPlan(DEFAULT_RULE_SET, model_ms / 1000)
+    store = VelocityStore(max_entities=100000, idle_seconds=86400)
+    transactions = [store.observe(t) for t in make_transactions(20000)]
+    print(f"histogram: batch of {check_histogram(ModelPlan(DEFAULT_RULE_SET, 0), transactions)} counted in le_+Inf")
+
+    print(f"per-call model cost {model_ms} ms, {seconds}s per run")
+    print(f"{'mode':<10}{'threads':>8}{'tx/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for threads in CONCURRENCY:
+        throughput, p50, p99 = run(lambda t: score_transaction(plan, t), transactions, threads, seconds)
+        print(f"{'direct':<10}{threads:>8}{throughput:>12.0f}{p50 * 1e3:>10.2f}{p99 * 1e3:>10.2f}")
+
+        batcher = MicroBatcher(window=0.002, max_size=64)
+        throughput, p50, p99 = run(lambda t: batcher.score(plan, t), transactions, threads, seconds)
+        stats = batcher.stats()
+        batcher.stop()
+        print(
+            f"{'batched':<10}{threads:>8}{throughput:>12.0f}{p50 * 1e3:>10.2f}{p99 * 1e3:>10.2f}"
+            f"   mean batch {stats['mean_batch_size']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
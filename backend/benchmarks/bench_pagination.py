@@ -0,0 +1,103 @@
+"""Latency of keyset-paginated listings by page depth.
+
+Run from backend/:  python -m benchmarks.bench_pagination [N]
+
+Uses a throwaway SQLite database holding N API keys for one user, listed
+through GET /api/keys driven in-process over ASGI (no network).
+
+Before timing anything, checks that a request without limit or cursor
+still returns every key, as the listing did before pagination, and that
+walking the cursors with limit returns every key exactly once.
+
+Measures the first page and the last page: keyset pagination keeps both
+a single index range scan, so depth should not matter.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import insert
+
+from app.database import Base, SessionLocal, get_engine
+from app import models  # noqa: F401
+from app.webhooks import models as webhook_models  # noqa: F401
+from app.api_keys.models import APIKey, generate_uuid
+from app.api_keys.router import router
+from app.auth.dependencies import get_current_user
+from app.auth.principal import Principal
+from app.pagination import NEXT_CURSOR_HEADER, PAGE_SIZE_DEFAULT
+
+PRINCIPAL = Principal(id="bench", email="bench@example.com", organization_id=None, role="user")
+PAGE_SIZE = 100
+
+
+def seed(count):
+    Base.metadata.create_all(bind=get_engine())
+    start = datetime(2024, 1, 1)
+    with SessionLocal() as db:
+        db.execute(insert(APIKey), [
+            {
+                "id": generate_uuid(), "key_hash": f"hash_{i}", "prefix": "pk_bench", "name": f"key {i}",
+                "user_id": PRINCIPAL.id, "is_active": True,
+                # Every tenth key shares its timestamp with the previous one, so ties are broken by id
+                "created_at": start + timedelta(seconds=i - (i % 10 == 9)),
+            }
+            for i in range(count)
+        ])
+        db.commit()
+
+
+async def walk(client, limit):
+    # Every id across all pages, and the time taken by each page
+    ids, timings, cursor = [], [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        start = time.perf_counter()
+        response = await client.get("/api/keys/", params=params)
+        timings.append(time.perf_counter() - start)
+        ids.extend(key["id"] for key in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return ids, timings
+
+
+async def run(count):
+    seed(count)
+    app = FastAPI()
+    app.include_router(router, prefix="/api/keys")
+    app.dependency_overrides[get_current_user] = lambda: PRINCIPAL
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.get("/api/keys/")
+        assert len(response.json()) == count, f"unpaginated listing returned {len(response.json())} of {count} keys"
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+        ids, timings = await walk(client, PAGE_SIZE)
+        assert len(ids) == len(set(ids)) == count, f"cursor walk returned {len(set(ids))} distinct of {count} keys"
+
+        # A cursor alone pages with the default size
+        response = await client.get("/api/keys/", params={"limit": 1})
+        response = await client.get("/api/keys/", params={"cursor": response.headers[NEXT_CURSOR_HEADER]})
+        assert len(response.json()) == min(PAGE_SIZE_DEFAULT, count - 1)
+    print(f"listing: all {count} keys without limit; every key exactly once across {len(timings)} pages")
+
+    print(f"page  N={count} limit={PAGE_SIZE}")
+    print(f"  first: {timings[0] * 1e3:8.2f} ms")
+    print(f"  last:  {timings[-1] * 1e3:8.2f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    asyncio.run(run(count))
+
+
+if __name__ == "__main__":
+    main()
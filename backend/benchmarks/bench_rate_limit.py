@@ -0,0 +1,118 @@
+"""Per-check cost of the rate limiter backends.
+
+Run from backend/:  python -m benchmarks.bench_rate_limit [N]
+
+Uses a throwaway SQLite database and bucket file, with rate limiting on.
+
+Before timing anything, checks that a batch above the burst is served
+rather than refused, and that the debt it leaves holds back later requests:
+end to end through /transactions/submit/batch, and on both backends up to
+ANTIFRAUD_BATCH_MAX_ITEMS, across two workers for the shared backend.
+
+Measures each backend's check cost with a warm bucket (the common case);
+the SQLite backend serves most checks from its in-process lease.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+os.environ["RATE_LIMIT_ENABLED"] = "true"
+os.environ["RATE_LIMIT_BACKEND"] = "local"
+
+import httpx
+from fastapi import FastAPI
+
+from app.database import Base, get_engine
+from app import models  # noqa: F401
+from app.api_keys import models as api_key_models  # noqa: F401
+from app.webhooks import models as webhook_models  # noqa: F401
+from app.auth.dependencies import get_principal
+from app.auth.principal import Principal
+from app.modules.antifraud.router import router, ANTIFRAUD_BATCH_MAX_ITEMS
+from app.ratelimit.limiter import (
+    DEFAULT_TIER, DEFAULT_TIER_LIMITS, RATE_LIMIT_LEASE_TOKENS, LocalBackend, RateLimiter, SQLiteBackend,
+)
+
+PRINCIPAL = Principal(
+    id="bench", email="bench@example.com", organization_id="bench-org", role="org_admin", api_key_id="bench-key"
+)
+
+
+def _payload(i):
+    return {
+        "transaction_id": f"tx_{i}", "amount": 100.0 + i, "currency": "USD",
+        "merchant": "merchant", "location": "Tashkent", "card_id": f"card_{i % 50}",
+    }
+
+
+async def check_http_batch_above_burst():
+    Base.metadata.create_all(bind=get_engine())
+    app = FastAPI()
+    app.include_router(router, prefix="/api/antifraud")
+    app.dependency_overrides[get_principal] = lambda: PRINCIPAL
+    key_limit = DEFAULT_TIER_LIMITS[DEFAULT_TIER]["api_key"]
+    count = key_limit[1] * 10
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        body = "\n".join(json.dumps(_payload(i)) for i in range(count)).encode()
+        response = await client.post(
+            "/api/antifraud/transactions/submit/batch", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200, f"batch of {count} refused: {response.status_code} {response.text}"
+        assert len(response.json()) == count
+        assert response.headers["RateLimit-Remaining"] == "0"
+
+        response = await client.post("/api/antifraud/transactions/submit", json=_payload(count))
+        assert response.status_code == 429, f"debt not enforced: {response.status_code}"
+        # The key bucket owes count - burst tokens and needs one more
+        expected = (count - key_limit[1] + 1) / key_limit[0]
+        retry_after = int(response.headers["Retry-After"])
+        assert expected <= retry_after <= expected + 1, f"Retry-After {retry_after}, expected about {expected}"
+    return count
+
+
+def check_backend_debt():
+    count = ANTIFRAUD_BATCH_MAX_ITEMS
+    key_limit = DEFAULT_TIER_LIMITS[DEFAULT_TIER]["api_key"]
+    path = os.path.join(_tmp, "debt.db")
+    backends = {
+        "local": (LocalBackend(),) * 2,
+        # Two workers sharing one bucket file
+        "sqlite": (SQLiteBackend(path, RATE_LIMIT_LEASE_TOKENS), SQLiteBackend(path, RATE_LIMIT_LEASE_TOKENS)),
+    }
+    for name, (first, second) in backends.items():
+        decision = RateLimiter(first, DEFAULT_TIER_LIMITS, 60).take(DEFAULT_TIER, "org", "key", count)
+        assert decision.allowed, f"{name}: batch of {count} refused"
+        decision = RateLimiter(second, DEFAULT_TIER_LIMITS, 60).take(DEFAULT_TIER, "org", "key", 1)
+        assert not decision.allowed, f"{name}: debt not enforced"
+        expected = (count - key_limit[1] + 1) / key_limit[0]
+        assert abs(decision.retry_after - expected) < 1, f"{name}: retry_after {decision.retry_after}, expected {expected}"
+    return count
+
+
+def bench_backend(backend, count):
+    # Generous limits so every check is allowed: the cost of the common case
+    limiter = RateLimiter(backend, {DEFAULT_TIER: {"organization": [1e9, 10**9], "api_key": [1e9, 10**9]}}, 60)
+    start = time.perf_counter()
+    for _ in range(count):
+        limiter.take(DEFAULT_TIER, "org", "key")
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"http:   batch of {asyncio.run(check_http_batch_above_burst())} above the burst served, debt enforced")
+    print(f"debt:   batch of {check_backend_debt()} served on both backends, debt enforced across workers")
+    print(f"check  N={count}")
+    print(f"  local:  {bench_backend(LocalBackend(), count) * 1e6:8.2f} us/check")
+    sqlite = SQLiteBackend(os.path.join(_tmp, "bench.db.limits"), RATE_LIMIT_LEASE_TOKENS)
+    print(f"  sqlite: {bench_backend(sqlite, count) * 1e6:8.2f} us/check  (lease of {RATE_LIMIT_LEASE_TOKENS})")
+
+
+if __name__ == "__main__":
+    main()